@@ -0,0 +1,285 @@
+"""
+=====================================================
+ALMACÉN INCREMENTAL DE AGREGADOS DIARIOS
+=====================================================
+Guarda en disco la tabla diaria que alimenta los tests
+estadísticos (ingresos, tickets distintos, nº de
+incidencias y minutos de incidencia por día) junto con
+una huella por día de las filas de origen:
+
+- Si el CSV de ventas no ha cambiado (tamaño + mtime)
+  no se vuelve a leer: se usan los agregados guardados
+- Si ha cambiado, solo se re-agregan (incluido el
+  nunique de TicketID) los días nuevos o cuya huella
+  difiere; el resto se reutiliza tal cual
+- Junto a la tabla diaria se guardan los ingresos por
+  (día, ruta, producto) para los tests por grupo
+- Los días que desaparecen del origen se eliminan
+- Modo por bloques (out-of-core): el CSV se lee en
+  bloques y cada uno se pliega en agregados parciales
+  por día (suma de ingresos, TicketID distintos
+  ordenados por día, huella); en memoria solo queda la
+  tabla diaria, nunca el fichero entero
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:  # Sin pyarrow se agrega todo en cada ejecución
+    pyarrow = None
+
+BASE_DIR = Path(__file__).parent
+AGREGADOS_DIR = BASE_DIR.parent / "data" / "staging" / "agregados_diarios"
+VERSION_AGREGADOS = 2  # Subir si cambia la forma de agregar: invalida el almacén
+
+# columnas de origen que determinan cada agregado (la huella del día solo depende de ellas)
+COLUMNAS_VENTAS = ["Fecha", "TicketID", "Suma de IngresosFila", "rutaid", "producto"]
+COLUMNAS_DETALLE = ["Fecha", "rutaid", "producto", "Ingresos"]
+COLUMNAS_INCIDENCIAS = ["Fecha", "IncidenciaID", "Suma de DuracionMin"]
+PARTES = ("ventas", "detalle", "incidencias")
+COMPACTAR_DETALLE = 16  # bloques de detalle parcial acumulados antes de volver a sumarlos
+
+
+# ingresos y tickets distintos por día
+def agregar_ventas(ventas: pd.DataFrame) -> pd.DataFrame:
+    return (
+        ventas.groupby("Fecha")
+        .agg({"Suma de IngresosFila": "sum", "TicketID": pd.Series.nunique})
+        .rename(columns={"Suma de IngresosFila": "Ingresos", "TicketID": "Tickets"})
+        .reset_index()
+    )
+
+
+# ingresos por (día, ruta, producto); vacío si el CSV no trae ruta y producto
+def agregar_detalle(ventas: pd.DataFrame) -> pd.DataFrame:
+    if not {"rutaid", "producto"}.issubset(ventas.columns):
+        return pd.DataFrame({c: pd.Series(dtype="float64" if c == "Ingresos" else "object") for c in COLUMNAS_DETALLE})
+    return (
+        ventas.groupby(["Fecha", "rutaid", "producto"], observed=True)["Suma de IngresosFila"]
+        .sum()
+        .rename("Ingresos")
+        .reset_index()
+        .astype({"producto": str})  # texto: las categorías de cada lote no coinciden al concatenar
+    )
+
+
+# número de incidencias y minutos de incidencia por día
+def agregar_incidencias(incidencias: pd.DataFrame) -> pd.DataFrame:
+    return (
+        incidencias.groupby("Fecha")
+        .agg({"IncidenciaID": "count", "Suma de DuracionMin": "sum"})
+        .rename(columns={"IncidenciaID": "NumIncidencias"})
+        .reset_index()
+    )
+
+
+# une las dos partes en la tabla diaria (un día sin incidencias cuenta 0)
+def combinar_diario(ventas_diarias: pd.DataFrame, incidencias_diarias: pd.DataFrame) -> pd.DataFrame:
+    df_diario = ventas_diarias.merge(incidencias_diarias, on="Fecha", how="left")
+    df_diario["NumIncidencias"] = df_diario["NumIncidencias"].fillna(0)
+    df_diario["Suma de DuracionMin"] = df_diario["Suma de DuracionMin"].fillna(0)
+    df_diario["TieneIncidencia"] = (df_diario["NumIncidencias"] > 0).astype(int)
+    return df_diario
+
+
+# huella por día: suma (módulo 2^64) del hash de cada fila, no depende del orden de las filas
+def huellas_por_dia(df: pd.DataFrame, columnas: list[str]) -> pd.Series:
+    hashes = pd.util.hash_pandas_object(df[[c for c in columnas if c in df.columns]], index=False)
+    return hashes.groupby(df["Fecha"].to_numpy()).sum().rename_axis("Fecha").rename("huella")
+
+
+# suma de huellas de dos conjuntos de filas (módulo 2^64, como huellas_por_dia): la huella de un día
+# leído por bloques es la misma que la del día leído de una vez
+def sumar_huellas(a: pd.Series, b: pd.Series) -> pd.Series:
+    indice = a.index.union(b.index)
+    suma = a.reindex(indice, fill_value=0).to_numpy("uint64") + b.reindex(indice, fill_value=0).to_numpy("uint64")
+    return pd.Series(suma, index=indice.rename("Fecha"), name="huella")
+
+
+# suma los ingresos de varios detalles parciales por (día, ruta, producto)
+def _sumar_detalle(partes: list[pd.DataFrame]) -> pd.DataFrame:
+    detalle = pd.concat(partes, ignore_index=True)
+    if detalle.empty:
+        return detalle
+    return detalle.groupby(["Fecha", "rutaid", "producto"])["Ingresos"].sum().reset_index()
+
+
+# pliega bloques de ventas en los agregados por día sin tener todas las filas en memoria:
+# ingresos (suma), tickets distintos exactos (array ordenado de TicketID por día, unido por mezcla
+# con los de cada bloque), ingresos por (día, ruta, producto) y huella del día.
+# Devuelve las mismas partes que agregar_ventas / agregar_detalle / huellas_por_dia sobre todo el CSV
+def agregar_ventas_por_bloques(
+    bloques: Iterable[pd.DataFrame],
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.Series]:
+    ingresos = pd.Series(dtype="float64")
+    huellas = pd.Series(dtype="uint64")
+    tickets: dict[np.datetime64, np.ndarray] = {}
+    detalles: list[pd.DataFrame] = []
+
+    for bloque in bloques:
+        if bloque.empty:
+            continue
+        ingresos = ingresos.add(bloque.groupby("Fecha")["Suma de IngresosFila"].sum(), fill_value=0)
+        huellas = sumar_huellas(huellas, huellas_por_dia(bloque, COLUMNAS_VENTAS))
+
+        # pares (día, ticket) distintos del bloque, ordenados: un corte por cada cambio de día
+        pares = bloque[["Fecha", "TicketID"]].dropna().drop_duplicates().sort_values(["Fecha", "TicketID"])
+        fechas, ids = pares["Fecha"].to_numpy(), pares["TicketID"].to_numpy()
+        cortes = np.flatnonzero(fechas[1:] != fechas[:-1]) + 1
+        for fecha, ids_dia in zip(fechas[np.r_[0, cortes]] if len(fechas) else [], np.split(ids, cortes)):
+            previos = tickets.get(fecha)
+            tickets[fecha] = ids_dia if previos is None else np.union1d(previos, ids_dia)
+
+        detalles.append(agregar_detalle(bloque))
+        if len(detalles) >= COMPACTAR_DETALLE:
+            detalles = [_sumar_detalle(detalles)]
+
+    ingresos = ingresos.sort_index()
+    ventas = pd.DataFrame({
+        "Fecha": ingresos.index.to_numpy(),
+        "Ingresos": ingresos.to_numpy(),
+        "Tickets": np.array([len(tickets.get(f, ())) for f in ingresos.index.to_numpy()], dtype="int64"),
+    })
+    detalle = _sumar_detalle(detalles) if detalles else agregar_detalle(pd.DataFrame())
+    return ventas, detalle, huellas.sort_index()
+
+
+# sustituye una parte por su agregado completo (leído por bloques). Devuelve la parte y el nº de días
+# que han cambiado respecto al almacén (nuevos, con huella distinta o eliminados)
+def reemplazar_parte(
+    previo: Optional[pd.DataFrame], agregado: pd.DataFrame, huellas: pd.Series
+) -> tuple[pd.DataFrame, int]:
+    parte = agregado.assign(huella=huellas.reindex(agregado["Fecha"]).to_numpy())
+    if previo is None:
+        return parte, len(huellas)
+    anteriores = previo.drop_duplicates("Fecha").set_index("Fecha")["huella"]
+    comunes = huellas.index.intersection(anteriores.index)
+    iguales = int((anteriores.loc[comunes].to_numpy() == huellas.loc[comunes].to_numpy()).sum())
+    return parte, len(huellas) - iguales + len(anteriores.index.difference(huellas.index))
+
+
+# firma barata del fichero (cambia al reescribirlo)
+def firma_fichero(ruta: Path) -> str:
+    info = Path(ruta).stat()
+    return f"{info.st_size}:{info.st_mtime_ns}"
+
+
+# re-agrega solo los días nuevos o con huella distinta y conserva el resto (una o varias filas por día).
+# Devuelve la parte actualizada y el nº de días tocados (re-agregados + eliminados)
+def actualizar_parte(
+    previo: Optional[pd.DataFrame],
+    datos: pd.DataFrame,
+    huellas: pd.Series,
+    agregar: Callable[[pd.DataFrame], pd.DataFrame],
+) -> tuple[pd.DataFrame, int]:
+    if previo is None:
+        cambiados, eliminados = huellas.index, 0
+    else:
+        anteriores = previo.drop_duplicates("Fecha").set_index("Fecha")["huella"]
+        comunes = huellas.index.intersection(anteriores.index)
+        iguales = comunes[anteriores.loc[comunes].to_numpy() == huellas.loc[comunes].to_numpy()]
+        cambiados = huellas.index.difference(iguales)
+        eliminados = len(anteriores.index.difference(huellas.index))
+
+    conservados = pd.DataFrame() if previo is None else previo[
+        previo["Fecha"].isin(huellas.index) & ~previo["Fecha"].isin(cambiados)
+    ]
+    nuevos = agregar(datos[datos["Fecha"].isin(cambiados)])
+    nuevos["huella"] = huellas.reindex(nuevos["Fecha"]).to_numpy()
+
+    partes = [p for p in (conservados, nuevos) if len(p) > 0]
+    if not partes:
+        return nuevos, eliminados
+    parte = pd.concat(partes, ignore_index=True).sort_values("Fecha", ignore_index=True)
+    return parte, len(cambiados) + eliminados
+
+
+# lee el almacén; None si no existe, está incompleto o es de otra versión
+def leer_almacen(directorio: Path = AGREGADOS_DIR) -> Optional[tuple[dict, dict[str, pd.DataFrame]]]:
+    meta_path = directorio / "meta.json"
+    if pyarrow is None or not meta_path.exists():
+        return None
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("version") != VERSION_AGREGADOS:
+            return None
+        partes = {nombre: pd.read_parquet(directorio / f"{nombre}.parquet") for nombre in PARTES}
+    except (OSError, ValueError):
+        return None
+    return meta, partes
+
+
+# guarda las dos partes y después el meta.json (si se corta a medias, el meta viejo no cuadra)
+def guardar_almacen(meta: dict, partes: dict[str, pd.DataFrame], directorio: Path = AGREGADOS_DIR) -> None:
+    if pyarrow is None:
+        return
+    directorio.mkdir(parents=True, exist_ok=True)
+    (directorio / "meta.json").unlink(missing_ok=True)
+    for nombre, df in partes.items():
+        temporal = directorio / f"{nombre}.parquet.tmp"
+        df.to_parquet(temporal, index=False)
+        temporal.replace(directorio / f"{nombre}.parquet")
+    (directorio / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+
+# tabla diaria desde el almacén, agregando solo lo que ha cambiado en el origen.
+# `cargar_ventas` solo se llama si el CSV de ventas ha cambiado desde la última ejecución; con
+# `leer_bloques` (iterador de bloques del CSV) las ventas se agregan por bloques sin cargarlas enteras.
+# Devuelve la tabla diaria, los ingresos por (día, ruta, producto) y un resumen de lo re-agregado
+def tabla_diaria_incremental(
+    ruta_ventas: Path,
+    cargar_ventas: Callable[[], pd.DataFrame],
+    incidencias: pd.DataFrame,
+    directorio: Path = AGREGADOS_DIR,
+    recalcular: bool = False,
+    leer_bloques: Optional[Callable[[], Iterable[pd.DataFrame]]] = None,
+) -> tuple[pd.DataFrame, pd.DataFrame, dict]:
+    almacen = None if recalcular else leer_almacen(directorio)
+    meta, previas = almacen or ({}, {})
+    firma_ventas = firma_fichero(ruta_ventas)
+    ventas_leidas = almacen is None or meta.get("firma_ventas") != firma_ventas
+
+    partes = dict(previas)
+    dias_ventas = 0
+    if ventas_leidas and leer_bloques is not None:
+        ventas_diarias, detalle, huellas = agregar_ventas_por_bloques(leer_bloques())
+        partes["ventas"], dias_ventas = reemplazar_parte(previas.get("ventas"), ventas_diarias, huellas)
+        partes["detalle"], _ = reemplazar_parte(previas.get("detalle"), detalle, huellas)
+    elif ventas_leidas:
+        ventas = cargar_ventas()
+        huellas = huellas_por_dia(ventas, COLUMNAS_VENTAS)
+        partes["ventas"], dias_ventas = actualizar_parte(previas.get("ventas"), ventas, huellas, agregar_ventas)
+        partes["detalle"], _ = actualizar_parte(previas.get("detalle"), ventas, huellas, agregar_detalle)
+
+    # las incidencias ya están en memoria (las necesitan los tests por tipo/severidad)
+    partes["incidencias"], dias_incidencias = actualizar_parte(
+        previas.get("incidencias"), incidencias, huellas_por_dia(incidencias, COLUMNAS_INCIDENCIAS),
+        agregar_incidencias,
+    )
+
+    if ventas_leidas or dias_incidencias:
+        guardar_almacen({"version": VERSION_AGREGADOS, "firma_ventas": firma_ventas}, partes, directorio)
+
+    df_diario = combinar_diario(
+        partes["ventas"].drop(columns="huella"), partes["incidencias"].drop(columns="huella")
+    )
+    info = {
+        "dias": len(df_diario),
+        "dias_ventas_reagregados": dias_ventas,
+        "dias_incidencias_reagregados": dias_incidencias,
+        "ventas_leidas": ventas_leidas,
+        "por_bloques": ventas_leidas and leer_bloques is not None,
+    }
+    return df_diario, partes["detalle"].drop(columns="huella"), info
@@ -3,19 +3,31 @@
 ANÁLISIS IMPACTO INCIDENCIAS → INGRESOS
 =====================================================
 Script reproducible (sin notebook) que:
-- Carga CSV procesados
-- Calcula métricas y tests estadísticos
-- Genera figuras
+- Carga CSV procesados (con almacén incremental de agregados diarios; con
+  --filas-bloque, las ventas se leen por bloques sin cargar el CSV entero)
+- Calcula métricas y tests estadísticos (con IC bootstrap y p-values por permutación,
+  y tests por tipo, severidad, ruta y producto con corrección FDR)
+- Genera figuras (en paralelo; solo las que han cambiado)
 - Escribe insights.md
 
 Uso:
-    python correlacion_impacto.py
+    python correlacion_impacto.py [--recalcular-agregados] [--filas-bloque N] [--remuestreos N]
+                                  [--semilla S] [--workers-figuras N] [--forzar-figuras]
 """
 
 from __future__ import annotations
 
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator
 
 import numpy as np
 import pandas as pd
@@ -29,6 +41,15 @@ import scipy.stats as stats
 warnings.filterwarnings("ignore")
 
 BASE_DIR = Path(__file__).parent
+sys.path.insert(0, str(BASE_DIR.parent / "scripts"))
+
+from esquema_tipos import COLUMNAS_TEXTO_CLAVE, codificar_fecha_ruta, leer_csv, leer_csv_bloques, resumen_memoria
+from remuestreo import N_REMUESTREOS, SEMILLA, analizar_remuestreo
+from tests_agrupados import ALFA_FDR, construir_unidades, tests_agrupados
+from agregados_diarios import (
+    AGREGADOS_DIR, COLUMNAS_VENTAS, agregar_incidencias, agregar_ventas, agregar_ventas_por_bloques, combinar_diario,
+    tabla_diaria_incremental,
+)
 DATA_DIR = BASE_DIR.parent / "data" / "processed"
 IMAGES_DIR = BASE_DIR.parent / "images"
 INSIGHTS_PATH = BASE_DIR / "insights.md"
@@ -36,6 +57,26 @@ INSIGHTS_PATH = BASE_DIR / "insights.md"
 VENTAS_PATH = DATA_DIR / "ventas400_proc2.csv"
 INCIDENCIAS_PATH = DATA_DIR / "incidencias_proc2.csv"
 
+# nombres de las columnas de ventas en el CSV procesado (minúsculas desde PostgreSQL) → nombres del análisis
+RENOMBRAR_VENTAS = {
+    "fecha": "Fecha",
+    "ticketid": "TicketID",
+    "ingresos_total": "Suma de IngresosFila",
+}
+FILAS_BLOQUE = 1_000_000  # filas por bloque en el modo por bloques (out-of-core)
+
+# fichero de cada figura (mismo nombre que en figure_tasks)
+FIGURA_ARCHIVOS = {
+    "matriz_correlaciones": "matriz_correlaciones.jpg",
+    "correlacion_incidencias_ingresos": "correlacion_incidencias_ingresos.jpg",
+    "barplot_con_vs_sin": "BARPLOT_distribucion_ingresos_con_vs_sin_incidencias.jpg",
+    "boxplot_con_vs_sin": "distribucion_ingresos_con_vs_sin_incidencias.jpg",
+    "ingreso_medio_por_tipo": "ingreso_medio_por_tipo_incidencia.jpg",
+    "ingreso_medio_por_severidad": "ingreso_medio_por_severidad_incidencia.jpg",
+}
+N_TOP_GRUPOS = 10  # filas de la tabla de tests por grupo en insights.md
+FIGURAS_MANIFEST = ".figuras_manifest.json"  # huellas de las figuras ya renderizadas (en IMAGES_DIR)
+
 sns.set_style("whitegrid")
 plt.rcParams["figure.figsize"] = (12, 6)
 
@@ -59,55 +100,82 @@ def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-# cambia el nombre de algunas columnas si vienen en minusculas y cambia el formato de fecha a datatime
-def load_data() -> tuple[pd.DataFrame, pd.DataFrame]:
-    ventas = normalize_columns(pd.read_csv(VENTAS_PATH))
-    incidencias = normalize_columns(pd.read_csv(INCIDENCIAS_PATH))
-
+# cambia el nombre de algunas columnas si vienen en minusculas y cambia el formato de fecha a datatime.
+# Los tipos compactos (categorias, int32/int16, fechas) se aplican al parsear con el esquema compartido
+def _leer_procesado(ruta: Path, esquema: str, renombrar: dict) -> pd.DataFrame:
+    df = normalize_columns(leer_csv(ruta, esquema, excluir=COLUMNAS_TEXTO_CLAVE))
     # Normalizar columnas (soporta CSV con nombres en minúsculas desde PostgreSQL)
-    ventas_rename = {
-        "fecha": "Fecha",
-        "ticketid": "TicketID",
-        "ingresos_total": "Suma de IngresosFila",
-    }
-    incidencias_rename = {
+    df = df.rename(columns={k: v for k, v in renombrar.items() if k in df.columns})
+    df["Fecha"] = pd.to_datetime(df["Fecha"])
+
+    # Clave entera (fecha, ruta) en lugar del texto "YYYY-MM-DD_RUTA"
+    if "rutaid" in df.columns:
+        df["ClaveFechaRuta"] = codificar_fecha_ruta(df["Fecha"], df["rutaid"])
+    return df
+
+
+def load_ventas() -> pd.DataFrame:
+    ventas = _leer_procesado(VENTAS_PATH, "ventas_procesadas", RENOMBRAR_VENTAS)
+    print(resumen_memoria("ventas", ventas))
+    return ventas
+
+# lee las ventas en bloques de `filas_bloque` filas, solo con las columnas que usan los agregados diarios
+# y con los tipos del esquema al parsear: nunca está el CSV entero en memoria
+def load_ventas_bloques(filas_bloque: int = FILAS_BLOQUE) -> Iterator[pd.DataFrame]:
+    columnas = set(COLUMNAS_VENTAS) | set(RENOMBRAR_VENTAS)
+    for bloque in leer_csv_bloques(VENTAS_PATH, "ventas_procesadas", filas_bloque, columnas=columnas):
+        bloque = normalize_columns(bloque)
+        bloque = bloque.rename(columns={k: v for k, v in RENOMBRAR_VENTAS.items() if k in bloque.columns})
+        bloque["Fecha"] = pd.to_datetime(bloque["Fecha"])
+        yield bloque
+
+
+def load_incidencias() -> pd.DataFrame:
+    incidencias = _leer_procesado(INCIDENCIAS_PATH, "incidencias_procesadas", {
         "fecha": "Fecha",
         "incidenciaid": "IncidenciaID",
         "duracionmin": "Suma de DuracionMin",
         "tipoincidencia": "TipoIncidencia",
         "severidad": "Severidad",
-    }
+    })
+    print(resumen_memoria("incidencias", incidencias))
+    return incidencias
 
-    ventas = ventas.rename(columns={k: v for k, v in ventas_rename.items() if k in ventas.columns})
-    incidencias = incidencias.rename(columns={k: v for k, v in incidencias_rename.items() if k in incidencias.columns})
 
-    ventas["Fecha"] = pd.to_datetime(ventas["Fecha"])
-    incidencias["Fecha"] = pd.to_datetime(incidencias["Fecha"])
+def load_data() -> tuple[pd.DataFrame, pd.DataFrame]:
+    return load_ventas(), load_incidencias()
 
-    return ventas, incidencias
+# tabla diaria leyendo las ventas por bloques (modo out-of-core de load_data + build_daily_table):
+# cada bloque se pliega en los agregados por día y solo la tabla diaria queda en memoria
+def build_daily_table_bloques(incidencias: pd.DataFrame, filas_bloque: int = FILAS_BLOQUE) -> pd.DataFrame:
+    ventas_diarias, _, _ = agregar_ventas_por_bloques(load_ventas_bloques(filas_bloque))
+    return combinar_diario(ventas_diarias, agregar_incidencias(incidencias))
 
 # creacion de la tabla df_diario que recopila el total de ingresos por dia y mergea la nueva data reciente con la anterior.
 def build_daily_table(ventas: pd.DataFrame, incidencias: pd.DataFrame) -> pd.DataFrame:
-    ventas_diarias = (
-        ventas.groupby("Fecha")
-        .agg({"Suma de IngresosFila": "sum", "TicketID": pd.Series.nunique})
-        .rename(columns={"Suma de IngresosFila": "Ingresos", "TicketID": "Tickets"})
-        .reset_index()
+    return combinar_diario(agregar_ventas(ventas), agregar_incidencias(incidencias))
+
+# tabla diaria desde el almacén de agregados: solo se leen y agregan las ventas si el CSV ha cambiado,
+# y solo los días nuevos o modificados. Las incidencias (pocas filas) se leen siempre para los tests por tipo.
+# Devuelve también los ingresos por (día, ruta, producto) para los tests por grupo.
+# Con `filas_bloque`, las ventas se leen y agregan por bloques de ese tamaño (CSV mayores que la RAM)
+def load_daily_table(
+    recalcular: bool = False, filas_bloque: int | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    incidencias = load_incidencias()
+    leer_bloques = (lambda: load_ventas_bloques(filas_bloque)) if filas_bloque else None
+    df_diario, ventas_detalle, info = tabla_diaria_incremental(
+        VENTAS_PATH, load_ventas, incidencias, directorio=AGREGADOS_DIR, recalcular=recalcular,
+        leer_bloques=leer_bloques,
     )
-
-    incidencias_diarias = (
-        incidencias.groupby("Fecha")
-        .agg({"IncidenciaID": "count", "Suma de DuracionMin": "sum"})
-        .rename(columns={"IncidenciaID": "NumIncidencias"})
-        .reset_index()
+    origen = "CSV de ventas sin cambios"
+    if info["ventas_leidas"]:
+        origen = f"CSV de ventas leído por bloques de {filas_bloque} filas" if info["por_bloques"] else "CSV de ventas leído"
+    print(
+        f"📦 Agregados diarios: {info['dias']} días ({origen}; re-agregados "
+        f"{info['dias_ventas_reagregados']} días de ventas y {info['dias_incidencias_reagregados']} de incidencias)"
     )
-
-    df_diario = ventas_diarias.merge(incidencias_diarias, on="Fecha", how="left")
-    df_diario["NumIncidencias"] = df_diario["NumIncidencias"].fillna(0)
-    df_diario["Suma de DuracionMin"] = df_diario["Suma de DuracionMin"].fillna(0)
-    df_diario["TieneIncidencia"] = (df_diario["NumIncidencias"] > 0).astype(int)
-
-    return df_diario
+    return df_diario, incidencias, ventas_detalle
 
 # Tabla de correlaciones entre variables cuantitativas. Se guarda como imagen en carpeta images.
 def plot_correlation_heatmap(df_diario: pd.DataFrame) -> None:
@@ -116,7 +184,7 @@ def plot_correlation_heatmap(df_diario: pd.DataFrame) -> None:
     sns.heatmap(corr, annot=True, cmap="coolwarm", center=0, fmt=".3f", square=True, linewidths=1)
     plt.title("Matriz de Correlaciones", fontsize=16, fontweight="bold")
     plt.tight_layout()
-    plt.savefig(IMAGES_DIR / "matriz_correlaciones.jpg", dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
+    plt.savefig(IMAGES_DIR / FIGURA_ARCHIVOS["matriz_correlaciones"], dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
     plt.close()
 
 # Gráfico de dispersión entre número de incidencias e ingresos, con línea de regresión. 
@@ -137,7 +205,7 @@ def plot_scatter_incidencias(df_diario: pd.DataFrame) -> None:
     plt.legend()
     plt.grid(alpha=0.3)
     plt.tight_layout()
-    plt.savefig(IMAGES_DIR / "correlacion_incidencias_ingresos.jpg", dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
+    plt.savefig(IMAGES_DIR / FIGURA_ARCHIVOS["correlacion_incidencias_ingresos"], dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
     plt.close()
 
 # Gráfico de barras comparando ingresos medios en días con incidencias vs sin incidencias.
@@ -153,7 +221,7 @@ def plot_bar_contra_sin(ingresos_con: pd.Series, ingresos_sin: pd.Series) -> Non
     ax.set_title("Ingresos Medios: Días CON vs SIN Incidencias")
     ax.set_ylabel("Ingresos Medios (€)")
     ax.set_xlabel("")
-    plt.savefig(IMAGES_DIR / "BARPLOT_distribucion_ingresos_con_vs_sin_incidencias.jpg", dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
+    plt.savefig(IMAGES_DIR / FIGURA_ARCHIVOS["barplot_con_vs_sin"], dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
     plt.close()
 
 # Gráfico de boxplot comparando la distribución de ingresos en días con incidencias vs sin incidencias.
@@ -168,7 +236,7 @@ def plot_box_contra_sin(df_diario: pd.DataFrame) -> None:
     ax.set_xlabel("")
     plt.grid(alpha=0.2, axis="y")
     plt.tight_layout()
-    plt.savefig(IMAGES_DIR / "distribucion_ingresos_con_vs_sin_incidencias.jpg", dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
+    plt.savefig(IMAGES_DIR / FIGURA_ARCHIVOS["boxplot_con_vs_sin"], dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
     plt.close()
 
 # Gráfico de barras comparando ingresos medios por tipo de incidencia.
@@ -204,7 +272,7 @@ def plot_tipo_incidencia(impacto_tipo: pd.DataFrame) -> None:
     ax.set_ylim(0, 1300)
     plt.xticks(rotation=45, ha="right")
     plt.tight_layout()
-    plt.savefig(IMAGES_DIR / "ingreso_medio_por_tipo_incidencia.jpg", dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
+    plt.savefig(IMAGES_DIR / FIGURA_ARCHIVOS["ingreso_medio_por_tipo"], dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
     plt.close()
 
 # Gráfico de barras comparando ingresos medios por severidad de la incidencia.
@@ -228,9 +296,27 @@ def plot_severidad(impacto_severidad: pd.DataFrame) -> None:
     ax.set_ylim(0, 1300)
     plt.xticks(rotation=45, ha="right")
     plt.tight_layout()
-    plt.savefig(IMAGES_DIR / "ingreso_medio_por_severidad_incidencia.jpg", dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
+    plt.savefig(IMAGES_DIR / FIGURA_ARCHIVOS["ingreso_medio_por_severidad"], dpi=300, bbox_inches="tight", facecolor=plt.gcf().get_facecolor())
     plt.close()
 
+# resultado del ANOVA / Kruskal-Wallis de una dimensión para las secciones por tipo y severidad
+def _lineas_omnibus(tests_omnibus: pd.DataFrame | None, dimension: str) -> list[str]:
+    if tests_omnibus is None or dimension not in set(tests_omnibus["dimension"]):
+        return []
+    fila = tests_omnibus[tests_omnibus["dimension"] == dimension].iloc[0]
+    if np.isnan(fila["p_anova"]):
+        return ["\nNo hay suficientes niveles con datos para el ANOVA."]
+    conclusion = "hay diferencias entre niveles" if fila["p_anova"] < 0.05 else "no hay diferencias significativas entre niveles"
+    return [
+        "",
+        "| Test | Estadístico | p‑value |",
+        "|---|---:|---:|",
+        f"| ANOVA | F = {fila['f_anova']:.4f} | {fila['p_anova']:.4e} |",
+        f"| Kruskal–Wallis (no param.) | H = {fila['h_kruskal']:.4f} | {fila['p_kruskal']:.4e} |",
+        "",
+        f"**Conclusión:** {conclusion} (p {'<' if fila['p_anova'] < 0.05 else '≥'} 0.05).",
+    ]
+
 # Construcción del markdown con insights, resultados y recomendaciones. Se guarda como insights.md en la carpeta analysis.
 def build_insights_markdown(
     df_diario: pd.DataFrame,
@@ -246,6 +332,9 @@ def build_insights_markdown(
     u_pvalue: float,
     impacto_tipo: pd.DataFrame,
     impacto_severidad: pd.DataFrame,
+    remuestreo: dict | None = None,
+    tests_omnibus: pd.DataFrame | None = None,
+    tests_grupos: pd.DataFrame | None = None,
 ) -> str:
     diferencia = ingresos_con.mean() - ingresos_sin.mean()
     porcentaje = safe_pct(diferencia, ingresos_sin.mean())
@@ -343,6 +432,29 @@ def build_insights_markdown(
     lines.append("")
     lines.append(f"**Conclusión:** {conclusion_ttest}")
 
+    if remuestreo is not None:
+        nivel_pct = f"{remuestreo['nivel'] * 100:.0f}%"
+        lines.append("\n### Remuestreo: Bootstrap y Permutación")
+        lines.append(
+            f"Sin suponer normalidad: intervalos bootstrap percentil y p-values por permutación de etiquetas "
+            f"({remuestreo['n_remuestreos']:,} remuestreos, semilla {remuestreo['semilla']})."
+        )
+        lines.append("")
+        lines.append(f"| Estimación | Valor | IC {nivel_pct} (bootstrap) | p‑value (permutación) |")
+        lines.append("|---|---:|---:|---:|")
+        if remuestreo["diferencia"] is not None:
+            dif = remuestreo["diferencia"]
+            lines.append(
+                f"| Diferencia media CON − SIN | {format_eur(dif['estimacion'])} | "
+                f"[{format_eur(dif['ic'][0])}, {format_eur(dif['ic'][1])}] | {dif['pvalor_permutacion']:.4e} |"
+            )
+        if remuestreo["correlacion"] is not None:
+            cor = remuestreo["correlacion"]
+            lines.append(
+                f"| Point biserial (r) | {cor['estimacion']:.4f} | "
+                f"[{cor['ic'][0]:.4f}, {cor['ic'][1]:.4f}] | {cor['pvalor_permutacion']:.4e} |"
+            )
+
     lines.append("\n---\n")
     lines.append("### Visualización: Box Plot Comparativo")
     lines.append("![Comparación ingresos CON vs SIN incidencias](../images/distribucion_ingresos_con_vs_sin_incidencias.jpg)")
@@ -350,12 +462,44 @@ def build_insights_markdown(
     lines.append("\n## 3. Por TIPO de Incidencia")
     lines.append("### Prueba ANOVA")
     lines.append("Como tenemos la lista de ingresos para cada tipo de incidencia, aplicamos ANOVA para comparar más de dos clases.")
+    lines.extend(_lineas_omnibus(tests_omnibus, "TipoIncidencia"))
     lines.append("\n### Promedio de ingresos para cada tipo de incidencia")
     lines.append("![Promedio de ingresos para cada tipo de incidencia](../images/ingreso_medio_por_tipo_incidencia.jpg)")
 
     lines.append("\n## 4. Por SEVERIDAD")
     lines.append("### Ingresos promedio en función de la severidad de la incidencia")
     lines.append("![Promedio de ingresos por severidad de la incidencia](../images/ingreso_medio_por_severidad_incidencia.jpg)")
+    if tests_omnibus is not None:
+        lines.append("\n### Prueba ANOVA")
+        lines.extend(_lineas_omnibus(tests_omnibus, "Severidad"))
+
+    if tests_omnibus is not None and tests_grupos is not None:
+        lines.append("\n## 5. Tests por grupo: tipo, severidad, ruta y producto")
+        lines.append(
+            "Para cada dimensión, ANOVA y Kruskal-Wallis entre niveles (unidades CON incidencia) y, para cada nivel, "
+            "Welch y Mann–Whitney U de CON vs SIN incidencias. Los p-values se corrigen por comparaciones múltiples "
+            f"(FDR de Benjamini-Hochberg, q < {ALFA_FDR})."
+        )
+        lines.append("")
+        lines.append("| Dimensión | Niveles | Unidades CON | F (ANOVA) | q ANOVA | H (Kruskal) | q Kruskal |")
+        lines.append("|---|---:|---:|---:|---:|---:|---:|")
+        for fila in tests_omnibus.itertuples():
+            lines.append(
+                f"| {fila.dimension} | {fila.niveles} | {fila.n_con} | {fila.f_anova:.3f} | {fila.q_anova:.4e} | "
+                f"{fila.h_kruskal:.3f} | {fila.q_kruskal:.4e} |"
+            )
+        significativos = int((tests_grupos["q_welch"] < ALFA_FDR).sum())
+        lines.append(
+            f"\nNiveles con diferencia CON vs SIN significativa tras FDR (Welch): **{significativos} de "
+            f"{tests_grupos['p_welch'].notna().sum()}**. Los {min(N_TOP_GRUPOS, len(tests_grupos))} primeros:\n"
+        )
+        lines.append("| Dimensión | Nivel | n CON / SIN | Media CON | Media SIN | Diferencia | q Welch | q Mann–Whitney |")
+        lines.append("|---|---|---:|---:|---:|---:|---:|---:|")
+        for fila in tests_grupos.head(N_TOP_GRUPOS).itertuples():
+            lines.append(
+                f"| {fila.dimension} | {fila.nivel} | {fila.n_con} / {fila.n_sin} | {format_eur(fila.media_con)} | "
+                f"{format_eur(fila.media_sin)} | {format_eur(fila.diferencia)} | {fila.q_welch:.4e} | {fila.q_mwu:.4e} |"
+            )
 
     lines.append("\n## RESUMEN Ejecutivo de Hallazgos")
     lines.append(impacto_txt)
@@ -375,6 +519,12 @@ def build_insights_markdown(
     lines.append(f"| Ingresos días CON incidencias | {format_eur(ingresos_con.mean())} |")
     lines.append(f"| Ingresos días SIN incidencias | {format_eur(ingresos_sin.mean())} |")
     lines.append(f"| Diferencia media diaria | **{format_eur(diferencia)} ({porcentaje:+.2f}%)** |")
+    if remuestreo is not None and remuestreo["diferencia"] is not None:
+        ic_bajo, ic_alto = remuestreo["diferencia"]["ic"]
+        lines.append(
+            f"| IC {remuestreo['nivel'] * 100:.0f}% de la diferencia (bootstrap) | "
+            f"[{format_eur(ic_bajo)}, {format_eur(ic_alto)}] |"
+        )
 
     lines.append("\n### 📈 Correlación y significancia")
     lines.append("| Métrica | Valor |")
@@ -401,33 +551,26 @@ def build_insights_markdown(
 
     return "\n".join(lines)
 
-# Función principal que ejecuta todo el análisis, genera gráficos y escribe insights.md
-def main() -> None:
-    ensure_dirs()
-
-    ventas, incidencias = load_data()
-
-    df_diario = build_daily_table(ventas, incidencias)
-
-    plot_correlation_heatmap(df_diario)
-    plot_scatter_incidencias(df_diario)
-
+# Cálculo de métricas y tests estadísticos que alimentan las figuras y insights.md
+def compute_statistics(
+    df_diario: pd.DataFrame,
+    incidencias: pd.DataFrame,
+    ventas_detalle: pd.DataFrame | None = None,
+    n_remuestreos: int = N_REMUESTREOS,
+    semilla: int | None = SEMILLA,
+) -> dict:
     corr_pbis, pvalue_pbis = pointbiserialr(df_diario["NumIncidencias"], df_diario["Ingresos"])
     corr_sper, pvalue_sper = spearmanr(df_diario["NumIncidencias"], df_diario["Ingresos"])
 
     ingresos_con = df_diario[df_diario["TieneIncidencia"] == 1]["Ingresos"]
     ingresos_sin = df_diario[df_diario["TieneIncidencia"] == 0]["Ingresos"]
 
-    plot_bar_contra_sin(ingresos_con, ingresos_sin)
-
     t_stat, t_pvalue = ttest_ind(ingresos_con, ingresos_sin)
     u_stat, u_pvalue = mannwhitneyu(ingresos_con, ingresos_sin, alternative="two-sided")
 
-    plot_box_contra_sin(df_diario)
-
     df_tipo = incidencias.merge(df_diario[["Fecha", "Ingresos"]], on="Fecha", how="left")
 
-    impacto_tipo = df_tipo.groupby("TipoIncidencia").agg(
+    impacto_tipo = df_tipo.groupby("TipoIncidencia", observed=True).agg(
         {
             "Ingresos": ["mean", "std", "count"],
             "Suma de DuracionMin": "mean",
@@ -436,10 +579,7 @@ def main() -> None:
     impacto_tipo.columns = ["Ingreso_Medio", "Desv_Est", "Num_Casos", "Duracion_Media"]
     impacto_tipo = impacto_tipo.sort_values("Ingreso_Medio")
 
-    if len(impacto_tipo) > 0:
-        plot_tipo_incidencia(impacto_tipo)
-
-    impacto_severidad = df_tipo.groupby("Severidad").agg(
+    impacto_severidad = df_tipo.groupby("Severidad", observed=True).agg(
         {
             "Ingresos": ["mean", "std", "count"],
             "Suma de DuracionMin": "mean",
@@ -448,24 +588,182 @@ def main() -> None:
     impacto_severidad.columns = ["Ingreso_Medio", "Desv_Est", "Num_Casos", "Duracion_Media"]
     impacto_severidad = impacto_severidad.sort_values("Ingreso_Medio")
 
-    if len(impacto_severidad) > 0:
-        plot_severidad(impacto_severidad)
-
-    insights_md = build_insights_markdown(
-        df_diario=df_diario,
-        corr_pbis=corr_pbis,
-        pvalue_pbis=pvalue_pbis,
-        corr_sper=corr_sper,
-        pvalue_sper=pvalue_sper,
-        ingresos_con=ingresos_con,
-        ingresos_sin=ingresos_sin,
-        t_stat=t_stat,
-        t_pvalue=t_pvalue,
-        u_stat=u_stat,
-        u_pvalue=u_pvalue,
-        impacto_tipo=impacto_tipo,
-        impacto_severidad=impacto_severidad,
+    # ANOVA/Kruskal y CON vs SIN por nivel de cada dimensión, en una sola pasada
+    tests_omnibus, tests_grupos = tests_agrupados(construir_unidades(df_diario, incidencias, ventas_detalle))
+
+    return {
+        "corr_pbis": corr_pbis,
+        "pvalue_pbis": pvalue_pbis,
+        "corr_sper": corr_sper,
+        "pvalue_sper": pvalue_sper,
+        "ingresos_con": ingresos_con,
+        "ingresos_sin": ingresos_sin,
+        "t_stat": t_stat,
+        "t_pvalue": t_pvalue,
+        "u_stat": u_stat,
+        "u_pvalue": u_pvalue,
+        "impacto_tipo": impacto_tipo,
+        "impacto_severidad": impacto_severidad,
+        "tests_omnibus": tests_omnibus,
+        "tests_grupos": tests_grupos,
+        "remuestreo": (
+            analizar_remuestreo(df_diario, n_remuestreos=n_remuestreos, semilla=semilla) if n_remuestreos > 0 else None
+        ),
+    }
+
+# Figuras a generar: nombre → (función de dibujo, argumentos)
+def figure_tasks(df_diario: pd.DataFrame, estadisticos: dict) -> dict:
+    tareas = {
+        "matriz_correlaciones": (plot_correlation_heatmap, (df_diario,)),
+        "correlacion_incidencias_ingresos": (plot_scatter_incidencias, (df_diario,)),
+        "barplot_con_vs_sin": (plot_bar_contra_sin, (estadisticos["ingresos_con"], estadisticos["ingresos_sin"])),
+        "boxplot_con_vs_sin": (plot_box_contra_sin, (df_diario,)),
+    }
+    if len(estadisticos["impacto_tipo"]) > 0:
+        tareas["ingreso_medio_por_tipo"] = (plot_tipo_incidencia, (estadisticos["impacto_tipo"],))
+    if len(estadisticos["impacto_severidad"]) > 0:
+        tareas["ingreso_medio_por_severidad"] = (plot_severidad, (estadisticos["impacto_severidad"],))
+    return tareas
+
+# =====================================================
+# RENDERIZADO DE FIGURAS (en paralelo y con caché)
+# =====================================================
+
+# huella de una figura: datos de entrada + código de la función de dibujo + versiones de matplotlib/seaborn
+def figure_key(funcion, args: tuple) -> str:
+    huella = hashlib.sha256()
+    huella.update(inspect.getsource(funcion).encode("utf-8"))
+    huella.update(f"{matplotlib.__version__}|{sns.__version__}".encode("utf-8"))
+    for arg in args:
+        if isinstance(arg, pd.DataFrame):
+            huella.update(repr((list(arg.columns), arg.dtypes.astype(str).tolist())).encode("utf-8"))
+            huella.update(pd.util.hash_pandas_object(arg, index=True).to_numpy().tobytes())
+        elif isinstance(arg, pd.Series):
+            huella.update(repr((arg.name, str(arg.dtype))).encode("utf-8"))
+            huella.update(pd.util.hash_pandas_object(arg, index=True).to_numpy().tobytes())
+        else:
+            huella.update(repr(arg).encode("utf-8"))
+    return huella.hexdigest()
+
+
+def _sha256_fichero(ruta: Path) -> str:
+    return hashlib.sha256(ruta.read_bytes()).hexdigest()
+
+
+# se ejecuta en el proceso hijo: IMAGES_DIR se pasa explícitamente porque con spawn (Windows)
+# el módulo se vuelve a importar y perdería cualquier cambio hecho en el proceso principal
+def _render_figure(funcion, args: tuple, images_dir: str) -> float:
+    global IMAGES_DIR
+    IMAGES_DIR = Path(images_dir)
+    inicio = time.perf_counter()
+    funcion(*args)
+    return time.perf_counter() - inicio
+
+
+# dibuja solo las figuras cuya huella ha cambiado (o cuyo fichero falta o se ha modificado),
+# repartidas en un pool de procesos. Devuelve una fila por figura con estado y tiempo
+def render_figures(tareas: dict, workers: int | None = None, forzar: bool = False) -> list[dict]:
+    manifest_path = IMAGES_DIR / FIGURAS_MANIFEST
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        manifest = {}
+
+    resultados = {}
+    pendientes = {}
+    for nombre, (funcion, args) in tareas.items():
+        clave = figure_key(funcion, args)
+        ruta = IMAGES_DIR / FIGURA_ARCHIVOS[nombre]
+        previo = manifest.get(nombre, {})
+        if (not forzar and previo.get("clave") == clave and ruta.exists()
+                and previo.get("sha256") == _sha256_fichero(ruta)):
+            resultados[nombre] = {"figura": nombre, "estado": "cache", "segundos": 0.0}
+        else:
+            pendientes[nombre] = (funcion, args, clave)
+
+    workers = min(workers or os.cpu_count() or 1, len(pendientes))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futuros = {
+                nombre: pool.submit(_render_figure, funcion, args, str(IMAGES_DIR))
+                for nombre, (funcion, args, _) in pendientes.items()
+            }
+            tiempos = {nombre: futuro.result() for nombre, futuro in futuros.items()}
+    else:
+        tiempos = {
+            nombre: _render_figure(funcion, args, str(IMAGES_DIR))
+            for nombre, (funcion, args, _) in pendientes.items()
+        }
+
+    for nombre, (_, _, clave) in pendientes.items():
+        archivo = FIGURA_ARCHIVOS[nombre]
+        manifest[nombre] = {"clave": clave, "archivo": archivo, "sha256": _sha256_fichero(IMAGES_DIR / archivo)}
+        resultados[nombre] = {"figura": nombre, "estado": "render", "segundos": tiempos[nombre]}
+
+    if pendientes:
+        temporal = manifest_path.with_suffix(".tmp")
+        temporal.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+        temporal.replace(manifest_path)
+
+    return [resultados[nombre] for nombre in tareas]
+
+
+# resumen por figura: tiempo y acierto/fallo de caché
+def print_figure_summary(resultados: list[dict], segundos_total: float) -> None:
+    for r in resultados:
+        estado = "🎨 render" if r["estado"] == "render" else "♻️  caché "
+        print(f"   - {r['figura']:<36} {estado}  {r['segundos']:6.2f}s")
+    renderizadas = sum(r["estado"] == "render" for r in resultados)
+    print(
+        f"🖼️ Figuras: {renderizadas} renderizadas, {len(resultados) - renderizadas} desde caché "
+        f"({segundos_total:.2f}s en total)"
+    )
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Análisis del impacto de las incidencias en los ingresos")
+    parser.add_argument(
+        "--recalcular-agregados", action="store_true",
+        help="Ignorar el almacén de agregados diarios y volver a agregar todo el histórico",
     )
+    parser.add_argument(
+        "--filas-bloque", type=int, nargs="?", const=FILAS_BLOQUE, default=None,
+        help=f"Leer las ventas por bloques de N filas sin cargar el CSV entero (por defecto {FILAS_BLOQUE})",
+    )
+    parser.add_argument(
+        "--remuestreos", type=int, default=N_REMUESTREOS,
+        help="Remuestreos bootstrap/permutación (0 = no calcular)",
+    )
+    parser.add_argument(
+        "--semilla", type=int, default=SEMILLA, help="Semilla del remuestreo (resultados reproducibles)",
+    )
+    parser.add_argument(
+        "--workers-figuras", type=int, default=None,
+        help="Procesos para dibujar las figuras (por defecto, uno por CPU; 1 = sin pool)",
+    )
+    parser.add_argument(
+        "--forzar-figuras", action="store_true",
+        help="Volver a dibujar todas las figuras aunque sus datos no hayan cambiado",
+    )
+    return parser.parse_args(argv)
+
+# Función principal que ejecuta todo el análisis, genera gráficos y escribe insights.md
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    ensure_dirs()
+
+    df_diario, incidencias, ventas_detalle = load_daily_table(
+        recalcular=args.recalcular_agregados, filas_bloque=args.filas_bloque
+    )
+
+    estadisticos = compute_statistics(df_diario, incidencias, ventas_detalle, n_remuestreos=args.remuestreos, semilla=args.semilla)
+
+    inicio = time.perf_counter()
+    resultados = render_figures(
+        figure_tasks(df_diario, estadisticos), workers=args.workers_figuras, forzar=args.forzar_figuras
+    )
+    print_figure_summary(resultados, time.perf_counter() - inicio)
+
+    insights_md = build_insights_markdown(df_diario=df_diario, **estadisticos)
 
     INSIGHTS_PATH.write_text(insights_md, encoding="utf-8")
     print(f"✅ insights.md actualizado en: {INSIGHTS_PATH}")
@@ -5,21 +5,37 @@ EXPORTADOR PostgreSQL → CSV
 Script que exporta datos desde PostgreSQL (Railway)
 hacia archivos CSV locales en data/processed/
 
+Cada query se vuelca con COPY (query) TO STDOUT
+directamente al fichero (sin pasar por pandas), así
+que la memoria no depende del tamaño del export.
+Las queries se exportan en paralelo, una conexión por
+query, y opcionalmente se comprimen (gzip o zstd).
+
 Uso:
     python export_postgres_to_csv.py
+    python export_postgres_to_csv.py --compresion gzip
+    python export_postgres_to_csv.py --compresion zstd --workers 4
 
 Autor: ETL System
 Fecha: 2026-02-05
 =====================================================
 """
 
+import argparse
+import gzip
 import psycopg2
-import pandas as pd
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 
+try:
+    import zstandard
+except ImportError:  # Solo necesario con --compresion zstd
+    zstandard = None
+
 # Cargar variables de entorno
 load_dotenv(Path(__file__).parent.parent / '.env')
 
@@ -38,6 +54,15 @@ DB_CONFIG = {
 # Directorio de salida
 OUTPUT_DIR = Path(__file__).parent.parent / 'data' / 'processed'
 
+# Compresión de los ficheros exportados (extensión añadida al nombre)
+COMPRESIONES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+GZIP_NIVEL = 6
+ZSTD_NIVEL = 3
+
+# Bytes que pide psycopg2 al servidor en cada lectura del COPY
+COPY_BUFFER_SIZE = 1 << 20
+EXPORT_WORKERS = 4
+
 # Queries para exportar
 QUERIES = {
     'ventas400_proc2.csv': """
@@ -54,8 +79,62 @@ QUERIES = {
 # FUNCIONES
 # =====================================================
 
-def export_to_csv():
-    """Exporta datos de PostgreSQL a CSV"""
+class ContadorBytes:
+    """Envuelve el fichero de salida y cuenta los bytes CSV (sin comprimir) escritos"""
+    
+    def __init__(self, destino):
+        self.destino = destino
+        self.bytes = 0
+    
+    def write(self, data):
+        self.bytes += len(data)
+        return self.destino.write(data)
+
+def abrir_salida(ruta: Path, compresion: str = None):
+    """Abre el fichero de salida en binario, comprimido si se indica"""
+    if compresion is None:
+        return open(ruta, 'wb')
+    if compresion == 'gzip':
+        return gzip.open(ruta, 'wb', compresslevel=GZIP_NIVEL)
+    if compresion == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("La compresión zstd requiere el paquete 'zstandard' (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=ZSTD_NIVEL).stream_writer(open(ruta, 'wb'))
+    raise ValueError(f"Compresión no soportada: {compresion}")
+
+def export_query(filename: str, query: str, compresion: str = None) -> dict:
+    """Exporta una query a CSV con COPY TO STDOUT en streaming (usa su propia conexión)"""
+    output_path = OUTPUT_DIR / f"{filename}{COMPRESIONES[compresion]}"
+    temporal = output_path.with_name(output_path.name + '.tmp')
+    sql = f"COPY ({query.strip()}) TO STDOUT WITH (FORMAT csv, HEADER, ENCODING 'UTF8')"
+    
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        inicio = time.perf_counter()
+        with abrir_salida(temporal, compresion) as salida:
+            contador = ContadorBytes(salida)
+            cursor = conn.cursor()
+            cursor.copy_expert(sql, contador, size=COPY_BUFFER_SIZE)
+            filas = cursor.rowcount
+        duracion = time.perf_counter() - inicio
+        # Solo se reemplaza el CSV anterior si el export ha terminado bien
+        temporal.replace(output_path)
+    except Exception:
+        temporal.unlink(missing_ok=True)
+        raise
+    finally:
+        conn.close()
+    
+    return {
+        'path': output_path,
+        'filas': filas,
+        'mb_csv': contador.bytes / 1e6,
+        'mb_disco': output_path.stat().st_size / 1e6,
+        'segundos': duracion,
+    }
+
+def export_to_csv(compresion: str = None, workers: int = EXPORT_WORKERS):
+    """Exporta datos de PostgreSQL a CSV (una conexión por query, en paralelo)"""
     
     print("=" * 60)
     print("🚀 EXPORTANDO PostgreSQL → CSV")
@@ -64,9 +143,9 @@ def export_to_csv():
     # Crear directorio si no existe
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Conectar a PostgreSQL
+    # Comprobar la conexión antes de lanzar los exports
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        psycopg2.connect(**DB_CONFIG).close()
         print(f"✅ Conexión establecida a {DB_CONFIG['host']}")
     except Exception as e:
         print(f"❌ Error conectando a PostgreSQL: {e}")
@@ -76,35 +155,50 @@ def export_to_csv():
     
     # Exportar cada query
     total_exported = 0
-    try:
-        for filename, query in QUERIES.items():
-            print(f"\n📥 Exportando: {filename}")
-            
-            # Ejecutar query y cargar en DataFrame
-            df = pd.read_sql_query(query, conn)
-            
-            # Guardar CSV
-            output_path = OUTPUT_DIR / filename
-            df.to_csv(output_path, index=False, encoding='utf-8')
-            
-            print(f"   ✅ {len(df):,} registros exportados")
-            print(f"   📁 {output_path}")
-            total_exported += len(df)
-        
-        print("\n" + "=" * 60)
-        print(f"✅ EXPORTACIÓN COMPLETADA")
-        print(f"📊 Total registros: {total_exported:,}")
-        print(f"📂 Ubicación: {OUTPUT_DIR}")
-        print("=" * 60)
-        
-    except Exception as e:
-        print(f"\n❌ Error durante exportación: {e}")
-    finally:
-        conn.close()
+    errores = 0
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(QUERIES)))) as executor:
+        futuros = {
+            executor.submit(export_query, filename, query, compresion): filename
+            for filename, query in QUERIES.items()
+        }
+        for futuro in as_completed(futuros):
+            filename = futuros[futuro]
+            try:
+                r = futuro.result()
+            except Exception as e:
+                print(f"\n❌ Error exportando {filename}: {e}")
+                errores += 1
+                continue
+            velocidad = r['mb_csv'] / r['segundos'] if r['segundos'] > 0 else float('inf')
+            print(f"\n📥 {filename}")
+            print(f"   ✅ {r['filas']:,} registros exportados en {r['segundos']:.2f}s "
+                  f"({r['mb_csv']:.2f} MB CSV, {velocidad:.1f} MB/s)")
+            if compresion is not None:
+                print(f"   🗜️  {r['mb_disco']:.2f} MB en disco ({compresion})")
+            print(f"   📁 {r['path']}")
+            total_exported += r['filas']
+    
+    print("\n" + "=" * 60)
+    print(f"✅ EXPORTACIÓN COMPLETADA" if not errores else f"⚠️ EXPORTACIÓN CON {errores} ERRORES")
+    print(f"📊 Total registros: {total_exported:,}")
+    print(f"⏱️  Duración: {time.perf_counter() - inicio:.2f}s")
+    print(f"📂 Ubicación: {OUTPUT_DIR}")
+    print("=" * 60)
+
+def parse_args(argv=None):
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Exportador PostgreSQL → CSV")
+    parser.add_argument('--compresion', choices=['gzip', 'zstd'], default=None,
+                        help="Comprime cada CSV (zstd requiere el paquete zstandard)")
+    parser.add_argument('--workers', type=int, default=EXPORT_WORKERS,
+                        help=f"Queries exportadas en paralelo (por defecto {EXPORT_WORKERS})")
+    return parser.parse_args(argv)
 
 # =====================================================
 # EJECUCIÓN
 # =====================================================
 
 if __name__ == '__main__':
-    export_to_csv()
+    args = parse_args()
+    export_to_csv(args.compresion, args.workers)
@@ -0,0 +1,239 @@
+"""
+=====================================================
+TESTS POR GRUPO: TIPO, SEVERIDAD, RUTA Y PRODUCTO
+=====================================================
+Motor de contrastes para todas las dimensiones a la vez:
+
+- Omnibus por dimensión (ANOVA y Kruskal-Wallis) sobre
+  los ingresos de las unidades CON incidencia
+- CON vs SIN por cada nivel de cada dimensión (Welch
+  y Mann-Whitney U asintótico con corrección de empates)
+- Corrección FDR de Benjamini-Hochberg y tabla ordenada
+
+Todas las unidades van en un único array ordenado por
+grupo; sumas, medias, varianzas y rangos salen de
+reducciones agrupadas (np.bincount / np.add.reduceat),
+sin bucles de Python por grupo, así que escala a
+cientos de rutas y miles de productos.
+
+Unidades de cada dimensión:
+- TipoIncidencia / Severidad: días (CON = hubo una
+  incidencia de ese nivel; SIN = día sin incidencias)
+- Ruta: (día, ruta); Producto: (día, ruta, producto)
+  (CON = la ruta tuvo incidencia ese día)
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from esquema_tipos import codificar_fecha_ruta
+
+ALFA_FDR = 0.05
+MIN_UNIDADES = 2  # por grupo, para poder estimar la varianza
+
+
+# unidades de análisis de todas las dimensiones en una tabla larga: dimension, nivel, valor, con
+def construir_unidades(
+    df_diario: pd.DataFrame, incidencias: pd.DataFrame, ventas_detalle: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    bloques = []
+    ingresos_dia = df_diario.set_index("Fecha")["Ingresos"]
+    ingresos_sin = df_diario.loc[df_diario["TieneIncidencia"] == 0, "Ingresos"].to_numpy()
+
+    for dimension in ("TipoIncidencia", "Severidad"):
+        if dimension not in incidencias.columns:
+            continue
+        con = incidencias[["Fecha", dimension]].dropna().drop_duplicates()
+        con = con[con["Fecha"].isin(ingresos_dia.index)]
+        niveles_con = con[dimension].astype(str).to_numpy()
+        niveles = pd.unique(niveles_con)
+        bloques.append(pd.DataFrame({
+            "dimension": dimension,
+            "nivel": niveles_con,
+            "valor": ingresos_dia.reindex(con["Fecha"]).to_numpy(),
+            "con": True,
+        }))
+        # los días SIN incidencias son el grupo de control de todos los niveles
+        bloques.append(pd.DataFrame({
+            "dimension": dimension,
+            "nivel": np.repeat(niveles, len(ingresos_sin)),
+            "valor": np.tile(ingresos_sin, len(niveles)),
+            "con": False,
+        }))
+
+    if ventas_detalle is not None and len(ventas_detalle) > 0 and "rutaid" in incidencias.columns:
+        claves_incidencia = codificar_fecha_ruta(incidencias["Fecha"], incidencias["rutaid"]).unique()
+        claves = codificar_fecha_ruta(ventas_detalle["Fecha"], ventas_detalle["rutaid"]).to_numpy()
+        con = np.isin(claves, claves_incidencia)
+
+        por_ruta = (
+            pd.DataFrame({"clave": claves, "rutaid": ventas_detalle["rutaid"].to_numpy(),
+                          "valor": ventas_detalle["Ingresos"].to_numpy(), "con": con})
+            .groupby("clave", sort=False)
+            .agg(rutaid=("rutaid", "first"), valor=("valor", "sum"), con=("con", "first"))
+        )
+        rutaids = por_ruta["rutaid"].astype("int64")
+        nombres = {}
+        if "ruta" in incidencias.columns:
+            rutas = incidencias[["rutaid", "ruta"]].dropna().drop_duplicates("rutaid")
+            nombres = dict(zip(rutas["rutaid"].astype("int64"), rutas["ruta"].astype(str)))
+        bloques.append(pd.DataFrame({
+            "dimension": "Ruta",
+            "nivel": rutaids.map(nombres).fillna("Ruta " + rutaids.astype(str)).to_numpy(),
+            "valor": por_ruta["valor"].to_numpy(),
+            "con": por_ruta["con"].to_numpy(),
+        }))
+        bloques.append(pd.DataFrame({
+            "dimension": "Producto",
+            "nivel": ventas_detalle["producto"].astype(str).to_numpy(),
+            "valor": ventas_detalle["Ingresos"].to_numpy(),
+            "con": con,
+        }))
+
+    if not bloques:
+        return pd.DataFrame({"dimension": [], "nivel": [], "valor": [], "con": []})
+    return pd.concat(bloques, ignore_index=True)
+
+
+# rangos promedio (1..n dentro de cada grupo, empates → media) de arrays ya ordenados por (grupo, valor).
+# Devuelve los rangos y, por grupo, la suma de t³ - t de los empates (corrección de las varianzas)
+def _rangos_por_grupo(grupos: np.ndarray, valores: np.ndarray, n_grupos: int) -> tuple[np.ndarray, np.ndarray]:
+    n = len(valores)
+    if n == 0:
+        return np.empty(0), np.zeros(n_grupos)
+    nuevo_grupo = np.r_[True, grupos[1:] != grupos[:-1]]
+    nuevo_empate = nuevo_grupo | np.r_[True, valores[1:] != valores[:-1]]
+
+    inicio_grupo = np.flatnonzero(nuevo_grupo)
+    posicion = np.arange(n) - np.repeat(inicio_grupo, np.diff(np.r_[inicio_grupo, n])) + 1
+
+    inicio_empate = np.flatnonzero(nuevo_empate)
+    tamano_empate = np.diff(np.r_[inicio_empate, n])
+    rango_empate = np.add.reduceat(posicion, inicio_empate) / tamano_empate
+    empates = np.bincount(grupos[inicio_empate], weights=tamano_empate.astype(np.float64) ** 3 - tamano_empate,
+                          minlength=n_grupos)
+    return np.repeat(rango_empate, tamano_empate), empates
+
+
+# Benjamini-Hochberg; los NaN (tests no calculables) se dejan fuera y siguen siendo NaN
+def fdr_bh(pvalores: np.ndarray) -> np.ndarray:
+    pvalores = np.asarray(pvalores, dtype=np.float64)
+    qvalores = np.full_like(pvalores, np.nan)
+    validos = np.flatnonzero(~np.isnan(pvalores))
+    if len(validos) == 0:
+        return qvalores
+    orden = validos[np.argsort(pvalores[validos])]
+    m = len(orden)
+    ajustados = pvalores[orden] * m / np.arange(1, m + 1)
+    qvalores[orden] = np.minimum(np.minimum.accumulate(ajustados[::-1])[::-1], 1.0)
+    return qvalores
+
+
+# omnibus por dimensión y CON vs SIN por nivel, todo en una pasada sobre las unidades
+def tests_agrupados(unidades: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    grupos = unidades.groupby(["dimension", "nivel"], sort=False)
+    nivel = grupos.ngroup().to_numpy()
+    etiquetas = grupos.size().index  # (dimension, nivel) en el orden de ngroup
+    n_niveles = len(etiquetas)
+    dim_codigo, dimensiones = pd.factorize(etiquetas.get_level_values("dimension"))
+    n_dims = len(dimensiones)
+
+    valor = unidades["valor"].to_numpy(dtype=np.float64)
+    con = unidades["con"].to_numpy(dtype=bool)
+
+    # ---- momentos por (nivel, CON/SIN): clave = nivel * 2 + con ----
+    clave = nivel * 2 + con
+    n = np.bincount(clave, minlength=2 * n_niveles).reshape(n_niveles, 2).astype(np.float64)
+    suma = np.bincount(clave, weights=valor, minlength=2 * n_niveles).reshape(n_niveles, 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = suma / n
+        desvio = valor - media.ravel()[clave]
+        ss = np.bincount(clave, weights=desvio ** 2, minlength=2 * n_niveles).reshape(n_niveles, 2)
+        var = ss / (n - 1)
+    n_sin, n_con = n[:, 0], n[:, 1]
+    validos = (n_sin >= MIN_UNIDADES) & (n_con >= MIN_UNIDADES)
+
+    # ---- Welch por nivel ----
+    with np.errstate(invalid="ignore", divide="ignore"):
+        se2_con, se2_sin = var[:, 1] / n_con, var[:, 0] / n_sin
+        t_welch = (media[:, 1] - media[:, 0]) / np.sqrt(se2_con + se2_sin)
+        gl = (se2_con + se2_sin) ** 2 / (se2_con ** 2 / (n_con - 1) + se2_sin ** 2 / (n_sin - 1))
+        p_welch = 2 * stats.t.sf(np.abs(t_welch), gl)
+    p_welch = np.where(validos & np.isfinite(t_welch), p_welch, np.nan)
+
+    # ---- Mann-Whitney U por nivel (rangos dentro de cada nivel) ----
+    orden = np.lexsort((valor, nivel))
+    rangos_ordenados, empates = _rangos_por_grupo(nivel[orden], valor[orden], n_niveles)
+    rangos = np.empty_like(rangos_ordenados)
+    rangos[orden] = rangos_ordenados
+    suma_rangos_con = np.bincount(nivel, weights=rangos * con, minlength=n_niveles)
+    n_total = n_con + n_sin
+    u_con = suma_rangos_con - n_con * (n_con + 1) / 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma = np.sqrt(n_con * n_sin / 12 * ((n_total + 1) - empates / (n_total * (n_total - 1))))
+        z = (np.abs(u_con - n_con * n_sin / 2) - 0.5) / sigma
+        p_mwu = np.minimum(2 * stats.norm.sf(z), 1.0)
+    p_mwu = np.where(validos & (sigma > 0), p_mwu, np.nan)
+
+    pares = pd.DataFrame({
+        "dimension": etiquetas.get_level_values("dimension"),
+        "nivel": etiquetas.get_level_values("nivel"),
+        "n_con": n_con.astype(int),
+        "n_sin": n_sin.astype(int),
+        "media_con": media[:, 1],
+        "media_sin": media[:, 0],
+        "diferencia": media[:, 1] - media[:, 0],
+        "t_welch": t_welch,
+        "p_welch": p_welch,
+        "u": u_con,
+        "p_mwu": p_mwu,
+    })
+    pares["q_welch"] = fdr_bh(pares["p_welch"].to_numpy())
+    pares["q_mwu"] = fdr_bh(pares["p_mwu"].to_numpy())
+    pares = pares.sort_values(["q_welch", "p_welch", "q_mwu"], na_position="last", ignore_index=True)
+
+    # ---- omnibus por dimensión (solo unidades CON, niveles con datos) ----
+    presentes = n_con > 0
+    k = np.bincount(dim_codigo, weights=presentes, minlength=n_dims)
+    n_dim = np.bincount(dim_codigo, weights=n_con, minlength=n_dims)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media_dim = np.bincount(dim_codigo, weights=suma[:, 1], minlength=n_dims) / n_dim
+        ssb = np.bincount(dim_codigo, weights=np.where(presentes, n_con * (media[:, 1] - media_dim[dim_codigo]) ** 2, 0),
+                          minlength=n_dims)
+        ssw = np.bincount(dim_codigo, weights=np.where(presentes, ss[:, 1], 0), minlength=n_dims)
+        f_anova = (ssb / (k - 1)) / (ssw / (n_dim - k))
+        p_anova = stats.f.sf(f_anova, k - 1, n_dim - k)
+
+    # Kruskal-Wallis: rangos de las unidades CON dentro de cada dimensión
+    dim_unidad = dim_codigo[nivel]
+    indices_con = np.flatnonzero(con)
+    orden = indices_con[np.lexsort((valor[indices_con], dim_unidad[indices_con]))]
+    rangos_con, empates_dim = _rangos_por_grupo(dim_unidad[orden], valor[orden], n_dims)
+    suma_rangos = np.bincount(nivel[orden], weights=rangos_con, minlength=n_niveles)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        termino = np.where(presentes, suma_rangos ** 2 / n_con, 0)
+        h = 12 / (n_dim * (n_dim + 1)) * np.bincount(dim_codigo, weights=termino, minlength=n_dims) - 3 * (n_dim + 1)
+        h = h / (1 - empates_dim / (n_dim ** 3 - n_dim))
+        p_kruskal = stats.chi2.sf(h, k - 1)
+
+    calculable = (k >= 2) & (n_dim > k)
+    omnibus = pd.DataFrame({
+        "dimension": dimensiones,
+        "niveles": k.astype(int),
+        "n_con": n_dim.astype(int),
+        "f_anova": np.where(calculable, f_anova, np.nan),
+        "p_anova": np.where(calculable, p_anova, np.nan),
+        "h_kruskal": np.where(calculable, h, np.nan),
+        "p_kruskal": np.where(calculable, p_kruskal, np.nan),
+    })
+    omnibus["q_anova"] = fdr_bh(omnibus["p_anova"].to_numpy())
+    omnibus["q_kruskal"] = fdr_bh(omnibus["p_kruskal"].to_numpy())
+
+    return omnibus, pares
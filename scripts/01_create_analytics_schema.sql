@@ -65,10 +65,18 @@ CREATE TABLE analytics.dim_tipo_incidencia (
 -- TABLAS DE HECHOS (Fact Tables)
 -- =====================================================
 
+-- Particionadas por mes (RANGE sobre fecha). Las particiones
+-- analytics.<tabla>_YYYY_MM las crea el ETL: carga cada mes en
+-- una tabla de staging y la intercambia con ATTACH PARTITION,
+-- así recargar un mes no bloquea ni reescribe los demás y las
+-- consultas por rango de fechas solo leen los meses afectados.
+-- Las claves únicas incluyen fecha (requisito de PostgreSQL
+-- para restricciones únicas en tablas particionadas).
+
 -- FACT: Ventas (granularidad: ticket individual)
 DROP TABLE IF EXISTS analytics.fact_ventas CASCADE;
 CREATE TABLE analytics.fact_ventas (
-    venta_id BIGSERIAL PRIMARY KEY,
+    venta_id BIGSERIAL,
     ticketid INTEGER NOT NULL,
     
     -- Claves foráneas (dimensiones)
@@ -92,17 +100,21 @@ CREATE TABLE analytics.fact_ventas (
     porcentaje_objetivo NUMERIC(5,2), -- (ingresos_total / objetivo_ventas) * 100
     tiene_incidencia BOOLEAN DEFAULT FALSE, -- Si ese día-ruta tuvo incidencia
     
+    -- Región de origen (una base raw por región / unidad de negocio)
+    fuente_id VARCHAR(50) NOT NULL DEFAULT 'principal',
+    
     -- Auditoría
     fecha_carga TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
-    -- Restricción de grano único
-    UNIQUE(ticketid, fecha_ruta, productoid)
-);
+    -- Restricción de grano único (fecha_ruta ya determina fecha), por región
+    PRIMARY KEY (venta_id, fecha),
+    UNIQUE(ticketid, fecha_ruta, productoid, fecha, fuente_id)
+) PARTITION BY RANGE (fecha);
 
 -- FACT: Incidencias (granularidad: incidencia individual)
 DROP TABLE IF EXISTS analytics.fact_incidencias CASCADE;
 CREATE TABLE analytics.fact_incidencias (
-    incidencia_id SERIAL PRIMARY KEY,
+    incidencia_id SERIAL,
     incidenciaid INTEGER NOT NULL,
     
     -- Claves foráneas (dimensiones)
@@ -121,77 +133,74 @@ CREATE TABLE analytics.fact_incidencias (
     es_critica BOOLEAN, -- Si severidad = 'Alta'
     duracion_horas NUMERIC(5,2), -- duracion_minutos / 60
     
+    -- Región de origen
+    fuente_id VARCHAR(50) NOT NULL DEFAULT 'principal',
+    
     -- Auditoría
     fecha_carga TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
-    -- Restricción de grano único
-    UNIQUE(incidenciaid)
+    -- Restricción de grano único, por región
+    PRIMARY KEY (incidencia_id, fecha),
+    UNIQUE(incidenciaid, fecha, fuente_id)
+) PARTITION BY RANGE (fecha);
+
+-- =====================================================
+-- ESTADO ETL (modo incremental)
+-- =====================================================
+-- High-watermark por tabla raw: el ETL incremental solo
+-- extrae filas con columna_watermark >= watermark
+CREATE TABLE IF NOT EXISTS analytics.etl_state (
+    tabla VARCHAR(50) PRIMARY KEY,           -- 'ventas', 'incidencias' ('<fuente>/ventas' en otras regiones)
+    columna_watermark VARCHAR(50) NOT NULL,  -- 'fecha' o timestamp de ingesta
+    watermark TEXT,                          -- Último valor cargado
+    filas_ultima_carga INTEGER,
+    actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- =====================================================
--- VISTA AGREGADA: Análisis Ventas vs Incidencias
+-- CUARENTENA (filas que no cumplen el DDL de los hechos)
 -- =====================================================
--- Vista pre-calculada para Power BI (performance)
+-- El ETL valida los hechos antes de cargarlos y aparta
+-- aquí las filas inválidas con su motivo (el ETL las
+-- crea también si faltan)
+CREATE TABLE IF NOT EXISTS analytics.quarantine_fact_ventas (
+    cuarentena_id BIGSERIAL PRIMARY KEY,
+    run_id VARCHAR(50) NOT NULL,
+    motivo VARCHAR(150) NOT NULL,            -- 'check:fact_ventas_cantidad_check', 'fk:rutaid', ...
+    fila JSONB NOT NULL,                     -- Fila original
+    registrado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_quarantine_fact_ventas_run ON analytics.quarantine_fact_ventas(run_id);
+
+CREATE TABLE IF NOT EXISTS analytics.quarantine_fact_incidencias (
+    cuarentena_id BIGSERIAL PRIMARY KEY,
+    run_id VARCHAR(50) NOT NULL,
+    motivo VARCHAR(150) NOT NULL,
+    fila JSONB NOT NULL,
+    registrado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_quarantine_fact_incidencias_run ON analytics.quarantine_fact_incidencias(run_id);
+
+-- =====================================================
+-- ROLLUP DIARIO: Análisis Ventas vs Incidencias
+-- =====================================================
+-- La tabla materializada agg_ventas_incidencias_diarias y
+-- la vista vw_ventas_incidencias_diarias se crean en
+-- 03_create_rollup_diario.sql (el ETL lo aplica si faltan)
 DROP VIEW IF EXISTS analytics.vw_ventas_incidencias_diarias CASCADE;
-CREATE VIEW analytics.vw_ventas_incidencias_diarias AS
-SELECT 
-    v.fecha,
-    v.rutaid,
-    r.nombre_ruta,
-    r.tipo_transporte,
-    c.diasemana,
-    c.eslaborable,
-    
-    -- Agregaciones de ventas
-    COUNT(DISTINCT v.ticketid) as num_tickets,
-    SUM(v.cantidad) as cantidad_total_vendida,
-    SUM(v.ingresos_total) as ingresos_totales,
-    AVG(v.precio_unitario) as precio_promedio,
-    AVG(v.pasajeros) as pasajeros_promedio,
-    MAX(v.objetivo_ventas) as objetivo_ventas,
-    
-    -- Indicadores de incidencias
-    COUNT(i.incidencia_id) as num_incidencias,
-    COALESCE(SUM(i.duracion_minutos), 0) as duracion_total_incidencias,
-    MAX(CASE WHEN i.severidad = 'Alta' THEN 1 ELSE 0 END) as tuvo_incidencia_alta,
-    
-    -- Métricas calculadas
-    CASE 
-        WHEN COUNT(i.incidencia_id) > 0 THEN 'Con Incidencia'
-        ELSE 'Sin Incidencia'
-    END as estado_dia,
-    
-    -- Impacto estimado (simplificado)
-    CASE 
-        WHEN COUNT(i.incidencia_id) > 0 
-        THEN SUM(v.ingresos_total) * 0.85 -- Asume 15% de pérdida
-        ELSE SUM(v.ingresos_total)
-    END as ingresos_ajustados
-
-FROM analytics.fact_ventas v
-LEFT JOIN analytics.fact_incidencias i 
-    ON v.fecha = i.fecha AND v.rutaid = i.rutaid
-INNER JOIN analytics.dim_rutas r ON v.rutaid = r.rutaid
-INNER JOIN analytics.dim_calendario c ON v.fecha = c.fecha
-
-GROUP BY 
-    v.fecha, 
-    v.rutaid, 
-    r.nombre_ruta, 
-    r.tipo_transporte,
-    c.diasemana,
-    c.eslaborable;
+DROP TABLE IF EXISTS analytics.agg_ventas_incidencias_diarias CASCADE;
 
 -- =====================================================
 -- COMENTARIOS (Documentación en BD)
 -- =====================================================
 COMMENT ON SCHEMA analytics IS 'Schema optimizado para análisis de ventas e incidencias - listo para Power BI';
-COMMENT ON TABLE analytics.fact_ventas IS 'Tabla de hechos con todas las transacciones de venta (granularidad: ticket)';
-COMMENT ON TABLE analytics.fact_incidencias IS 'Tabla de hechos con todas las incidencias operacionales';
-COMMENT ON VIEW analytics.vw_ventas_incidencias_diarias IS 'Vista agregada día-ruta para dashboard principal';
+COMMENT ON TABLE analytics.fact_ventas IS 'Tabla de hechos con todas las transacciones de venta (granularidad: ticket, particionada por mes)';
+COMMENT ON TABLE analytics.fact_incidencias IS 'Tabla de hechos con todas las incidencias operacionales (particionada por mes)';
+COMMENT ON TABLE analytics.etl_state IS 'Watermarks del ETL incremental (uno por tabla raw)';
 
 COMMENT ON COLUMN analytics.fact_ventas.tiene_incidencia IS 'Indica si ese día-ruta tuvo al menos una incidencia';
 COMMENT ON COLUMN analytics.fact_ventas.porcentaje_objetivo IS 'Porcentaje de cumplimiento del objetivo de ventas';
+COMMENT ON COLUMN analytics.fact_ventas.fuente_id IS 'Base raw (región / unidad de negocio) de la que procede la fila';
 
 -- =====================================================
 -- FIN DEL SCRIPT
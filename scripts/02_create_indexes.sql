@@ -37,6 +37,9 @@ CREATE INDEX IF NOT EXISTS idx_tipo_inc_criticidad ON analytics.dim_tipo_inciden
 -- =====================================================
 -- ÍNDICES EN FACT_VENTAS (crítico para performance)
 -- =====================================================
+-- Los hechos están particionados por mes: un índice sobre
+-- la tabla padre se crea en cada partición, y el ETL lo
+-- crea también en las particiones que añade con ATTACH
 
 -- Índice compuesto para filtros más comunes (fecha + ruta)
 CREATE INDEX IF NOT EXISTS idx_ventas_fecha_ruta ON analytics.fact_ventas(fecha, rutaid);
@@ -68,17 +71,25 @@ CREATE INDEX IF NOT EXISTS idx_incidencias_tipo ON analytics.fact_incidencias(ti
 CREATE INDEX IF NOT EXISTS idx_incidencias_severidad ON analytics.fact_incidencias(severidad);
 CREATE INDEX IF NOT EXISTS idx_incidencias_critica ON analytics.fact_incidencias(es_critica);
 
+-- =====================================================
+-- ÍNDICES EN AGG_VENTAS_INCIDENCIAS_DIARIAS
+-- =====================================================
+-- Los índices del rollup (ruta, estado del día, días con
+-- incidencia alta) se crean con la tabla en
+-- 03_create_rollup_diario.sql
+
 -- =====================================================
 -- CLUSTER (Reorganización física)
 -- =====================================================
 -- Reorganiza los datos físicamente según el índice
 -- para mejorar velocidad de lectura secuencial
 
--- Cluster fact_ventas por fecha (queries suelen filtrar por rango de fechas)
-CLUSTER analytics.fact_ventas USING idx_ventas_fecha_ruta;
+-- Los hechos ya están agrupados por mes (una partición por
+-- mes); no se reorganizan enteros. Para compactar un solo
+-- mes: CLUSTER analytics.fact_ventas_YYYY_MM USING <índice>
 
--- Cluster fact_incidencias por fecha
-CLUSTER analytics.fact_incidencias USING idx_incidencias_fecha_ruta;
+-- Cluster del rollup por su PK (fecha, rutaid)
+CLUSTER analytics.agg_ventas_incidencias_diarias USING agg_ventas_incidencias_diarias_pkey;
 
 -- =====================================================
 -- VACUUM Y ANALYZE (Optimización de estadísticas)
@@ -90,8 +101,9 @@ VACUUM ANALYZE analytics.dim_calendario;
 VACUUM ANALYZE analytics.dim_productos;
 VACUUM ANALYZE analytics.dim_rutas;
 VACUUM ANALYZE analytics.dim_tipo_incidencia;
-VACUUM ANALYZE analytics.fact_ventas;
-VACUUM ANALYZE analytics.fact_incidencias;
+-- Hechos: las particiones las mantiene autovacuum; la tabla
+-- padre se analiza más abajo, tras las estadísticas extendidas
+VACUUM ANALYZE analytics.agg_ventas_incidencias_diarias;
 
 -- =====================================================
 -- ESTADÍSTICAS EXTENDIDAS (PostgreSQL 10+)
@@ -0,0 +1,100 @@
+-- =====================================================
+-- SCRIPT: Rollup diario materializado (día-ruta)
+-- Proyecto: Ventas e Incidencias - Schema Analytics
+-- Autor: Sistema ETL
+-- Fecha: 2026-10-18
+-- =====================================================
+-- Sustituye a la vista vw_ventas_incidencias_diarias,
+-- que recalculaba el JOIN + GROUP BY completo en cada
+-- visual de Power BI (DirectQuery).
+--
+-- - analytics.agg_ventas_incidencias_diarias guarda las
+--   métricas ya agregadas por (fecha, rutaid); el ETL
+--   solo recalcula los pares que ha tocado.
+-- - Las incidencias se agregan ANTES del JOIN: la vista
+--   antigua multiplicaba cada venta por el nº de
+--   incidencias del día-ruta e inflaba SUM(ingresos).
+-- - vw_ventas_incidencias_diarias se mantiene como vista
+--   de compatibilidad (mismas columnas) sobre el rollup.
+--
+-- Idempotente: el ETL lo ejecuta si falta la tabla o la
+-- vista (p. ej. tras re-ejecutar 01_create_analytics_schema.sql)
+-- =====================================================
+
+DROP VIEW IF EXISTS analytics.vw_ventas_incidencias_diarias;
+
+CREATE TABLE IF NOT EXISTS analytics.agg_ventas_incidencias_diarias (
+    fecha DATE NOT NULL,
+    rutaid INTEGER NOT NULL,
+
+    -- Agregaciones de ventas
+    num_tickets BIGINT NOT NULL,
+    cantidad_total_vendida BIGINT NOT NULL,
+    ingresos_totales NUMERIC NOT NULL,
+    precio_promedio NUMERIC,
+    pasajeros_promedio NUMERIC,
+    objetivo_ventas INTEGER,
+
+    -- Indicadores de incidencias (pre-agregadas, sin fan-out)
+    num_incidencias BIGINT NOT NULL DEFAULT 0,
+    duracion_total_incidencias BIGINT NOT NULL DEFAULT 0,
+    tuvo_incidencia_alta INTEGER NOT NULL DEFAULT 0,
+
+    -- Métricas calculadas
+    estado_dia TEXT NOT NULL,
+    ingresos_ajustados NUMERIC NOT NULL,
+
+    -- Auditoría
+    fecha_refresco TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (fecha, rutaid)
+);
+
+-- Vista de compatibilidad: mismas columnas que la vista original
+CREATE VIEW analytics.vw_ventas_incidencias_diarias AS
+SELECT
+    a.fecha,
+    a.rutaid,
+    r.nombre_ruta,
+    r.tipo_transporte,
+    c.diasemana,
+    c.eslaborable,
+    a.num_tickets,
+    a.cantidad_total_vendida,
+    a.ingresos_totales,
+    a.precio_promedio,
+    a.pasajeros_promedio,
+    a.objetivo_ventas,
+    a.num_incidencias,
+    a.duracion_total_incidencias,
+    a.tuvo_incidencia_alta,
+    a.estado_dia,
+    a.ingresos_ajustados
+FROM analytics.agg_ventas_incidencias_diarias a
+INNER JOIN analytics.dim_rutas r ON a.rutaid = r.rutaid
+INNER JOIN analytics.dim_calendario c ON a.fecha = c.fecha;
+
+-- =====================================================
+-- ÍNDICES (patrones de filtro del dashboard)
+-- =====================================================
+-- La PK (fecha, rutaid) cubre rangos de fechas; estos
+-- cubren el filtro por ruta y por estado del día
+
+CREATE INDEX IF NOT EXISTS idx_agg_diaria_ruta_fecha
+    ON analytics.agg_ventas_incidencias_diarias(rutaid, fecha);
+CREATE INDEX IF NOT EXISTS idx_agg_diaria_estado_fecha
+    ON analytics.agg_ventas_incidencias_diarias(estado_dia, fecha);
+CREATE INDEX IF NOT EXISTS idx_agg_diaria_alta
+    ON analytics.agg_ventas_incidencias_diarias(fecha)
+    WHERE tuvo_incidencia_alta = 1;
+
+-- =====================================================
+-- COMENTARIOS (Documentación en BD)
+-- =====================================================
+COMMENT ON TABLE analytics.agg_ventas_incidencias_diarias IS 'Rollup día-ruta de ventas e incidencias (refresco incremental desde el ETL)';
+COMMENT ON VIEW analytics.vw_ventas_incidencias_diarias IS 'Vista agregada día-ruta para dashboard principal (lee del rollup materializado)';
+COMMENT ON COLUMN analytics.agg_ventas_incidencias_diarias.num_incidencias IS 'Incidencias del día-ruta (agregadas antes del JOIN con ventas)';
+
+-- =====================================================
+-- FIN DEL SCRIPT
+-- =====================================================
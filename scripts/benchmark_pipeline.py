@@ -0,0 +1,462 @@
+"""
+=====================================================
+BENCHMARK END-TO-END: GENERADOR → ETL → ANÁLISIS
+=====================================================
+Mide cada fase del pipeline sobre datos sintéticos a
+varios factores de escala (1x, 10x, 100x...) contra
+un PostgreSQL local desechable:
+
+- Extract (tablas raw en paralelo)
+- Cada transform_* y cada carga (dimensiones y hechos)
+  con los mismos argumentos que sus etapas de run_etl
+- run_etl de principio a fin: recarga completa y una
+  incremental sin cambios (DAG, validación, cuarentena
+  y rollup incluidos)
+- build_daily_table, almacén de agregados diarios
+  (en frío y sin cambios), tests estadísticos y cada
+  figura (una a una, en el pool y desde la caché)
+
+Por fase guarda tiempo de reloj, filas/s y pico de
+memoria (RSS) en JSON, y lo compara con un baseline:
+si alguna fase empeora más del umbral, sale con
+código 1 (apto para CI).
+
+Base de datos:
+- --dsn: servidor existente; se crea y se borra una
+  base de datos temporal bench_etl_<pid>
+- sin --dsn: levanta un cluster temporal con initdb y
+  pg_ctl (deben estar en el PATH o en --pg-bin; initdb
+  no se puede ejecutar como root)
+
+Uso:
+    python benchmark_pipeline.py --escalas 1 10 100
+    python benchmark_pipeline.py --dsn "host=localhost user=postgres" --guardar-baseline
+    python benchmark_pipeline.py --baseline ../benchmarks/baseline.json --umbral 0.15
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR / 'analysis'))
+
+import etl_pipeline as etl
+from etl_metricas import MedidorMemoria
+from esquema_tipos import leer_csv
+import correlacion_impacto as ci
+from generar_ventas_realistas import generar_ventas
+
+logger = logging.getLogger('benchmark')
+
+# =====================================================
+# CONFIGURACIÓN
+# =====================================================
+
+ESCALAS = [1, 10, 100]
+SEMILLA = 42
+UMBRAL_REGRESION = 0.10      # 10% peor que el baseline
+MIN_DELTA_SEGUNDOS = 0.05    # Diferencias menores se consideran ruido
+MIN_DELTA_MEMORIA_MB = 16
+
+BENCHMARKS_DIR = BASE_DIR / 'benchmarks'
+RESULTADOS_PATH = BENCHMARKS_DIR / 'resultados.json'
+BASELINE_PATH = BENCHMARKS_DIR / 'baseline.json'
+
+RAW_DIR = BASE_DIR / 'data' / 'raw'
+INCIDENCIAS_PATH = BASE_DIR / 'data' / 'processed' / 'incidencias_proc2.csv'
+SCHEMA_SQL = Path(__file__).parent / '01_create_analytics_schema.sql'
+INDICES_SQL = Path(__file__).parent / '02_create_indexes.sql'
+
+# Esquema 'public' (raw) tal como lo lee el ETL
+RAW_DDL = """
+CREATE TABLE public.calendario_raw (fecha date PRIMARY KEY, anio int, mesnum int, mes text, dia int,
+                                    diasemana text, semanaiso int, eslaborable boolean);
+CREATE TABLE public.productos_raw (productoid int PRIMARY KEY, nombre_producto text);
+CREATE TABLE public.rutas_raw (rutaid int PRIMARY KEY, nombre_ruta text);
+CREATE TABLE public.incidencias_raw (incidenciaid int PRIMARY KEY, fecha date, ruta text, fecha_ruta text,
+                                     tipoincidencia text, severidad text, duracionmin int, rutaid int);
+CREATE TABLE public.ventas_raw (venta_id bigserial PRIMARY KEY, ticketid int, fecha date, rutaid int,
+                                productoid int, fecha_ruta text, cantidad int, preciounit numeric(10,2),
+                                pasajeros int, objetivoventas int);
+"""
+
+# =====================================================
+# MEDICIÓN
+# =====================================================
+
+class Benchmark:
+    """Acumula las mediciones de cada fase"""
+
+    def __init__(self):
+        self.resultados: List[dict] = []
+
+    @contextlib.contextmanager
+    def fase(self, escala: int, nombre: str, filas: int = 0) -> Iterator[dict]:
+        """Mide una fase; el bloque puede fijar medicion['filas'] si no se conocen de antemano"""
+        medicion = {'escala': escala, 'fase': nombre, 'filas': filas}
+        with MedidorMemoria() as memoria:
+            inicio = time.perf_counter()
+            yield medicion
+            segundos = time.perf_counter() - inicio
+        medicion['segundos'] = round(segundos, 4)
+        medicion['filas_por_segundo'] = round(medicion['filas'] / segundos, 1) if segundos > 0 else None
+        if memoria.pico is not None:
+            medicion['pico_memoria_mb'] = round(memoria.pico / 1024 ** 2, 1)
+            medicion['delta_memoria_mb'] = round((memoria.pico - memoria.inicial) / 1024 ** 2, 1)
+        self.resultados.append(medicion)
+        logger.info(f"  ⏱️  [{escala}x] {nombre:<40} {segundos:>8.3f}s  {medicion['filas']:>10,} filas  "
+                    f"pico {medicion.get('pico_memoria_mb', '?')} MB")
+
+# =====================================================
+# POSTGRESQL DESECHABLE
+# =====================================================
+
+@contextlib.contextmanager
+def _cluster_temporal(pg_bin: Optional[Path]) -> Iterator[str]:
+    """Levanta un cluster PostgreSQL en un directorio temporal (solo socket Unix)"""
+    def binario(nombre):
+        ruta = shutil.which(nombre, path=str(pg_bin) if pg_bin else None)
+        if ruta is None:
+            raise RuntimeError(f"No se encuentra '{nombre}': usa --pg-bin o --dsn")
+        return ruta
+
+    directorio = Path(tempfile.mkdtemp(prefix='bench_pg_'))
+    datos = directorio / 'data'
+    try:
+        subprocess.run([binario('initdb'), '-D', str(datos), '-U', 'postgres', '-A', 'trust',
+                        '-E', 'UTF8', '--no-sync'], check=True, capture_output=True)
+        # fsync=off: es un cluster desechable y así se mide el pipeline, no el disco
+        opciones = f"-k {directorio} -c listen_addresses='' -c fsync=off"
+        subprocess.run([binario('pg_ctl'), '-D', str(datos), '-o', opciones, '-l', str(directorio / 'pg.log'),
+                        '-w', 'start'], check=True, capture_output=True)
+        logger.info(f"🐘 Cluster temporal levantado en {directorio}")
+        try:
+            yield make_dsn(host=str(directorio), user='postgres', dbname='postgres')
+        finally:
+            subprocess.run([binario('pg_ctl'), '-D', str(datos), '-m', 'fast', '-w', 'stop'], capture_output=True)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+@contextlib.contextmanager
+def base_datos_temporal(dsn: Optional[str], pg_bin: Optional[Path] = None) -> Iterator[str]:
+    """DSN de una base de datos vacía que se borra al terminar"""
+    with contextlib.ExitStack() as pila:
+        if dsn is None:
+            dsn = pila.enter_context(_cluster_temporal(pg_bin))
+        nombre = f"bench_etl_{os.getpid()}"
+        admin = psycopg2.connect(dsn)
+        admin.autocommit = True
+        try:
+            admin.cursor().execute(f"DROP DATABASE IF EXISTS {nombre}")
+            admin.cursor().execute(f"CREATE DATABASE {nombre}")
+            try:
+                yield make_dsn(dsn, dbname=nombre)
+            finally:
+                admin.cursor().execute(f"DROP DATABASE IF EXISTS {nombre} WITH (FORCE)")
+        finally:
+            admin.close()
+
+def _copy_csv(cursor, tabla: str, df: pd.DataFrame):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {tabla} ({','.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def preparar_raw(dsn: str, shards: List[str]) -> int:
+    """Crea el esquema raw + analytics y carga dimensiones, incidencias y las ventas generadas"""
+    calendario = pd.read_csv(RAW_DIR / 'Calendario.csv', encoding='utf-8-sig')
+    calendario.columns = calendario.columns.str.lower()
+    calendario['eslaborable'] = calendario['eslaborable'].astype(bool)
+    productos = pd.read_csv(RAW_DIR / 'Productos_nuevos.csv').rename(
+        columns={'ProductoID': 'productoid', 'Producto': 'nombre_producto'})[['productoid', 'nombre_producto']]
+    rutas = pd.read_csv(RAW_DIR / 'Rutas.csv', encoding='utf-8-sig').rename(
+        columns={'RutaID': 'rutaid', 'Ruta': 'nombre_ruta'})[['rutaid', 'nombre_ruta']]
+    incidencias = pd.read_csv(INCIDENCIAS_PATH)
+
+    id_ruta = dict(zip(rutas['nombre_ruta'], rutas['rutaid']))
+    id_producto = dict(zip(productos['nombre_producto'], productos['productoid']))
+
+    conn = psycopg2.connect(dsn)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DROP SCHEMA IF EXISTS analytics CASCADE")
+        cursor.execute("DROP TABLE IF EXISTS public.calendario_raw, public.productos_raw, public.rutas_raw, "
+                       "public.incidencias_raw, public.ventas_raw")
+        cursor.execute(RAW_DDL)
+        for tabla, df in [('public.calendario_raw', calendario), ('public.productos_raw', productos),
+                          ('public.rutas_raw', rutas), ('public.incidencias_raw', incidencias)]:
+            _copy_csv(cursor, tabla, df)
+
+        filas = 0
+        for shard in shards:
+            ventas = leer_csv(shard, 'ventas_generadas')
+            _copy_csv(cursor, 'public.ventas_raw', pd.DataFrame({
+                'ticketid': ventas['TicketID'],
+                'fecha': ventas['Fecha'],
+                'rutaid': ventas['Ruta'].map(id_ruta),
+                'productoid': ventas['Producto'].map(id_producto),
+                'fecha_ruta': ventas['Fecha-Ruta'],
+                'cantidad': ventas['Cantidad'],
+                'preciounit': ventas['PrecioUnit'],
+                'pasajeros': ventas['Pasajeros'],
+                'objetivoventas': ventas['ObjetivoVentas'],
+            }))
+            filas += len(ventas)
+
+        cursor.execute(SCHEMA_SQL.read_text(encoding='utf-8'))
+        # Índices de producción (el resto de 02_create_indexes.sql es psql y mantenimiento)
+        for sentencia in re.findall(r'^CREATE INDEX .*?;', INDICES_SQL.read_text(encoding='utf-8'), re.M):
+            cursor.execute(sentencia)
+        cursor.execute("ANALYZE")
+        conn.commit()
+        return filas
+    finally:
+        conn.close()
+
+# =====================================================
+# FASES
+# =====================================================
+
+def medir_escala(bench: Benchmark, escala: int, dsn: str, trabajo: Path, workers: int):
+    """Ejecuta y mide el pipeline completo para un factor de escala"""
+    logger.info(f"\n📐 ESCALA {escala}x")
+    logger.info("-" * 60)
+
+    with bench.fase(escala, 'generar_ventas') as m:
+        resumen = generar_ventas(escala=escala, semilla=SEMILLA, salida=trabajo / f"ventas_sf{escala}")
+        m['filas'] = resumen['filas']
+    preparar_raw(dsn, [s['shard'] for s in resumen['shards']])
+
+    etl.DB_CONFIG.clear()
+    etl.DB_CONFIG.update(parse_dsn(dsn))
+
+    # ETL fase a fase: las funciones de cada etapa de run_etl en modo completo, en serie y sin DAG
+    # (dimensiones con UPSERT, hechos por intercambio de particiones sobre el analytics recién creado)
+    pool = etl.create_pool(workers)
+    conn = etl.get_connection()
+    try:
+        etl.ensure_etl_state(conn)
+        etl.ensure_rollup(conn)
+        etl.ensure_cuarentena(conn)
+        etl.verificar_particiones(conn)
+
+        with bench.fase(escala, 'extract') as m:
+            raw = etl.extract_raw_data_parallel(pool, None, etl.TABLAS_RAW, workers)
+            m['filas'] = sum(len(df) for df in raw.values())
+
+        with bench.fase(escala, 'transform_calendario', len(raw['calendario'])):
+            dim_calendario = etl.transform_calendario(raw['calendario'])
+        with bench.fase(escala, 'transform_productos', len(raw['productos'])):
+            dim_productos = etl.transform_productos(raw['productos'])
+        with bench.fase(escala, 'transform_rutas', len(raw['rutas'])):
+            dim_rutas = etl.transform_rutas(raw['rutas'])
+        with bench.fase(escala, 'resolver_claves', len(raw['incidencias']) + len(raw['ventas'])):
+            resolutor = etl.ResolutorClaves(dim_rutas, dim_productos, dim_calendario)
+            raw['incidencias'], _ = resolutor.separar(raw['incidencias'], 'incidencias')
+            raw['ventas'], _ = resolutor.separar(raw['ventas'], 'ventas')
+        with bench.fase(escala, 'transform_incidencias', len(raw['incidencias'])):
+            fact_incidencias = etl.transform_incidencias(raw['incidencias'])
+        with bench.fase(escala, 'transform_ventas', len(raw['ventas'])):
+            fact_ventas = etl.transform_ventas(raw['ventas'], raw['incidencias'])
+        del raw['ventas']
+        with bench.fase(escala, 'validar_hechos', len(fact_incidencias) + len(fact_ventas)):
+            validador = etl.ValidadorHechos.desde_catalogo(conn, etl.TABLAS_PARTICIONADAS, {
+                'dim_calendario': dim_calendario, 'dim_productos': dim_productos, 'dim_rutas': dim_rutas,
+            })
+            fact_incidencias, _ = validador.validar(fact_incidencias, 'fact_incidencias')
+            fact_ventas, _ = validador.validar(fact_ventas, 'fact_ventas')
+
+        with bench.fase(escala, 'load_dim_calendario', len(dim_calendario)):
+            etl.load_dimension(conn, 'dim_calendario', dim_calendario, 'fecha', True)
+        with bench.fase(escala, 'load_dim_productos', len(dim_productos)):
+            etl.load_dimension(conn, 'dim_productos', dim_productos, 'productoid', True)
+        with bench.fase(escala, 'load_dim_rutas', len(dim_rutas)):
+            etl.load_dimension(conn, 'dim_rutas', dim_rutas, 'rutaid', True)
+        with bench.fase(escala, 'load_dim_tipo_incidencia', len(fact_incidencias)):
+            etl.create_tipo_incidencia_catalog(conn, fact_incidencias, True)
+        with bench.fase(escala, 'load_fact_incidencias', len(fact_incidencias)):
+            etl.load_fact_table(conn, 'fact_incidencias', fact_incidencias, ['incidenciaid', 'fecha', 'fuente_id'])
+        with bench.fase(escala, 'load_fact_ventas', len(fact_ventas)):
+            etl.load_fact_table(conn, 'fact_ventas', fact_ventas,
+                                ['ticketid', 'fecha_ruta', 'productoid', 'fecha', 'fuente_id'])
+        with bench.fase(escala, 'refresh_rollup_diario') as m:
+            m['filas'] = etl.refresh_rollup_diario(conn)
+    finally:
+        conn.close()
+        pool.closeall()
+
+    # ETL de principio a fin, tal como se ejecuta en producción (sin caché ni checkpoints)
+    opciones = dict(extract_workers=workers, usar_cache=False, checkpoints=False,
+                    metricas_path=str(trabajo / f"etl_metricas_sf{escala}.jsonl"))
+    for modo, filas in [('completo', resumen['filas'] + len(fact_incidencias)), ('incremental', 0)]:
+        with bench.fase(escala, f"run_etl_{modo}", filas):
+            if not etl.run_etl(modo=modo, **opciones):
+                raise RuntimeError(f"run_etl en modo {modo} ha fallado (escala {escala}x)")
+
+    # Análisis: los CSV que espera correlacion_impacto, generados a partir de lo cargado
+    ventas_csv = trabajo / f"ventas_sf{escala}_analisis.csv"
+    fact_ventas[['fecha', 'ticketid', 'ingresos_total']].to_csv(ventas_csv, index=False)
+    del fact_ventas
+    ci.VENTAS_PATH = ventas_csv
+    ci.INCIDENCIAS_PATH = INCIDENCIAS_PATH
+    ci.IMAGES_DIR = trabajo / f"images_sf{escala}"
+    ci.AGREGADOS_DIR = trabajo / f"agregados_sf{escala}"
+    ci.ensure_dirs()
+
+    with bench.fase(escala, 'load_data') as m:
+        ventas, incidencias = ci.load_data()
+        m['filas'] = len(ventas) + len(incidencias)
+    with bench.fase(escala, 'build_daily_table', len(ventas) + len(incidencias)):
+        df_diario = ci.build_daily_table(ventas, incidencias)
+    filas_ventas = len(ventas)
+    del ventas
+    # Mismo resultado sin cargar el CSV entero: el pico de memoria no debe crecer con la escala
+    with bench.fase(escala, 'build_daily_table_bloques', filas_ventas):
+        ci.build_daily_table_bloques(incidencias, filas_bloque=100_000)
+    with bench.fase(escala, 'load_daily_table_frio') as m:
+        m['filas'] = len(ci.load_daily_table(recalcular=True)[0])
+    with bench.fase(escala, 'load_daily_table_incremental') as m:
+        m['filas'] = len(ci.load_daily_table()[0])
+    with bench.fase(escala, 'compute_statistics', len(df_diario)):
+        estadisticos = ci.compute_statistics(df_diario, incidencias)
+    for nombre, (funcion, args) in ci.figure_tasks(df_diario, estadisticos).items():
+        with bench.fase(escala, f"plot_{nombre}", len(df_diario)):
+            funcion(*args)
+    tareas = ci.figure_tasks(df_diario, estadisticos)
+    with bench.fase(escala, 'render_figures_pool', len(df_diario)):
+        ci.render_figures(tareas, workers=workers, forzar=True)
+    with bench.fase(escala, 'render_figures_cache', len(df_diario)):
+        ci.render_figures(tareas, workers=workers)
+    with bench.fase(escala, 'build_insights_markdown', len(df_diario)):
+        ci.build_insights_markdown(df_diario=df_diario, **estadisticos)
+
+# =====================================================
+# BASELINE
+# =====================================================
+
+def comparar(resultados: List[dict], baseline: List[dict], umbral: float) -> List[dict]:
+    """Fases cuyo tiempo o pico de memoria empeoran más de `umbral` respecto al baseline"""
+    previos = {(r['escala'], r['fase']): r for r in baseline}
+    regresiones = []
+    for actual in resultados:
+        previo = previos.get((actual['escala'], actual['fase']))
+        if previo is None:
+            continue
+        if (actual['segundos'] > previo['segundos'] * (1 + umbral)
+                and actual['segundos'] - previo['segundos'] > MIN_DELTA_SEGUNDOS):
+            regresiones.append({**actual, 'metrica': 'segundos',
+                                'baseline': previo['segundos'], 'actual': actual['segundos']})
+        if (actual.get('delta_memoria_mb') is not None and previo.get('delta_memoria_mb') is not None
+                and actual['delta_memoria_mb'] > previo['delta_memoria_mb'] * (1 + umbral)
+                and actual['delta_memoria_mb'] - previo['delta_memoria_mb'] > MIN_DELTA_MEMORIA_MB):
+            regresiones.append({**actual, 'metrica': 'delta_memoria_mb',
+                                'baseline': previo['delta_memoria_mb'], 'actual': actual['delta_memoria_mb']})
+    return regresiones
+
+def _entorno(dsn: str) -> Dict[str, str]:
+    conn = psycopg2.connect(dsn)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SHOW server_version")
+        version_pg = cursor.fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'psycopg2': psycopg2.__version__.split()[0],
+        'postgresql': version_pg,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+# =====================================================
+# EJECUTAR
+# =====================================================
+
+def parse_args(argv=None):
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end del ETL y del análisis")
+    parser.add_argument('--escalas', type=int, nargs='+', default=ESCALAS,
+                        help=f"Factores de escala del generador (por defecto {ESCALAS})")
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_PG_DSN'),
+                        help="Servidor PostgreSQL existente (o BENCH_PG_DSN); sin él se usa un cluster temporal")
+    parser.add_argument('--pg-bin', type=Path, default=None, help="Directorio con initdb y pg_ctl")
+    parser.add_argument('--workers', type=int, default=etl.EXTRACT_WORKERS, help="Conexiones de extracción y procesos de figuras")
+    parser.add_argument('--resultados', type=Path, default=RESULTADOS_PATH, help="JSON de salida")
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help="JSON de referencia")
+    parser.add_argument('--umbral', type=float, default=UMBRAL_REGRESION,
+                        help=f"Empeoramiento tolerado (por defecto {UMBRAL_REGRESION:.0%})")
+    parser.add_argument('--guardar-baseline', action='store_true',
+                        help="Guarda esta ejecución como nuevo baseline")
+    parser.add_argument('--verbose', action='store_true', help="Muestra también el log del ETL")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    bench = Benchmark()
+    with tempfile.TemporaryDirectory(prefix='bench_etl_') as tmp, \
+            base_datos_temporal(args.dsn, args.pg_bin) as dsn:
+        entorno = _entorno(dsn)
+        for escala in args.escalas:
+            medir_escala(bench, escala, dsn, Path(tmp), args.workers)
+
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'escalas': args.escalas,
+        'entorno': entorno,
+        'resultados': bench.resultados,
+    }
+    args.resultados.parent.mkdir(parents=True, exist_ok=True)
+    args.resultados.write_text(json.dumps(informe, indent=2, ensure_ascii=False), encoding='utf-8')
+    logger.info(f"\n💾 Resultados guardados en {args.resultados}")
+
+    if args.guardar_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(informe, indent=2, ensure_ascii=False), encoding='utf-8')
+        logger.info(f"📌 Baseline actualizado: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        logger.info("ℹ️  Sin baseline con el que comparar (usa --guardar-baseline)")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding='utf-8'))['resultados']
+    regresiones = comparar(bench.resultados, baseline, args.umbral)
+    if not regresiones:
+        logger.info(f"✅ Sin regresiones respecto a {args.baseline.name} (umbral {args.umbral:.0%})")
+        return 0
+
+    logger.error(f"❌ {len(regresiones)} regresiones respecto a {args.baseline.name} (umbral {args.umbral:.0%}):")
+    for r in regresiones:
+        logger.error(f"   - [{r['escala']}x] {r['fase']}: {r['metrica']} {r['baseline']} → {r['actual']} "
+                     f"(+{(r['actual'] / r['baseline'] - 1) if r['baseline'] else float('inf'):.0%})")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+=====================================================
+ESQUEMA DE TIPOS COMPARTIDO (ETL + ANÁLISIS)
+=====================================================
+Tipos compactos para todas las tablas raw y procesadas:
+
+- category para textos con pocos valores distintos
+  (ruta, producto, severidad, tipo de incidencia, día)
+- int32/int16 para ids y cantidades (con comprobación
+  de rango; si hay nulos se usa el entero nullable)
+- datetime64 para fechas
+- clave entera (fecha, ruta) en lugar del texto
+  "YYYY-MM-DD_RUTA" para merges y agrupaciones
+
+Los lectores aplican el esquema al parsear (read_csv
+con dtype/parse_dates) o justo después de extraer de
+PostgreSQL, y `resumen_memoria` cuantifica el ahorro.
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# DOMINIOS CONOCIDOS (categorías fijas → mismos códigos en todos los bloques)
+# =====================================================
+
+SEVERIDADES = ['Baja', 'Media', 'Alta']
+DIAS_SEMANA = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MESES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+         'August', 'September', 'October', 'November', 'December']
+
+SEVERIDAD = CategoricalDtype(SEVERIDADES, ordered=True)
+DIA_SEMANA = CategoricalDtype(DIAS_SEMANA, ordered=True)
+MES = CategoricalDtype(MESES, ordered=True)
+CATEGORIA = 'category'   # Categorías inferidas de los datos
+FECHA = 'datetime64[ns]'
+
+# =====================================================
+# ESQUEMAS POR TABLA
+# =====================================================
+
+# Raw (public.*_raw): nombres de columna tal como los devuelve PostgreSQL
+ESQUEMA_CALENDARIO = {
+    'fecha': FECHA, 'anio': 'int16', 'mesnum': 'int8', 'mes': MES, 'dia': 'int8',
+    'diasemana': DIA_SEMANA, 'semanaiso': 'int8', 'eslaborable': 'bool',
+}
+ESQUEMA_PRODUCTOS = {'productoid': 'int16'}
+ESQUEMA_RUTAS = {'rutaid': 'int16'}
+ESQUEMA_VENTAS = {
+    'venta_id': 'int64', 'ticketid': 'int32', 'fecha': FECHA, 'rutaid': 'int16', 'productoid': 'int16',
+    'fecha_ruta': CATEGORIA, 'cantidad': 'int16', 'preciounit': 'float64', 'pasajeros': 'int16',
+    'objetivoventas': 'int32',
+}
+ESQUEMA_INCIDENCIAS = {
+    'incidenciaid': 'int32', 'fecha': FECHA, 'ruta': CATEGORIA, 'fecha_ruta': CATEGORIA,
+    'tipoincidencia': CATEGORIA, 'severidad': SEVERIDAD, 'duracionmin': 'int16', 'rutaid': 'int16',
+}
+
+# Procesados (data/processed, exportados de analytics). El análisis no lee los textos
+# fecha_ruta / ticketid_producto: usa la clave entera calculada a partir de fecha + rutaid
+COLUMNAS_TEXTO_CLAVE = ('fecha_ruta', 'ticketid_producto')
+ESQUEMA_VENTAS_PROCESADAS = {
+    'venta_id': 'int64', 'ticketid': 'int32', 'productoid': 'int16', 'producto': CATEGORIA,
+    'fecha': FECHA, 'rutaid': 'int16', 'cantidad': 'int16', 'preciounit': 'float64',
+    'ingresos_total': 'float64', 'pasajeros': 'int16', 'objetivoventas': 'float64',
+}
+ESQUEMA_INCIDENCIAS_PROCESADAS = {k: v for k, v in ESQUEMA_INCIDENCIAS.items() if k not in COLUMNAS_TEXTO_CLAVE}
+
+# Salida del generador (Ventas_Realistas*.csv)
+ESQUEMA_VENTAS_GENERADAS = {
+    'TicketID': 'int32', 'Fecha': FECHA, 'Ruta': CATEGORIA, 'Fecha-Ruta': CATEGORIA,
+    'Producto': CATEGORIA, 'Cantidad': 'int16', 'PrecioUnit': 'float64', 'Pasajeros': 'int16',
+    'ObjetivoVentas': 'int32', 'DiaSemana': DIA_SEMANA,
+}
+
+ESQUEMAS: Dict[str, Dict[str, object]] = {
+    'calendario': ESQUEMA_CALENDARIO,
+    'productos': ESQUEMA_PRODUCTOS,
+    'rutas': ESQUEMA_RUTAS,
+    'ventas': ESQUEMA_VENTAS,
+    'incidencias': ESQUEMA_INCIDENCIAS,
+    'ventas_procesadas': ESQUEMA_VENTAS_PROCESADAS,
+    'incidencias_procesadas': ESQUEMA_INCIDENCIAS_PROCESADAS,
+    'ventas_generadas': ESQUEMA_VENTAS_GENERADAS,
+}
+
+# =====================================================
+# CLAVE ENTERA (fecha, ruta)
+# =====================================================
+
+EPOCA_CLAVE = pd.Timestamp('2000-01-01')
+RUTAS_POR_DIA = 1000  # rutaid < 1000 → clave = días_desde_2000 * 1000 + rutaid (cabe en int32)
+
+def codificar_fecha_ruta(fechas: pd.Series, rutaids: pd.Series) -> pd.Series:
+    """Clave int32 equivalente a "YYYY-MM-DD_RUTA" a partir de fecha y rutaid"""
+    dias = (pd.to_datetime(fechas) - EPOCA_CLAVE).dt.days.to_numpy(dtype=np.int64)
+    return pd.Series((dias * RUTAS_POR_DIA + rutaids.to_numpy(dtype=np.int64)).astype(np.int32),
+                     index=fechas.index, name='clave_fecha_ruta')
+
+def decodificar_fecha_ruta(claves: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Inversa de codificar_fecha_ruta: (fechas, rutaids)"""
+    dias, rutaids = np.divmod(claves.to_numpy(dtype=np.int64), RUTAS_POR_DIA)
+    fechas = pd.Series(EPOCA_CLAVE + pd.to_timedelta(dias, unit='D'), index=claves.index, name='fecha')
+    return fechas, pd.Series(rutaids.astype(np.int16), index=claves.index, name='rutaid')
+
+def clave_desde_texto(fecha_ruta: pd.Series, rutas: Mapping[str, int]) -> pd.Series:
+    """Clave entera a partir del texto "YYYY-MM-DD_RUTA" (se parsea una vez por valor distinto)"""
+    codigos, distintos = pd.factorize(fecha_ruta)
+    partes = pd.Series(distintos, dtype=object).str.split('_', n=1, expand=True)
+    claves_distintas = codificar_fecha_ruta(pd.to_datetime(partes[0]), partes[1].map(rutas))
+    return pd.Series(claves_distintas.to_numpy()[codigos], index=fecha_ruta.index, name='clave_fecha_ruta')
+
+# =====================================================
+# APLICAR / LEER
+# =====================================================
+
+def _tipo_entero(serie: pd.Series, dtype: str) -> str:
+    """El entero pedido si cabe; si no, int64. Con nulos, su versión nullable (Int16...)"""
+    valores = pd.to_numeric(serie, errors='coerce')
+    limites = np.iinfo(dtype)
+    minimo, maximo = valores.min(), valores.max()
+    if pd.notna(minimo) and (minimo < limites.min or maximo > limites.max):
+        logger.warning(f"  ⚠️ {serie.name}: valores fuera de rango para {dtype}, se mantiene int64")
+        dtype = 'int64'
+    return dtype.capitalize() if valores.isna().any() else dtype
+
+def _dominio(serie: pd.Series, dtype: CategoricalDtype) -> CategoricalDtype:
+    """Categorías fijas del dominio; si hay valores fuera de él se avisa y se añaden al final
+    (astype los convertiría en NaN sin decir nada)"""
+    distintos = serie.cat.categories if isinstance(serie.dtype, CategoricalDtype) else pd.unique(serie.dropna())
+    conocidos = set(dtype.categories)
+    desconocidos = [v for v in distintos if v not in conocidos]
+    if not desconocidos:
+        return dtype
+    logger.warning(f"  ⚠️ {serie.name}: valores fuera del dominio {list(dtype.categories)}: "
+                   f"{', '.join(map(str, desconocidos[:5]))}{'...' if len(desconocidos) > 5 else ''}")
+    return CategoricalDtype(list(dtype.categories) + desconocidos, ordered=dtype.ordered)
+
+def _tipos_lectura(esquema: Mapping[str, object], columnas: Iterable[str]) -> Dict[str, object]:
+    """dtype para read_csv: los enteros se leen como Int64 (read_csv no comprueba el rango de int16 /
+    int32 y daría la vuelta sin avisar) y aplicar_esquema los reduce con _tipo_entero"""
+    tipos = {}
+    for columna in columnas:
+        dtype = esquema.get(columna)
+        if dtype is None or dtype == FECHA:
+            continue
+        tipos[columna] = 'Int64' if isinstance(dtype, str) and dtype.startswith('int') else dtype
+    return tipos
+
+def aplicar_esquema(df: pd.DataFrame, esquema: Union[str, Mapping[str, object]]) -> pd.DataFrame:
+    """Convierte las columnas presentes en `df` a los tipos compactos del esquema"""
+    esquema = ESQUEMAS[esquema] if isinstance(esquema, str) else esquema
+    conversiones = {}
+    for columna, dtype in esquema.items():
+        if columna not in df.columns or df[columna].dtype == dtype:
+            continue
+        serie = df[columna]
+        if dtype == FECHA:
+            conversiones[columna] = pd.to_datetime(serie)
+        elif isinstance(dtype, str) and dtype.startswith('int'):
+            conversiones[columna] = pd.to_numeric(serie).astype(_tipo_entero(serie, dtype))
+        elif isinstance(dtype, CategoricalDtype) and dtype.categories is not None:
+            conversiones[columna] = serie.astype(_dominio(serie, dtype))
+        else:
+            conversiones[columna] = serie.astype(dtype)
+    return df.assign(**conversiones) if conversiones else df
+
+def leer_csv(ruta: Union[str, Path], esquema: Union[str, Mapping[str, object]],
+             excluir: Sequence[str] = (), **kwargs) -> pd.DataFrame:
+    """read_csv con los tipos del esquema aplicados al parsear (sin leer las columnas `excluir`)"""
+    esquema = ESQUEMAS[esquema] if isinstance(esquema, str) else esquema
+    fechas = [c for c, t in esquema.items() if t == FECHA]
+    if excluir:
+        kwargs.setdefault('usecols', lambda c: c.strip() not in excluir)
+    # parse_dates solo con las columnas que existan en el fichero
+    cabecera = pd.read_csv(ruta, nrows=0, **{k: v for k, v in kwargs.items() if k in ('encoding', 'sep')})
+    presentes = set(cabecera.columns)
+    try:
+        df = pd.read_csv(ruta, dtype=_tipos_lectura(esquema, presentes),
+                         parse_dates=[c for c in fechas if c in presentes], **kwargs)
+    except (ValueError, OverflowError):
+        # Enteros fuera de int64 o texto en una columna entera: se leen sin tipo y se convierten con comprobaciones
+        df = pd.read_csv(ruta, parse_dates=[c for c in fechas if c in presentes], **kwargs)
+    return aplicar_esquema(df, esquema)
+
+def leer_csv_bloques(ruta: Union[str, Path], esquema: Union[str, Mapping[str, object]], tam_bloque: int,
+                     columnas: Optional[Sequence[str]] = None, **kwargs) -> Iterator[pd.DataFrame]:
+    """read_csv por bloques de `tam_bloque` filas, solo con `columnas` y los tipos del esquema al parsear
+    (para ficheros que no caben en memoria)"""
+    esquema = ESQUEMAS[esquema] if isinstance(esquema, str) else esquema
+    cabecera = pd.read_csv(ruta, nrows=0, **{k: v for k, v in kwargs.items() if k in ('encoding', 'sep')})
+    leidas = [c for c in cabecera.columns if columnas is None or c.strip() in columnas]
+    fechas = [c for c in leidas if esquema.get(c) == FECHA]
+    with pd.read_csv(ruta, usecols=leidas, dtype=_tipos_lectura(esquema, leidas), parse_dates=fechas, chunksize=tam_bloque,
+                     **kwargs) as lector:
+        for bloque in lector:
+            yield aplicar_esquema(bloque, esquema)
+
+# =====================================================
+# INFORME DE MEMORIA
+# =====================================================
+
+def memoria_mb(df: pd.DataFrame) -> float:
+    """Memoria real del DataFrame (incluye el contenido de los textos)"""
+    return df.memory_usage(index=False, deep=True).sum() / 1024 ** 2
+
+def memoria_sin_esquema_mb(df: pd.DataFrame) -> float:
+    """Estimación de la memoria con los tipos por defecto de pandas (object / int64 / float64)"""
+    total = 0
+    for columna in df.columns:
+        serie = df[columna]
+        if isinstance(serie.dtype, CategoricalDtype) or pd.api.types.is_string_dtype(serie):
+            total += serie.astype(object).memory_usage(index=False, deep=True)
+        else:
+            total += len(serie) * 8
+    return total / 1024 ** 2
+
+def resumen_memoria(nombre: str, df: pd.DataFrame, antes_mb: Optional[float] = None) -> str:
+    """Línea de log: memoria actual y ahorro frente a `antes_mb` (o a la estimación sin esquema)"""
+    despues = memoria_mb(df)
+    antes = memoria_sin_esquema_mb(df) if antes_mb is None else antes_mb
+    ahorro = (1 - despues / antes) * 100 if antes > 0 else 0.0
+    return f"💾 {nombre}: {antes:.2f} MB → {despues:.2f} MB ({ahorro:.0f}% menos)"
@@ -0,0 +1,275 @@
+"""
+=====================================================
+PLANIFICADOR DAG DE ETAPAS DEL ETL
+=====================================================
+El pipeline se declara como un grafo de etapas con
+nombre, cada una con sus entradas y salidas (valores
+con nombre) y, si hace falta, etapas que deben haber
+terminado antes aunque no le pasen ningún valor (p. ej.
+los hechos esperan a que sus dimensiones estén en BD).
+
+- Las etapas cuyas dependencias ya han terminado se
+  lanzan en un pool de hilos de tamaño configurable:
+  transformaciones y cargas independientes se solapan
+- Con un solo worker se ejecuta en serie en orden
+  topológico (mismo orden de declaración si es válido)
+- Si una etapa falla no se lanzan más; se espera a las
+  que están en marcha y se relanza el primer error
+- Al terminar se loguea la línea temporal de cada
+  etapa y el camino crítico: la cadena de dependencias
+  más larga, que es lo que limita la duración total
+- Checkpoint (opcional): cada etapa terminada guarda
+  sus salidas y una marca en runs/<run_id>/; al
+  reanudar esa ejecución se cargan en lugar de repetir
+  las etapas, y se sigue desde la que falló
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import contextlib
+import json
+import logging
+import pickle
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from etl_metricas import MetricasETL
+
+logger = logging.getLogger(__name__)
+
+DAG_WORKERS = 4  # Etapas en ejecución a la vez
+RUNS_DIR = Path('runs')  # Checkpoints por ejecución, junto a etl_pipeline.log
+
+
+class Etapa:
+    """Etapa del DAG: `funcion(*entradas)` devuelve sus salidas (una, una tupla o ninguna)"""
+
+    def __init__(self, nombre: str, funcion: Callable[..., Any], entradas: Sequence[str] = (),
+                 salidas: Sequence[str] = (), despues: Sequence[str] = ()):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.entradas = tuple(entradas)
+        self.salidas = tuple(salidas)
+        self.despues = tuple(despues)  # Etapas que deben terminar antes (sin pasar valores)
+
+    def __repr__(self):
+        return f"Etapa({self.nombre!r})"
+
+
+class CheckpointDAG:
+    """Salidas y marcas de las etapas terminadas de una ejecución (runs/<run_id>/)"""
+
+    def __init__(self, run_id: str, directorio: Path = RUNS_DIR):
+        self.run_id = run_id
+        self.directorio = Path(directorio) / run_id
+        self.directorio.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def existe(run_id: str, directorio: Path = RUNS_DIR) -> bool:
+        return (Path(directorio) / run_id / 'parametros.json').exists()
+
+    def _marca(self, nombre: str) -> Path:
+        return self.directorio / f"{nombre.replace(':', '_')}.ok.json"
+
+    def _escribir(self, ruta: Path, contenido: bytes):
+        temporal = ruta.with_suffix(ruta.suffix + '.tmp')
+        temporal.write_bytes(contenido)
+        temporal.replace(ruta)  # Un fallo a mitad no deja un fichero que parezca válido
+
+    def completada(self, nombre: str) -> bool:
+        return self._marca(nombre).exists()
+
+    def guardar(self, nombre: str, salidas: Dict[str, Any], segundos: float):
+        """Guarda las salidas y, después, la marca de etapa terminada"""
+        for salida, valor in salidas.items():
+            self._escribir(self.directorio / f"{salida}.pkl", pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+        marca = {'etapa': nombre, 'salidas': list(salidas), 'segundos': round(segundos, 4),
+                 'fin': datetime.now().isoformat()}
+        self._escribir(self._marca(nombre), json.dumps(marca, ensure_ascii=False).encode('utf-8'))
+
+    def cargar(self, nombre: str) -> Dict[str, Any]:
+        """Salidas guardadas de una etapa terminada"""
+        marca = json.loads(self._marca(nombre).read_text(encoding='utf-8'))
+        return {salida: pickle.loads((self.directorio / f"{salida}.pkl").read_bytes())
+                for salida in marca['salidas']}
+
+    def guardar_parametros(self, parametros: Dict[str, Any]):
+        """Parámetros de la ejecución: al reanudar se usan estos y no los de la línea de comandos"""
+        self._escribir(self.directorio / 'parametros.json',
+                       json.dumps(parametros, ensure_ascii=False, default=str).encode('utf-8'))
+
+    def leer_parametros(self) -> Dict[str, Any]:
+        return json.loads((self.directorio / 'parametros.json').read_text(encoding='utf-8'))
+
+    def borrar(self):
+        """La ejecución ha terminado bien: ya no hace falta reanudarla"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+class PlanificadorDAG:
+    """Valida el grafo de etapas y lo ejecuta respetando dependencias"""
+
+    def __init__(self, etapas: Iterable[Etapa], workers: int = DAG_WORKERS,
+                 metricas: Optional[MetricasETL] = None, checkpoint: Optional[CheckpointDAG] = None):
+        self.etapas: Dict[str, Etapa] = {}
+        for etapa in etapas:
+            if etapa.nombre in self.etapas:
+                raise ValueError(f"Etapa duplicada en el DAG: {etapa.nombre}")
+            self.etapas[etapa.nombre] = etapa
+        self.workers = max(1, workers)
+        self.metricas = metricas
+        self.checkpoint = checkpoint
+        self.productor: Dict[str, str] = {}
+        for etapa in self.etapas.values():
+            for salida in etapa.salidas:
+                if salida in self.productor:
+                    raise ValueError(f"La salida '{salida}' la producen {self.productor[salida]} y {etapa.nombre}")
+                self.productor[salida] = etapa.nombre
+        self.tiempos: Dict[str, Tuple[float, float]] = {}  # Inicio y fin (s desde el arranque)
+        self.iniciales: set = set()
+        self.reanudadas: List[str] = []  # Etapas cargadas del checkpoint en lugar de ejecutarse
+
+    def dependencias(self, etapa: Etapa, iniciales: Iterable[str] = ()) -> List[str]:
+        """Etapas de las que depende (productoras de sus entradas + las de `despues`)"""
+        iniciales = set(iniciales)
+        deps = []
+        for entrada in etapa.entradas:
+            if entrada in self.productor:
+                deps.append(self.productor[entrada])
+            elif entrada not in iniciales:
+                raise ValueError(f"{etapa.nombre}: ninguna etapa produce la entrada '{entrada}'")
+        for previa in etapa.despues:
+            if previa not in self.etapas:
+                raise ValueError(f"{etapa.nombre}: depende de una etapa inexistente '{previa}'")
+            deps.append(previa)
+        return list(dict.fromkeys(deps))
+
+    def orden_topologico(self, iniciales: Iterable[str] = ()) -> List[str]:
+        """Orden de ejecución en serie (Kahn, estable respecto al orden de declaración)"""
+        deps = {nombre: set(self.dependencias(etapa, iniciales)) for nombre, etapa in self.etapas.items()}
+        orden: List[str] = []
+        listas = [nombre for nombre in self.etapas if not deps[nombre]]
+        while listas:
+            nombre = listas.pop(0)
+            orden.append(nombre)
+            for otra in self.etapas:
+                if nombre in deps[otra]:
+                    deps[otra].discard(nombre)
+                    if not deps[otra] and otra not in orden and otra not in listas:
+                        listas.append(otra)
+        if len(orden) != len(self.etapas):
+            raise ValueError(f"Ciclo en el DAG entre: {', '.join(n for n in self.etapas if n not in orden)}")
+        return orden
+
+    def _ejecutar_etapa(self, etapa: Etapa, valores: Dict[str, Any], origen: float) -> Dict[str, Any]:
+        medicion = self.metricas.etapa(etapa.nombre) if self.metricas is not None else contextlib.nullcontext()
+        inicio = time.perf_counter() - origen
+        try:
+            with medicion:
+                resultado = etapa.funcion(*(valores[entrada] for entrada in etapa.entradas))
+        finally:
+            self.tiempos[etapa.nombre] = (inicio, time.perf_counter() - origen)
+        if not etapa.salidas:
+            salidas = {}
+        elif len(etapa.salidas) == 1:
+            salidas = {etapa.salidas[0]: resultado}
+        else:
+            salidas = dict(zip(etapa.salidas, resultado))
+        if self.checkpoint is not None:
+            fin = self.tiempos[etapa.nombre][1]
+            self.checkpoint.guardar(etapa.nombre, salidas, fin - inicio)
+        return salidas
+
+    def ejecutar(self, iniciales: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Ejecuta el DAG y devuelve todos los valores producidos (más los iniciales)"""
+        valores = dict(iniciales or {})
+        self.iniciales = set(valores)
+        orden = self.orden_topologico(self.iniciales)
+        deps = {nombre: set(self.dependencias(self.etapas[nombre], self.iniciales)) for nombre in orden}
+        terminadas: set = set()
+        en_curso: Dict[Future, str] = {}
+        error: Optional[BaseException] = None
+        self.tiempos = {}
+        self.reanudadas = []
+        if self.checkpoint is not None:
+            for nombre in orden:
+                if self.checkpoint.completada(nombre):
+                    valores.update(self.checkpoint.cargar(nombre))
+                    terminadas.add(nombre)
+                    self.reanudadas.append(nombre)
+            if self.reanudadas:
+                logger.info(f"⏭️  {len(self.reanudadas)} etapas ya terminadas en {self.checkpoint.run_id}: "
+                            f"{', '.join(self.reanudadas)}")
+        origen = time.perf_counter()
+        logger.info(f"🧭 DAG: {len(orden) - len(terminadas)} etapas, hasta {self.workers} en paralelo")
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='etapa') as executor:
+            while len(terminadas) < len(orden):
+                if error is None:
+                    lanzadas = set(en_curso.values())
+                    for nombre in orden:
+                        if len(en_curso) >= self.workers:
+                            break
+                        if nombre not in terminadas and nombre not in lanzadas and deps[nombre] <= terminadas:
+                            futuro = executor.submit(self._ejecutar_etapa, self.etapas[nombre], valores, origen)
+                            en_curso[futuro] = nombre
+                            lanzadas.add(nombre)
+                if not en_curso:
+                    break
+                hechos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    nombre = en_curso.pop(futuro)
+                    try:
+                        valores.update(futuro.result())
+                    except BaseException as e:
+                        logger.error(f"  ❌ Etapa {nombre} fallida: {e}")
+                        if error is None:
+                            error = e
+                    terminadas.add(nombre)
+
+        if error is not None:
+            raise error
+        return valores
+
+    def camino_critico(self) -> Tuple[List[str], float]:
+        """Cadena de dependencias con mayor duración acumulada (según los tiempos medidos)"""
+        acumulado: Dict[str, float] = {}
+        previa: Dict[str, Optional[str]] = {}
+        for nombre in self.orden_topologico(self.iniciales):
+            if nombre not in self.tiempos:
+                continue
+            inicio, fin = self.tiempos[nombre]
+            candidatas = [d for d in self.dependencias(self.etapas[nombre], self.iniciales) if d in acumulado]
+            mejor = max(candidatas, key=acumulado.get, default=None)
+            previa[nombre] = mejor
+            acumulado[nombre] = (fin - inicio) + (acumulado[mejor] if mejor else 0.0)
+        if not acumulado:
+            return [], 0.0
+        nombre = max(acumulado, key=acumulado.get)
+        total = acumulado[nombre]
+        camino = []
+        while nombre is not None:
+            camino.append(nombre)
+            nombre = previa[nombre]
+        return camino[::-1], total
+
+    def registrar_resumen(self):
+        """Loguea la línea temporal de las etapas y el camino crítico"""
+        if not self.tiempos:
+            return
+        camino, critico = self.camino_critico()
+        reloj = max(fin for _, fin in self.tiempos.values())
+        trabajo = sum(fin - inicio for inicio, fin in self.tiempos.values())
+        logger.info(f"🧭 Camino crítico: {critico:.2f}s de {reloj:.2f}s de reloj "
+                    f"(trabajo total {trabajo:.2f}s, paralelismo medio {trabajo / reloj if reloj > 0 else 1:.1f}x)")
+        logger.info(f"   {' → '.join(camino)}")
+        logger.info("⏱️  Línea temporal del DAG (* = camino crítico):")
+        for nombre, (inicio, fin) in sorted(self.tiempos.items(), key=lambda item: item[1]):
+            marca = '*' if nombre in camino else ' '
+            logger.info(f"   {marca} {nombre:<32} {inicio:>7.2f}s → {fin:>7.2f}s  ({fin - inicio:.2f}s)")
@@ -0,0 +1,215 @@
+"""
+=====================================================
+EXTRACCIÓN DE VARIAS FUENTES RAW (REGIONES)
+=====================================================
+Cada región / unidad de negocio tiene su propia copia
+del schema public.*_raw. En lugar de una ejecución
+del ETL por base de datos:
+
+- Se extraen todas las fuentes a la vez con asyncio;
+  las queries (psycopg2, bloqueantes) van en hilos y
+  un semáforo por fuente limita sus conexiones
+  simultáneas
+- Cada fila se etiqueta con su fuente_id y las tablas
+  de todas las fuentes se unen antes de transformar:
+  un único destino analytics
+- Las dimensiones se suponen un catálogo común: la
+  misma ruta / producto / fecha tiene el mismo id en
+  todas las regiones (los hechos de cada fuente traen
+  esos ids). Si dos fuentes dan valores distintos para
+  un mismo id la unión falla en lugar de quedarse con
+  uno al azar
+- Una fuente lenta o caída no bloquea a las demás: al
+  agotar su timeout se cancelan sus queries en el
+  servidor y se aparta con su error
+- Métricas propias por fuente (fuente:<id>) y por
+  tabla (extract:<id>:<tabla>)
+
+Fichero de fuentes (JSON):
+    [{"id": "norte", "dsn": "host=... dbname=... user=...",
+      "max_conexiones": 2, "timeout": 900}, ...]
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import psycopg2
+
+from esquema_tipos import aplicar_esquema
+from etl_metricas import MetricasETL
+
+logger = logging.getLogger(__name__)
+
+FUENTE_PRINCIPAL = 'principal'  # fuente_id de las filas cargadas con DB_CONFIG (una sola fuente)
+FUENTE_CONEXIONES = 2           # Queries simultáneas por fuente
+FUENTE_TIMEOUT = 900            # Segundos para extraer todas las tablas de una fuente
+CONNECT_TIMEOUT = 30            # Segundos para abrir cada conexión
+
+# Clave de cada dimensión raw (debe identificar el mismo registro en todas las fuentes)
+CLAVES_DIMENSIONES = {'calendario': 'fecha', 'productos': 'productoid', 'rutas': 'rutaid'}
+
+
+class Fuente:
+    """Base de datos raw de una región / unidad de negocio"""
+
+    def __init__(self, fuente_id: str, dsn: str, max_conexiones: int = FUENTE_CONEXIONES,
+                 timeout: float = FUENTE_TIMEOUT):
+        if not fuente_id or '/' in fuente_id:
+            raise ValueError(f"Identificador de fuente no válido: {fuente_id!r}")
+        self.fuente_id = fuente_id
+        self.dsn = dsn
+        self.max_conexiones = max(1, int(max_conexiones))
+        self.timeout = float(timeout)
+
+    def conectar(self):
+        return psycopg2.connect(self.dsn, connect_timeout=CONNECT_TIMEOUT)
+
+
+class ResultadoFuente:
+    """Tablas extraídas de una fuente, o el error por el que se apartó"""
+
+    def __init__(self, fuente_id: str, datos: Dict[str, pd.DataFrame], error: Optional[str], segundos: float):
+        self.fuente_id = fuente_id
+        self.datos = datos
+        self.error = error
+        self.segundos = segundos
+
+
+def cargar_fuentes(ruta: str) -> List[Fuente]:
+    """Lee el fichero JSON de fuentes (lista de {id, dsn, max_conexiones?, timeout?})"""
+    definiciones = json.loads(Path(ruta).read_text(encoding='utf-8'))
+    fuentes = [Fuente(d['id'], d['dsn'], d.get('max_conexiones', FUENTE_CONEXIONES),
+                      d.get('timeout', FUENTE_TIMEOUT)) for d in definiciones]
+    ids = [f.fuente_id for f in fuentes]
+    repetidos = sorted({i for i in ids if ids.count(i) > 1})
+    if repetidos:
+        raise ValueError(f"Fuentes repetidas en {ruta}: {', '.join(repetidos)}")
+    if not fuentes:
+        raise ValueError(f"{ruta} no define ninguna fuente")
+    return fuentes
+
+
+async def _extraer_fuente(fuente: Fuente, tablas: List[str],
+                          extraer_tabla: Callable[[object, str, str], pd.DataFrame],
+                          metricas: Optional[MetricasETL]) -> ResultadoFuente:
+    """Extrae las tablas de una fuente (como mucho max_conexiones a la vez) dentro de su timeout"""
+    semaforo = asyncio.Semaphore(fuente.max_conexiones)
+    abiertas = set()
+    cerrojo = threading.Lock()
+    cancelada = threading.Event()
+
+    def extraer(name: str) -> pd.DataFrame:  # Se ejecuta en un hilo
+        nombre_etapa = f"extract:{fuente.fuente_id}:{name}"
+        etapa = metricas.etapa(nombre_etapa) if metricas is not None else contextlib.nullcontext({})
+        with etapa as medicion:
+            conn = fuente.conectar()
+            with cerrojo:
+                abiertas.add(conn)
+                if cancelada.is_set():  # La fuente se apartó mientras se conectaba
+                    abiertas.discard(conn)
+                    conn.close()
+                    raise RuntimeError(f"fuente {fuente.fuente_id} apartada")
+            try:
+                df = extraer_tabla(conn, fuente.fuente_id, name)
+            finally:
+                with cerrojo:
+                    abiertas.discard(conn)
+                conn.close()
+            medicion['fuente'] = fuente.fuente_id
+            medicion['filas'] = len(df)
+            medicion['bytes'] = int(df.memory_usage(deep=True).sum())
+        return df.assign(fuente_id=fuente.fuente_id)
+
+    async def tabla(name: str) -> Tuple[str, pd.DataFrame]:
+        async with semaforo:
+            return name, await asyncio.to_thread(extraer, name)
+
+    etapa = metricas.etapa(f"fuente:{fuente.fuente_id}") if metricas is not None else contextlib.nullcontext({})
+    inicio = time.perf_counter()
+    try:
+        with etapa as medicion:
+            medicion['fuente'] = fuente.fuente_id
+            pares = await asyncio.wait_for(asyncio.gather(*(tabla(name) for name in tablas)), fuente.timeout)
+            datos = dict(pares)
+            medicion['filas'] = sum(len(df) for df in datos.values())
+        return ResultadoFuente(fuente.fuente_id, datos, None, time.perf_counter() - inicio)
+    except Exception as e:
+        # Las queries que sigan en curso (timeout, o las hermanas de la que falló) se cancelan
+        # en el servidor: el hilo termina enseguida y no retiene la conexión
+        with cerrojo:
+            cancelada.set()
+            for conn in abiertas:
+                conn.cancel()
+        error = f"timeout tras {fuente.timeout:g}s" if isinstance(e, asyncio.TimeoutError) else f"{e}".strip()
+        return ResultadoFuente(fuente.fuente_id, {}, error or type(e).__name__, time.perf_counter() - inicio)
+
+
+async def _extraer_todas(fuentes: List[Fuente], tablas: List[str],
+                         extraer_tabla: Callable[[object, str, str], pd.DataFrame],
+                         metricas: Optional[MetricasETL]) -> List[ResultadoFuente]:
+    return await asyncio.gather(*(_extraer_fuente(f, tablas, extraer_tabla, metricas) for f in fuentes))
+
+
+def _comprobar_catalogo(df: pd.DataFrame, name: str, unicas: pd.DataFrame):
+    """Falla si un mismo id de la dimensión llega con valores distintos según la fuente"""
+    clave = CLAVES_DIMENSIONES.get(name)
+    if clave is None or clave not in unicas.columns:
+        return
+    conflictos = unicas.loc[unicas[clave].duplicated(keep=False), clave].unique()
+    if len(conflictos) == 0:
+        return
+    fuentes = sorted(df.loc[df[clave].isin(conflictos), 'fuente_id'].astype(str).unique())
+    ejemplos = ', '.join(str(v) for v in conflictos[:5])
+    raise ValueError(f"Dimensión {name}: {len(conflictos)} {clave} con valores distintos según la fuente "
+                     f"({ejemplos}; fuentes {', '.join(fuentes)}). Las fuentes deben compartir catálogo")
+
+
+def unir_fuentes(resultados: Iterable[ResultadoFuente], tablas: List[str],
+                 etiquetadas: Iterable[str]) -> Dict[str, pd.DataFrame]:
+    """Une cada tabla de todas las fuentes: los hechos conservan fuente_id; las dimensiones
+    (catálogo común) se quedan con una fila por registro idéntico y un id en conflicto es un error"""
+    etiquetadas = set(etiquetadas)
+    datos = {}
+    for name in tablas:
+        partes = [r.datos[name] for r in resultados if r.error is None]
+        df = pd.concat(partes, ignore_index=True)
+        if name in etiquetadas:
+            df['fuente_id'] = df['fuente_id'].astype('category')
+        else:
+            unicas = df.drop(columns='fuente_id').drop_duplicates(ignore_index=True)
+            _comprobar_catalogo(df, name, unicas)
+            df = unicas
+        # Las categorías de cada fuente no coinciden: se recuperan los tipos compactos tras unir
+        datos[name] = aplicar_esquema(df, name)
+    return datos
+
+
+def extraer_fuentes(fuentes: List[Fuente], tablas: List[str],
+                    extraer_tabla: Callable[[object, str, str], pd.DataFrame],
+                    etiquetadas: Iterable[str],
+                    metricas: Optional[MetricasETL] = None) -> Tuple[Dict[str, pd.DataFrame], List[ResultadoFuente]]:
+    """Extrae `tablas` de todas las fuentes a la vez; `extraer_tabla(conn, fuente_id, tabla)`
+    hace la query. Devuelve las tablas unidas de las fuentes disponibles y el resultado de cada una"""
+    logger.info(f"📥 Extrayendo {len(tablas)} tablas de {len(fuentes)} fuentes en paralelo "
+                f"({', '.join(f'{f.fuente_id}×{f.max_conexiones}' for f in fuentes)})...")
+    resultados = asyncio.run(_extraer_todas(fuentes, tablas, extraer_tabla, metricas))
+    for r in resultados:
+        if r.error is None:
+            filas = sum(len(df) for df in r.datos.values())
+            logger.info(f"  ✅ {r.fuente_id}: {filas} filas en {r.segundos:.2f}s")
+        else:
+            logger.error(f"  ❌ {r.fuente_id}: apartada tras {r.segundos:.2f}s ({r.error})")
+    if all(r.error is not None for r in resultados):
+        raise RuntimeError("Ninguna fuente disponible")
+    return unir_fuentes(resultados, tablas, etiquetadas), resultados
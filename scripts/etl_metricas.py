@@ -0,0 +1,208 @@
+"""
+=====================================================
+MÉTRICAS Y PROFILING POR ETAPA DEL ETL
+=====================================================
+Instrumentación estructurada de run_etl: cada etapa
+(conexión, cada query de extract, cada transform,
+cada carga y el commit final) registra duración,
+filas, filas/s, bytes y pico de memoria (RSS) del
+proceso mientras dura la etapa.
+
+- JSON lines: una línea por etapa, apta para jq/pandas
+- Prometheus (opcional): fichero de texto para el
+  textfile collector de node_exporter
+- cProfile (opcional): un .prof por etapa, para ver
+  qué etapa ha empeorado sin tocar código
+  (python -m pstats perfiles/<run>_<etapa>.prof)
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import psutil
+except ImportError:  # Se usa /proc (solo Linux); si no, no se mide memoria
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+METRICAS_PATH = Path('etl_metricas.jsonl')  # Junto a etl_pipeline.log
+PERFILES_DIR = Path('perfiles')
+MUESTREO_MEMORIA = 0.01  # Segundos entre lecturas de RSS
+
+# Etapa activa en el hilo/contexto actual (para acumular bytes desde el código de carga)
+_etapa_actual: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar('etapa_actual', default=None)
+
+
+def rss_actual() -> Optional[int]:
+    """Memoria residente actual del proceso en bytes (None si no se puede medir).
+    No se usa getrusage: ru_maxrss es el máximo histórico del proceso, no el RSS actual"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MedidorMemoria:
+    """Muestrea el RSS en un hilo mientras dura un bloque y guarda el pico"""
+
+    def __init__(self, intervalo: float = MUESTREO_MEMORIA):
+        self.intervalo = intervalo
+        self.inicial = None
+        self.pico = None
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+
+    def _muestrear(self):
+        while not self._parar.wait(self.intervalo):
+            self._registrar()
+
+    def _registrar(self):
+        rss = rss_actual()
+        if rss is not None and (self.pico is None or rss > self.pico):
+            self.pico = rss
+
+    def __enter__(self):
+        self.inicial = rss_actual()
+        self.pico = self.inicial
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+        self._registrar()
+        return False
+
+
+def acumular(filas: int = 0, bytes: int = 0):
+    """Suma filas/bytes a la etapa activa (no hace nada fuera de una etapa)"""
+    etapa = _etapa_actual.get()
+    if etapa is not None:
+        etapa['filas'] += filas
+        etapa['bytes'] += bytes
+
+
+class MetricasETL:
+    """Registro de etapas de una ejecución del ETL"""
+
+    def __init__(self, ruta_jsonl: Optional[Path] = METRICAS_PATH, ruta_prometheus: Optional[Path] = None,
+                 perfilar: Optional[Iterable[str]] = None, dir_perfiles: Path = PERFILES_DIR,
+                 run_id: Optional[str] = None):
+        # run_id explícito al reanudar una ejecución fallida (mismas métricas y checkpoint)
+        self.run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.ruta_jsonl = Path(ruta_jsonl) if ruta_jsonl else None
+        self.ruta_prometheus = Path(ruta_prometheus) if ruta_prometheus else None
+        # None: sin profiling; lista vacía: todas las etapas; si no, solo las indicadas (o sus prefijos)
+        self.perfilar = None if perfilar is None else list(perfilar)
+        self.dir_perfiles = Path(dir_perfiles)
+        self.etapas: List[dict] = []
+        self._lock = threading.Lock()  # La extracción en paralelo registra desde varios hilos
+
+    def _debe_perfilar(self, nombre: str) -> bool:
+        if self.perfilar is None:
+            return False
+        return not self.perfilar or any(nombre == p or nombre.startswith(f"{p}:") for p in self.perfilar)
+
+    @contextlib.contextmanager
+    def etapa(self, nombre: str, filas: int = 0, bytes: int = 0) -> Iterator[dict]:
+        """Mide una etapa; el bloque puede sumar filas/bytes en el dict o con acumular()"""
+        registro = {'run_id': self.run_id, 'etapa': nombre, 'inicio': datetime.now().isoformat(),
+                    'filas': filas, 'bytes': bytes, 'estado': 'ok'}
+        perfil = None
+        if self._debe_perfilar(nombre):
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:  # Ya hay otro profiler activo (p. ej. en otro hilo en Python 3.12+)
+                perfil = None
+        token = _etapa_actual.set(registro)
+        memoria = MedidorMemoria()
+        inicio = time.perf_counter()
+        try:
+            with memoria:
+                yield registro
+        except BaseException:
+            registro['estado'] = 'error'
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            _etapa_actual.reset(token)
+            if perfil is not None:
+                perfil.disable()
+                self.dir_perfiles.mkdir(parents=True, exist_ok=True)
+                ruta = self.dir_perfiles / f"{self.run_id}_{nombre.replace(':', '_')}.prof"
+                perfil.dump_stats(ruta)
+                registro['perfil'] = str(ruta)
+            registro['segundos'] = round(segundos, 4)
+            registro['filas_por_segundo'] = round(registro['filas'] / segundos, 1) if segundos > 0 else None
+            # Solo el pico del proceso: con el DAG en paralelo varias etapas comparten el RSS y
+            # una variación por etapa les atribuiría la memoria de las demás
+            if memoria.pico is not None:
+                registro['pico_rss_mb'] = round(memoria.pico / 1024 ** 2, 1)
+            self._registrar(registro)
+
+    def _registrar(self, registro: dict):
+        with self._lock:
+            self.etapas.append(registro)
+            if self.ruta_jsonl is not None:
+                with open(self.ruta_jsonl, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+
+    def resumen(self) -> List[str]:
+        """Líneas legibles con las etapas ordenadas por duración"""
+        lineas = []
+        for r in sorted(self.etapas, key=lambda r: r['segundos'], reverse=True):
+            lineas.append(f"   - {r['etapa']:<32} {r['segundos']:>8.2f}s  {r['filas']:>10} filas  "
+                          f"{r['bytes'] / 1e6:>8.2f} MB  pico RSS {r.get('pico_rss_mb', '?')} MB")
+        return lineas
+
+    def escribir_prometheus(self, exito: bool):
+        """Vuelca las métricas en formato de texto de Prometheus (escritura atómica)"""
+        if self.ruta_prometheus is None:
+            return
+        metricas = [
+            ('etl_etapa_duracion_segundos', 'Duración de la etapa en segundos', 'segundos', 1),
+            ('etl_etapa_filas', 'Filas procesadas por la etapa', 'filas', 1),
+            ('etl_etapa_bytes', 'Bytes transferidos por la etapa', 'bytes', 1),
+            ('etl_etapa_pico_rss_bytes', 'Pico de memoria residente del proceso durante la etapa',
+             'pico_rss_mb', 1024 ** 2),
+        ]
+        lineas = []
+        for nombre, ayuda, campo, factor in metricas:
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"]
+            for r in self.etapas:
+                if r.get(campo) is not None:
+                    valor = r[campo] * factor
+                    # Enteros tal cual (:g redondea a 6 cifras y pasa a notación científica)
+                    texto = f"{round(valor):d}" if isinstance(r[campo], int) or factor != 1 else repr(float(valor))
+                    lineas.append(f'{nombre}{{etapa="{r["etapa"]}",estado="{r["estado"]}"}} {texto}')
+        lineas += [
+            "# HELP etl_ultima_ejecucion_timestamp_segundos Fin de la última ejecución (epoch)",
+            "# TYPE etl_ultima_ejecucion_timestamp_segundos gauge",
+            f"etl_ultima_ejecucion_timestamp_segundos {time.time():.0f}",
+            "# HELP etl_ultima_ejecucion_exito 1 si la última ejecución terminó bien",
+            "# TYPE etl_ultima_ejecucion_exito gauge",
+            f"etl_ultima_ejecucion_exito {int(exito)}",
+        ]
+        self.ruta_prometheus.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.ruta_prometheus.with_suffix('.tmp')
+        temporal.write_text('\n'.join(lineas) + '\n', encoding='utf-8')
+        temporal.replace(self.ruta_prometheus)
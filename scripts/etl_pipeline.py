@@ -11,13 +11,32 @@ Fecha: 2026-01-24
 =====================================================
 """
 
+import argparse
+import contextlib
 import psycopg2
-from psycopg2.extras import execute_batch
+import psycopg2.errors
+from psycopg2.pool import ThreadedConnectionPool
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from datetime import datetime
+import numpy as np
+from datetime import datetime, date, timedelta
+from decimal import Decimal
 import logging
-from typing import Dict, Tuple
+import re
+import struct
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 import sys
+from pathlib import Path
+
+from staging_cache import StagingCache
+from etl_metricas import METRICAS_PATH, PERFILES_DIR, MetricasETL, acumular
+from esquema_tipos import aplicar_esquema, codificar_fecha_ruta, memoria_mb, resumen_memoria
+from resolucion_claves import ResolutorClaves, registrar_cuarentena
+from etl_dag import DAG_WORKERS, RUNS_DIR, CheckpointDAG, Etapa, PlanificadorDAG
+from etl_fuentes import FUENTE_PRINCIPAL, cargar_fuentes, extraer_fuentes
+from validacion_hechos import ValidadorHechos, ensure_cuarentena, guardar_cuarentena
 
 # =====================================================
 # CONFIGURACIÓN
@@ -43,6 +62,47 @@ DB_CONFIG = {
     'password': 'TU_PASSWORD_AQUI'  # ⚠️ CAMBIAR ESTO
 }
 
+# Carga masiva con COPY FROM STDIN
+COPY_FORMAT = 'text'       # 'text' (CSV) o 'binary' (PGCOPY)
+COPY_CHUNK_SIZE = 50_000   # Filas serializadas por bloque
+COPY_BUFFER_SIZE = 1 << 20 # Bytes leídos por psycopg2 en cada llamada
+
+# Reglas de categorización de productos: categoría → palabras clave (subcadenas).
+# El orden importa: gana la primera categoría con alguna coincidencia.
+REGLAS_CATEGORIA = {
+    'Bebidas': ['agua', 'refresco', 'zumo', 'café', 'bebida'],
+    'Comida': ['bocadillo', 'sandwich', 'hamburguesa', 'menú'],
+    'Snacks': ['chips', 'galleta', 'chocolate', 'snack'],
+}
+CATEGORIA_POR_DEFECTO = 'Otros'
+
+# Extracción en paralelo: una conexión del pool por tabla raw
+EXTRACT_WORKERS = 5
+
+# Extracción en streaming (cursor de servidor) de las tablas grandes
+FETCH_SIZE = 20_000        # Filas por bloque (acota la memoria de pico)
+TABLAS_STREAMING = ['ventas']
+
+# Modo incremental: columna de high-watermark de cada tabla raw.
+# Puede ser 'fecha' o un timestamp de ingesta del lado raw (ej: 'fecha_ingesta').
+# Se extrae con >= para recoger filas tardías del último día; la carga es
+# un UPSERT sobre el grano, así que re-procesar el borde es idempotente.
+WATERMARKS = {
+    'ventas': 'fecha',
+    'incidencias': 'fecha',
+}
+
+# Hechos particionados por mes (RANGE sobre fecha, ver 01_create_analytics_schema.sql).
+# Las claves únicas de estas tablas incluyen la fecha.
+TABLAS_PARTICIONADAS = ['fact_ventas', 'fact_incidencias']
+
+# Intercambio de particiones: DETACH/ATTACH piden ACCESS EXCLUSIVE sobre la tabla padre. Mientras
+# esperan a una lectura larga (DirectQuery) bloquean a todos los lectores que llegan detrás, así que
+# la espera se acota y el intercambio se reintenta (los staging ya preparados se conservan)
+SWAP_LOCK_TIMEOUT = '3s'   # Espera máxima por el bloqueo en cada intento
+SWAP_REINTENTOS = 5
+SWAP_ESPERA = 2.0          # Segundos entre intentos (crece linealmente)
+
 # =====================================================
 # FUNCIONES AUXILIARES
 # =====================================================
@@ -57,30 +117,200 @@ def get_connection():
         logger.error(f"❌ Error conectando a BD: {e}")
         raise
 
-def extract_raw_data(conn) -> Dict[str, pd.DataFrame]:
-    """Extrae datos de las tablas raw"""
+TABLAS_RAW = ['calendario', 'productos', 'rutas', 'ventas', 'incidencias']
+
+def create_pool(max_conn: int) -> ThreadedConnectionPool:
+    """Crea un pool de conexiones seguro entre hilos"""
+    try:
+        pool = ThreadedConnectionPool(1, max_conn, **DB_CONFIG)
+        logger.info(f"✅ Pool de conexiones creado (máx. {max_conn})")
+        return pool
+    except Exception as e:
+        logger.error(f"❌ Error creando pool de conexiones: {e}")
+        raise
+
+@contextlib.contextmanager
+def conexion_pool(pool: ThreadedConnectionPool) -> Iterator:
+    """Conexión prestada del pool; se devuelve sin transacción abierta aunque la etapa falle"""
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+
+def _origen_raw(name: str, watermarks: Optional[Dict[str, str]] = None) -> Tuple[str, str, tuple]:
+    """Tabla raw, filtro WHERE por watermark (o por meses a recargar) y sus parámetros"""
+    watermarks = watermarks or {}
+    valor = watermarks.get(name)
+    if isinstance(valor, list):
+        # Recarga por meses: lista con el primer día de cada mes
+        return f"public.{name}_raw", " WHERE date_trunc('month', fecha)::date = ANY(%s)", (valor,)
+    if valor is not None:
+        return f"public.{name}_raw", f" WHERE {WATERMARKS[name]} >= %s", (valor,)
+    return f"public.{name}_raw", '', ()
+
+def ventana_meses(meses: Sequence[str]) -> Dict[str, List[date]]:
+    """Filtro de extracción de los hechos para recargar solo los meses 'YYYY-MM' indicados"""
+    inicios = sorted({pd.Period(mes, freq='M').start_time.date() for mes in meses})
+    return {name: inicios for name in WATERMARKS}
+
+def build_extract_queries(watermarks: Optional[Dict[str, str]] = None) -> Dict[str, Tuple[str, tuple]]:
+    """Construye las queries de extracción, filtrando por watermark si existe"""
+    queries = {}
+    for name in TABLAS_RAW:
+        tabla, where, params = _origen_raw(name, watermarks)
+        queries[name] = (f"SELECT * FROM {tabla}{where}", params)
+    return queries
+
+def _ruta_staging(cache: StagingCache, conn, name: str, watermarks: Optional[Dict[str, str]]):
+    """Snapshot de staging que corresponde al estado actual de la tabla en el servidor"""
+    tabla, where, params = _origen_raw(name, watermarks)
+    huella = cache.huella(conn, tabla, where, params)
+    return cache.ruta(name, f"SELECT * FROM {tabla}{where}", params, huella)
+
+def extract_raw_data(conn, watermarks: Optional[Dict[str, str]] = None,
+                     tablas: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """Extrae datos de las tablas raw (solo filas >= watermark en modo incremental)"""
     logger.info("📥 Extrayendo datos de schema 'public' (raw)...")
     
-    queries = {
-        'calendario': "SELECT * FROM public.calendario_raw",
-        'productos': "SELECT * FROM public.productos_raw",
-        'rutas': "SELECT * FROM public.rutas_raw",
-        'ventas': "SELECT * FROM public.ventas_raw",
-        'incidencias': "SELECT * FROM public.incidencias_raw"
-    }
+    queries = build_extract_queries(watermarks)
+    if tablas is not None:
+        queries = {name: queries[name] for name in tablas}
     
     data = {}
-    for name, query in queries.items():
+    for name, (query, params) in queries.items():
         try:
-            df = pd.read_sql(query, conn)
-            data[name] = df
+            df = pd.read_sql(query, conn, params=params or None)
+            antes = memoria_mb(df)
+            data[name] = df = aplicar_esquema(df, name)
             logger.info(f"  ✅ {name}: {len(df)} filas extraídas")
+            logger.info(f"     {resumen_memoria(name, df, antes)}")
         except Exception as e:
             logger.error(f"  ❌ Error extrayendo {name}: {e}")
             raise
     
     return data
 
+def _extract_table(pool: ThreadedConnectionPool, name: str, watermarks: Optional[Dict[str, str]],
+                   cache: Optional[StagingCache],
+                   metricas: Optional[MetricasETL] = None) -> Tuple[pd.DataFrame, float, bool]:
+    """Extrae una tabla con una conexión propia del pool (se ejecuta en un hilo)"""
+    query, params = build_extract_queries(watermarks)[name]
+    conn = pool.getconn()
+    etapa = metricas.etapa(f"extract:{name}") if metricas is not None else contextlib.nullcontext({})
+    try:
+        with etapa as medicion:
+            inicio = time.perf_counter()
+            ruta = None
+            desde_cache = False
+            if cache is not None:
+                ruta = _ruta_staging(cache, conn, name, watermarks)
+                desde_cache = cache.existe(ruta)
+            if desde_cache:
+                df = aplicar_esquema(cache.leer(ruta), name)
+            else:
+                df = pd.read_sql(query, conn, params=params or None)
+                antes = memoria_mb(df)
+                df = aplicar_esquema(df, name)
+                logger.info(f"     {resumen_memoria(name, df, antes)}")
+                if ruta is not None:
+                    cache.guardar(ruta, df)
+            # Tamaño en memoria del resultado: aproximación de lo recibido del servidor
+            medicion['filas'] = len(df)
+            medicion['bytes'] = int(df.memory_usage(deep=True).sum())
+            return df, time.perf_counter() - inicio, desde_cache
+    finally:
+        pool.putconn(conn)
+
+def extract_raw_data_parallel(pool: ThreadedConnectionPool, watermarks: Optional[Dict[str, str]] = None,
+                              tablas: Optional[List[str]] = None,
+                              max_workers: int = EXTRACT_WORKERS,
+                              cache: Optional[StagingCache] = None,
+                              metricas: Optional[MetricasETL] = None) -> Dict[str, pd.DataFrame]:
+    """Extrae las tablas raw en paralelo (hilos + pool): tarda lo que la tabla más lenta"""
+    queries = build_extract_queries(watermarks)
+    if tablas is not None:
+        queries = {name: queries[name] for name in tablas}
+    if not queries:
+        return {}
+    
+    workers = max(1, min(max_workers, len(queries)))
+    logger.info(f"📥 Extrayendo {len(queries)} tablas de schema 'public' (raw) en paralelo "
+                f"(concurrencia {workers})...")
+    
+    inicio = time.perf_counter()
+    data, tiempos = {}, {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extract') as executor:
+        futuros = {
+            executor.submit(_extract_table, pool, name, watermarks, cache, metricas): name
+            for name in queries
+        }
+        for futuro in as_completed(futuros):
+            name = futuros[futuro]
+            try:
+                data[name], tiempos[name], desde_cache = futuro.result()
+            except Exception as e:
+                logger.error(f"  ❌ Error extrayendo {name}: {e}")
+                raise
+            origen = " (staging local)" if desde_cache else ""
+            logger.info(f"  ✅ {name}: {len(data[name])} filas extraídas en {tiempos[name]:.2f}s{origen}")
+    
+    duracion = time.perf_counter() - inicio
+    logger.info(f"  ⏱️  Extracción: {duracion:.2f}s en paralelo vs {sum(tiempos.values()):.2f}s "
+                f"en serie (concurrencia {workers})")
+    return {name: data[name] for name in queries}
+
+def stream_raw_table(conn, name: str, watermarks: Optional[Dict[str, str]] = None,
+                     fetch_size: int = FETCH_SIZE,
+                     cache: Optional[StagingCache] = None) -> Iterator[pd.DataFrame]:
+    """Extrae una tabla raw en bloques de DataFrame (desde staging local si no ha cambiado)"""
+    if cache is None:
+        yield from _stream_cursor(conn, name, watermarks, fetch_size)
+        return
+    
+    ruta = _ruta_staging(cache, conn, name, watermarks)
+    if cache.existe(ruta):
+        logger.info(f"📦 {name}: sin cambios en el servidor, leyendo staging local {ruta.name}")
+        total = 0
+        for bloque in cache.leer_bloques(ruta, fetch_size):
+            total += len(bloque)
+            yield aplicar_esquema(bloque, name)
+        logger.info(f"  ✅ {name}: {total} filas leídas de staging local")
+    else:
+        yield from cache.guardar_bloques(ruta, _stream_cursor(conn, name, watermarks, fetch_size))
+
+def _stream_cursor(conn, name: str, watermarks: Optional[Dict[str, str]],
+                   fetch_size: int) -> Iterator[pd.DataFrame]:
+    """Extrae una tabla raw en bloques de DataFrame con un cursor de servidor (named cursor)"""
+    query, params = build_extract_queries(watermarks)[name]
+    logger.info(f"📥 Extrayendo {name} en streaming (bloques de {fetch_size} filas)...")
+    
+    # El cursor con nombre mantiene el resultado en el servidor: solo viaja un bloque cada vez
+    cursor = conn.cursor(name=f"stream_{name}")
+    cursor.itersize = fetch_size
+    total = 0
+    antes_mb = despues_mb = 0.0
+    try:
+        cursor.execute(query, params or None)
+        while True:
+            filas = cursor.fetchmany(fetch_size)
+            if not filas:
+                break
+            columnas = [desc[0] for desc in cursor.description]
+            total += len(filas)
+            bloque = pd.DataFrame.from_records(filas, columns=columnas, coerce_float=True)
+            antes_mb += memoria_mb(bloque)
+            bloque = aplicar_esquema(bloque, name)
+            despues_mb += memoria_mb(bloque)
+            yield bloque
+    finally:
+        cursor.close()
+    logger.info(f"  ✅ {name}: {total} filas extraídas (streaming)")
+    if antes_mb > 0:
+        logger.info(f"     💾 {name} (suma de bloques): {antes_mb:.2f} MB → {despues_mb:.2f} MB "
+                    f"({(1 - despues_mb / antes_mb) * 100:.0f}% menos)")
+
 def transform_calendario(df: pd.DataFrame) -> pd.DataFrame:
     """Transforma y enriquece la dimensión calendario"""
     logger.info("🔄 Transformando dim_calendario...")
@@ -103,6 +333,47 @@ def transform_calendario(df: pd.DataFrame) -> pd.DataFrame:
     logger.info(f"  ✅ Calendario transformado: {len(df_clean)} registros")
     return df_clean
 
+# Las regex sobre texto Arrow se evalúan en C++ (RE2) sin bucle Python por fila
+try:
+    import pyarrow  # noqa: F401
+    DTYPE_TEXTO = 'string[pyarrow]'
+except ImportError:
+    DTYPE_TEXTO = object
+
+# Caché por conjunto de reglas: nombre normalizado → categoría
+_CACHE_CATEGORIAS: Dict[tuple, Dict[str, str]] = {}
+
+@lru_cache(maxsize=None)
+def _compilar_reglas(reglas: tuple) -> List[str]:
+    """Compila cada categoría en una regex de alternativas (una pasada por categoría)"""
+    return ['|'.join(re.escape(palabra) for palabra in palabras) for _, palabras in reglas]
+
+def categorizar_productos(nombres: pd.Series, reglas: Optional[Mapping[str, Sequence[str]]] = None,
+                          defecto: str = CATEGORIA_POR_DEFECTO) -> pd.Series:
+    """Categoriza productos por palabras clave de forma vectorizada y memoizada por nombre"""
+    reglas = REGLAS_CATEGORIA if reglas is None else reglas
+    clave = tuple((categoria, tuple(palabras)) for categoria, palabras in reglas.items())
+    cache = _CACHE_CATEGORIAS.setdefault(clave, {})
+    
+    normalizados = nombres.astype(str).str.lower()
+    
+    # Cada nombre normalizado distinto se evalúa una sola vez (y solo si no está en caché)
+    codigos, distintos = pd.factorize(normalizados)
+    resultado = np.array([cache.get(nombre) for nombre in distintos], dtype=object)
+    pendientes = np.flatnonzero(pd.isna(resultado))
+    if len(pendientes) > 0:
+        textos = pd.Series(distintos[pendientes], dtype=object).astype(DTYPE_TEXTO)
+        condiciones = [
+            textos.str.contains(patron, regex=True).to_numpy(dtype=bool)
+            for patron in _compilar_reglas(clave) if patron
+        ]
+        categorias = [categoria for categoria, palabras in clave if palabras]
+        # np.select respeta el orden: gana la primera categoría que coincide (como los if/elif)
+        resultado[pendientes] = np.select(condiciones, categorias, default=defecto) if condiciones else defecto
+        cache.update(zip(distintos[pendientes], resultado[pendientes]))
+    
+    return pd.Series(resultado[codigos], index=nombres.index, name=nombres.name)
+
 def transform_productos(df: pd.DataFrame) -> pd.DataFrame:
     """Transforma la dimensión productos"""
     logger.info("🔄 Transformando dim_productos...")
@@ -110,19 +381,8 @@ def transform_productos(df: pd.DataFrame) -> pd.DataFrame:
     df_clean = df.copy()
     df_clean.columns = df_clean.columns.str.lower()
     
-    # Inferir categorías basadas en nombre (ejemplo simplificado)
-    def categorizar_producto(nombre):
-        nombre_lower = str(nombre).lower()
-        if any(word in nombre_lower for word in ['agua', 'refresco', 'zumo', 'café', 'bebida']):
-            return 'Bebidas'
-        elif any(word in nombre_lower for word in ['bocadillo', 'sandwich', 'hamburguesa', 'menú']):
-            return 'Comida'
-        elif any(word in nombre_lower for word in ['chips', 'galleta', 'chocolate', 'snack']):
-            return 'Snacks'
-        else:
-            return 'Otros'
-    
-    df_clean['categoria'] = df_clean['nombre_producto'].apply(categorizar_producto)
+    # Inferir categorías basadas en nombre (reglas en REGLAS_CATEGORIA)
+    df_clean['categoria'] = categorizar_productos(df_clean['nombre_producto'])
     df_clean['es_activo'] = True
     
     # Renombrar para coincidir con schema
@@ -170,22 +430,27 @@ def transform_ventas(df: pd.DataFrame, incidencias_df: pd.DataFrame) -> pd.DataF
         (df_clean['ingresos_total'] / df_clean['objetivoventas']) * 100
     ).fillna(0)
     
-    # Marcar si tuvo incidencia (join con incidencias por fecha + ruta)
-    incidencias_keys = incidencias_df[['fecha', 'rutaid']].drop_duplicates()
-    incidencias_keys['tiene_incidencia'] = True
+    # Marcar si tuvo incidencia: la clave entera (fecha, ruta) está entre las de incidencias
+    claves_incidencias = codificar_fecha_ruta(incidencias_df['fecha'], incidencias_df['rutaid']).unique()
+    df_clean['tiene_incidencia'] = codificar_fecha_ruta(df_clean['fecha'], df_clean['rutaid']).isin(
+        claves_incidencias
+    ).to_numpy()
     
-    df_clean = df_clean.merge(
-        incidencias_keys, 
-        on=['fecha', 'rutaid'], 
-        how='left'
-    )
-    df_clean['tiene_incidencia'] = df_clean['tiene_incidencia'].fillna(False)
+    # Renombrar para coincidir con schema
+    df_clean = df_clean.rename(columns={
+        'preciounit': 'precio_unitario',
+        'objetivoventas': 'objetivo_ventas'
+    })
+    
+    # Región de origen (con una sola base de datos raw, la principal)
+    if 'fuente_id' not in df_clean.columns:
+        df_clean['fuente_id'] = FUENTE_PRINCIPAL
     
     # Seleccionar columnas finales
     columnas_finales = [
         'venta_id', 'ticketid', 'fecha', 'rutaid', 'productoid',
-        'fecha_ruta', 'cantidad', 'preciounit', 'ingresos_total',
-        'pasajeros', 'objetivoventas', 'porcentaje_objetivo', 'tiene_incidencia'
+        'fecha_ruta', 'cantidad', 'precio_unitario', 'ingresos_total',
+        'pasajeros', 'objetivo_ventas', 'porcentaje_objetivo', 'tiene_incidencia', 'fuente_id'
     ]
     
     df_clean = df_clean[columnas_finales]
@@ -193,6 +458,27 @@ def transform_ventas(df: pd.DataFrame, incidencias_df: pd.DataFrame) -> pd.DataF
     logger.info(f"  ✅ Ventas transformadas: {len(df_clean)} registros")
     return df_clean
 
+def transform_ventas_stream(bloques: Iterable[pd.DataFrame], incidencias_df: pd.DataFrame,
+                            resumen: Dict, resolutor: Optional[ResolutorClaves] = None) -> Iterator[pd.DataFrame]:
+    """Transforma ventas bloque a bloque, acumulando en `resumen` filas, watermark, claves y cuarentena"""
+    columna_wm = WATERMARKS.get('ventas')
+    for bloque in bloques:
+        if bloque.empty:
+            continue
+        resumen['filas'] += len(bloque)
+        if columna_wm in bloque.columns:
+            maximo = bloque[columna_wm].max()
+            resumen['watermark'] = maximo if resumen['watermark'] is None else max(resumen['watermark'], maximo)
+        if resolutor is not None:
+            bloque, apartadas = resolutor.separar(bloque, 'ventas')
+            if apartadas is not None:
+                resumen['cuarentena_claves'].append(apartadas)
+            if bloque.empty:
+                continue
+        fact_ventas = transform_ventas(bloque, incidencias_df)
+        resumen['claves'].append(fact_ventas[['fecha', 'rutaid']].drop_duplicates())
+        yield fact_ventas
+
 def transform_incidencias(df: pd.DataFrame) -> pd.DataFrame:
     """Transforma la tabla de hechos de incidencias"""
     logger.info("🔄 Transformando fact_incidencias...")
@@ -210,60 +496,756 @@ def transform_incidencias(df: pd.DataFrame) -> pd.DataFrame:
         'duracionmin': 'duracion_minutos'
     })
     
+    if 'fuente_id' not in df_clean.columns:
+        df_clean['fuente_id'] = FUENTE_PRINCIPAL
+    
+    # Seleccionar columnas finales (la ruta en texto ya está en rutaid)
+    columnas_finales = [
+        'incidenciaid', 'fecha', 'rutaid', 'tipo_incidencia', 'fecha_ruta',
+        'severidad', 'duracion_minutos', 'es_critica', 'duracion_horas', 'fuente_id'
+    ]
+    
+    df_clean = df_clean[columnas_finales]
+    
     logger.info(f"  ✅ Incidencias transformadas: {len(df_clean)} registros")
     return df_clean
 
-def load_dimension(conn, table_name: str, df: pd.DataFrame, conflict_column: str):
-    """Carga datos en una tabla dimensión con UPSERT"""
+# =====================================================
+# CARGA MASIVA (COPY FROM STDIN)
+# =====================================================
+
+# Época de PostgreSQL para fechas/timestamps en formato binario
+PG_EPOCH = date(2000, 1, 1)
+PG_EPOCH_TS = datetime(2000, 1, 1)
+
+# Cabecera y trailer del formato binario de COPY
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+
+class CopyStream:
+    """Objeto tipo fichero que entrega a COPY los bloques serializados bajo demanda"""
+    
+    def __init__(self, bloques: Iterator[bytes]):
+        self._bloques = bloques
+        self._actual = memoryview(b'')
+        self._pos = 0
+        self.bytes_enviados = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        partes = []
+        pendiente = size
+        while size < 0 or pendiente > 0:
+            if self._pos >= len(self._actual):
+                try:
+                    self._actual = memoryview(next(self._bloques))
+                    self._pos = 0
+                except StopIteration:
+                    break
+                continue
+            fin = len(self._actual) if size < 0 else min(len(self._actual), self._pos + pendiente)
+            partes.append(self._actual[self._pos:fin])
+            pendiente -= fin - self._pos
+            self._pos = fin
+        data = b''.join(partes)
+        self.bytes_enviados += len(data)
+        return data
+
+def _tipos_columnas(cursor, table_name: str, schema: str = 'analytics') -> Dict[str, str]:
+    """Devuelve {columna: tipo} de <schema>.<table_name> (también válido para pg_temp)"""
+    cursor.execute("""
+        SELECT attname, atttypid::regtype::text
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+    """, (f"{schema}.{table_name}",))
+    return dict(cursor.fetchall())
+
+def _preparar_bloque(bloque: pd.DataFrame) -> pd.DataFrame:
+    """Evita que enteros con nulos se serialicen como '3.0' (rechazado por INTEGER)"""
+    bloque = bloque.copy()
+    for col in bloque.columns:
+        serie = bloque[col]
+        if pd.api.types.is_float_dtype(serie):
+            valores = serie.dropna()
+            if len(valores) < len(serie) and len(valores) > 0 and (valores == np.floor(valores)).all():
+                bloque[col] = serie.astype('Int64')
+    return bloque
+
+def _serializar_texto(bloque: pd.DataFrame) -> bytes:
+    """Serializa un bloque en CSV compatible con COPY ... (FORMAT csv)"""
+    return _preparar_bloque(bloque).to_csv(
+        index=False, header=False, na_rep='', date_format='%Y-%m-%d %H:%M:%S.%f'
+    ).encode('utf-8')
+
+def _numeric_binario(valor) -> bytes:
+    """Codifica un valor en el formato binario de NUMERIC (dígitos en base 10000)"""
+    d = valor if isinstance(valor, Decimal) else Decimal(str(valor))
+    signo, digitos, exponente = d.as_tuple()
+    if exponente == 'F':
+        return struct.pack('>hhHH', 0, 0, 0xF000 if signo else 0xD000, 0)  # ±Infinity (PostgreSQL 14+)
+    if not isinstance(exponente, int):
+        return struct.pack('>hhHH', 0, 0, 0xC000, 0)  # NaN
+    
+    cifras = ''.join(map(str, digitos))
+    if exponente >= 0:
+        entera, fraccion = cifras + '0' * exponente, ''
+    else:
+        cifras = cifras.rjust(-exponente + 1, '0')
+        entera, fraccion = cifras[:exponente], cifras[exponente:]
+    entera = entera.lstrip('0')
+    entera = entera.rjust(-(-len(entera) // 4) * 4, '0')
+    fraccion = fraccion.ljust(-(-len(fraccion) // 4) * 4, '0')
+    
+    grupos = [int(entera[i:i + 4]) for i in range(0, len(entera), 4)]
+    peso = len(grupos) - 1
+    grupos += [int(fraccion[i:i + 4]) for i in range(0, len(fraccion), 4)]
+    while grupos and grupos[0] == 0:
+        grupos.pop(0)
+        peso -= 1
+    while grupos and grupos[-1] == 0:
+        grupos.pop()
+    if not grupos:
+        peso = 0
+    
+    escala = max(-exponente, 0)
+    return struct.pack(f'>hhHH{len(grupos)}H', len(grupos), peso,
+                       0x4000 if signo else 0, escala, *grupos)
+
+def _a_fecha(valor) -> date:
+    return valor.date() if isinstance(valor, datetime) else valor
+
+def _a_timestamp(valor) -> datetime:
+    return valor if isinstance(valor, datetime) else datetime(valor.year, valor.month, valor.day)
+
+# Codificadores binarios por tipo de columna PostgreSQL
+CODIFICADORES_BINARIOS = {
+    'smallint': lambda v: struct.pack('>h', int(v)),
+    'integer': lambda v: struct.pack('>i', int(v)),
+    'bigint': lambda v: struct.pack('>q', int(v)),
+    'boolean': lambda v: struct.pack('>?', bool(v)),
+    'real': lambda v: struct.pack('>f', float(v)),
+    'double precision': lambda v: struct.pack('>d', float(v)),
+    'numeric': _numeric_binario,
+    'date': lambda v: struct.pack('>i', (_a_fecha(v) - PG_EPOCH).days),
+    'timestamp without time zone': lambda v: struct.pack(
+        '>q', (_a_timestamp(v) - PG_EPOCH_TS) // timedelta(microseconds=1)
+    ),
+    'character varying': lambda v: str(v).encode('utf-8'),
+    'character': lambda v: str(v).encode('utf-8'),
+    'text': lambda v: str(v).encode('utf-8'),
+}
+
+def _serializar_binario(bloque: pd.DataFrame, codificadores: List) -> bytes:
+    """Serializa un bloque en tuplas del formato binario de COPY"""
+    n_campos = struct.pack('>h', len(codificadores))
+    nulo = struct.pack('>i', -1)
+    partes = []
+    columnas = [bloque[col].astype(object).where(bloque[col].notna(), None).tolist()
+                for col in bloque.columns]
+    for fila in zip(*columnas):
+        partes.append(n_campos)
+        for valor, codificar in zip(fila, codificadores):
+            if valor is None:
+                partes.append(nulo)
+            else:
+                campo = codificar(valor)
+                partes.append(struct.pack('>i', len(campo)))
+                partes.append(campo)
+    return b''.join(partes)
+
+def _encadenar(primero: pd.DataFrame, resto: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    yield primero
+    yield from resto
+
+def copy_dataframe(conn, table_name: str, frames: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+                   columns: Optional[List[str]] = None, formato: str = COPY_FORMAT,
+                   chunk_size: int = COPY_CHUNK_SIZE, schema: str = 'analytics') -> int:
+    """Carga uno o varios DataFrames en <schema>.<tabla> con COPY FROM STDIN (sin commit)"""
+    if formato not in ('text', 'binary'):
+        raise ValueError(f"Formato COPY no soportado: {formato}")
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    frames = iter(frames)
+    
+    # Se necesita el primer DataFrame para fijar las columnas
+    primero = next(frames, None)
+    if primero is None:
+        return 0
+    if columns is None:
+        columns = primero.columns.tolist()
+    
+    cursor = conn.cursor()
+    codificadores = None
+    if formato == 'binary':
+        tipos = _tipos_columnas(cursor, table_name, schema)
+        sin_codificador = [f"{col} ({tipos[col]})" for col in columns if tipos[col] not in CODIFICADORES_BINARIOS]
+        if sin_codificador:
+            raise ValueError(f"COPY binario de {schema}.{table_name}: tipos sin codificador: "
+                             f"{', '.join(sin_codificador)} (usa el formato 'text')")
+        codificadores = [CODIFICADORES_BINARIOS[tipos[col]] for col in columns]
+    
+    filas = 0
+    
+    def bloques() -> Iterator[bytes]:
+        nonlocal filas
+        if formato == 'binary':
+            yield PGCOPY_HEADER
+        for df in _encadenar(primero, frames):
+            for inicio in range(0, len(df), chunk_size):
+                bloque = df.iloc[inicio:inicio + chunk_size][columns]
+                filas += len(bloque)
+                if formato == 'binary':
+                    yield _serializar_binario(bloque, codificadores)
+                else:
+                    yield _serializar_texto(bloque)
+        if formato == 'binary':
+            yield PGCOPY_TRAILER
+    
+    opciones = '(FORMAT binary)' if formato == 'binary' else '(FORMAT csv)'
+    sql = f"COPY {schema}.{table_name} ({','.join(columns)}) FROM STDIN WITH {opciones}"
+    
+    stream = CopyStream(bloques())
+    inicio = time.perf_counter()
+    cursor.copy_expert(sql, stream, size=COPY_BUFFER_SIZE)
+    duracion = time.perf_counter() - inicio
+    acumular(bytes=stream.bytes_enviados)
+    
+    velocidad = filas / duracion if duracion > 0 else float('inf')
+    logger.info(
+        f"  ⚡ COPY {table_name} ({formato}): {filas} filas, "
+        f"{stream.bytes_enviados / 1e6:.2f} MB en {duracion:.2f}s ({velocidad:,.0f} filas/s)"
+    )
+    return filas
+
+def upsert_dataframe(conn, table_name: str, df: pd.DataFrame, conflict_columns: List[str],
+                     columns: Optional[List[str]] = None, formato: str = COPY_FORMAT) -> Dict[str, int]:
+    """UPSERT masivo: COPY a una tabla temporal y INSERT ... ON CONFLICT DO UPDATE solo de las filas
+    que cambian (sin commit). Devuelve filas insertadas, actualizadas y sin cambios"""
+    if columns is None:
+        columns = df.columns.tolist()
+    if df.empty:
+        return {'insertadas': 0, 'actualizadas': 0, 'sin_cambios': 0}
+    
+    cursor = conn.cursor()
+    staging = f"stg_{table_name}"
+    cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{staging}")
+    cursor.execute(f"""
+        CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+        SELECT {','.join(columns)} FROM analytics.{table_name} WITH NO DATA
+    """)
+    copy_dataframe(conn, staging, df, columns=columns, formato=formato, schema='pg_temp')
+    
+    conflicto = ','.join(conflict_columns)
+    actualizar = [col for col in columns if col not in conflict_columns]
+    if actualizar:
+        set_clause = ', '.join(f"{col} = EXCLUDED.{col}" for col in actualizar)
+        # Las filas idénticas no se reescriben (ni WAL, ni tuplas muertas, ni triggers de FK)
+        distinto = (f"({', '.join(f't.{col}' for col in actualizar)}) IS DISTINCT FROM "
+                    f"({', '.join(f'EXCLUDED.{col}' for col in actualizar)})")
+        accion = f"DO UPDATE SET {set_clause} WHERE {distinto}"
+    else:
+        accion = "DO NOTHING"
+    
+    # DISTINCT ON evita actualizar dos veces la misma fila dentro del lote.
+    # Las escritas que ya existían antes del INSERT (previas: mismo snapshot) son UPDATE; el resto,
+    # filas nuevas. No se usa xmax en RETURNING: en tablas particionadas no está disponible
+    cursor.execute(f"""
+        WITH entrantes AS (
+            SELECT DISTINCT ON ({conflicto}) {','.join(columns)} FROM pg_temp.{staging}
+        ), previas AS (
+            SELECT {conflicto} FROM analytics.{table_name}
+            WHERE ({conflicto}) IN (SELECT {conflicto} FROM entrantes)
+        ), escritas AS (
+            INSERT INTO analytics.{table_name} AS t ({','.join(columns)})
+            SELECT {','.join(columns)} FROM entrantes
+            ON CONFLICT ({conflicto}) {accion}
+            RETURNING {', '.join(f't.{col}' for col in conflict_columns)}
+        )
+        SELECT (SELECT COUNT(*) FROM entrantes),
+               (SELECT COUNT(*) FROM escritas),
+               (SELECT COUNT(*) FROM escritas JOIN previas USING ({conflicto}))
+    """)
+    entrantes, escritas, actualizadas = cursor.fetchone()
+    insertadas = escritas - actualizadas
+    return {'insertadas': insertadas, 'actualizadas': actualizadas,
+            'sin_cambios': entrantes - insertadas - actualizadas}
+
+def load_dimension(conn, table_name: str, df: pd.DataFrame, conflict_column: str,
+                   incremental: bool = False, formato: str = COPY_FORMAT) -> Dict[str, int]:
+    """Carga datos en una tabla dimensión: UPSERT por conflict_column que solo escribe las filas
+    que cambian (incremental) o DELETE + COPY sobre una tabla ya vacía"""
     logger.info(f"💾 Cargando {table_name}...")
     
     cursor = conn.cursor()
     
-    # Limpiar tabla primero (para simplificar - en producción usar UPSERT)
-    cursor.execute(f"DELETE FROM analytics.{table_name}")
+    if incremental:
+        conteos = upsert_dataframe(conn, table_name, df, [conflict_column], formato=formato)
+    else:
+        # Limpiar tabla primero (recarga completa)
+        cursor.execute(f"DELETE FROM analytics.{table_name}")
+        conteos = {'insertadas': copy_dataframe(conn, table_name, df, formato=formato),
+                   'actualizadas': 0, 'sin_cambios': 0}
+    conn.commit()
     
-    # Preparar datos
-    columns = df.columns.tolist()
-    values = [tuple(row) for row in df.values]
+    logger.info(f"  ✅ {table_name}: {conteos['insertadas']} insertadas, {conteos['actualizadas']} actualizadas, "
+                f"{conteos['sin_cambios']} sin cambios")
+    return conteos
+
+# =====================================================
+# PARTICIONES MENSUALES (hechos)
+# =====================================================
+
+def verificar_particiones(conn):
+    """Comprueba que los hechos están particionados (esquema de 01_create_analytics_schema.sql)"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.relname FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'analytics' AND c.relname = ANY(%s) AND c.relkind = 'p'
+    """, (TABLAS_PARTICIONADAS,))
+    faltan = set(TABLAS_PARTICIONADAS) - {fila[0] for fila in cursor.fetchall()}
+    if faltan:
+        raise RuntimeError(
+            f"Tablas de hechos sin particionar: {', '.join(sorted(faltan))}. "
+            "Re-ejecuta 01_create_analytics_schema.sql y carga con --modo completo"
+        )
+    # Grano por región: las claves únicas de los hechos incluyen fuente_id
+    cursor.execute("""
+        SELECT table_name FROM information_schema.columns
+        WHERE table_schema = 'analytics' AND table_name = ANY(%s) AND column_name = 'fuente_id'
+    """, (TABLAS_PARTICIONADAS,))
+    faltan = set(TABLAS_PARTICIONADAS) - {fila[0] for fila in cursor.fetchall()}
+    if faltan:
+        raise RuntimeError(
+            f"Tablas de hechos sin columna fuente_id: {', '.join(sorted(faltan))}. "
+            "Re-ejecuta 01_create_analytics_schema.sql y carga con --modo completo"
+        )
+
+def _particion(table_name: str, mes: pd.Period) -> Tuple[str, str, str]:
+    """Nombre y límites [desde, hasta) de la partición mensual"""
+    return (f"{table_name}_{mes.year}_{mes.month:02d}",
+            mes.start_time.date().isoformat(), (mes + 1).start_time.date().isoformat())
+
+def _meses(fechas: pd.Series) -> pd.Series:
+    return pd.to_datetime(fechas).dt.to_period('M')
+
+def asegurar_particiones(conn, table_name: str, meses: Iterable[pd.Period]):
+    """Crea las particiones mensuales que falten (UPSERT incremental sobre la tabla padre)"""
+    cursor = conn.cursor()
+    for mes in sorted(set(meses)):
+        nombre, desde, hasta = _particion(table_name, mes)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS analytics.{nombre}
+            PARTITION OF analytics.{table_name} FOR VALUES FROM ('{desde}') TO ('{hasta}')
+        """)
+
+def _crear_staging_particion(cursor, table_name: str, mes: pd.Period) -> str:
+    """Tabla UNLOGGED suelta con la forma de la partición y sin índices (COPY sin WAL ni
+    mantenimiento fila a fila); el CHECK del rango evita que ATTACH la recorra"""
+    nombre, desde, hasta = _particion(table_name, mes)
+    staging = f"{nombre}_stg"
+    cursor.execute(f"DROP TABLE IF EXISTS analytics.{staging}")
+    cursor.execute(f"""
+        CREATE UNLOGGED TABLE analytics.{staging} (
+            LIKE analytics.{table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            CONSTRAINT rango_mes CHECK (fecha >= '{desde}' AND fecha < '{hasta}')
+        )
+    """)
+    return staging
+
+def _definiciones_padre(cursor, table_name: str) -> Tuple[List[Tuple[str, Optional[str]]], List[Tuple[str, str]]]:
+    """Índices de la tabla padre (definición, tipo de restricción si la respaldan) y sus FK"""
+    cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid),
+               (SELECT CASE c.contype WHEN 'p' THEN 'PRIMARY KEY' WHEN 'u' THEN 'UNIQUE' END
+                FROM pg_constraint c WHERE c.conindid = i.indexrelid AND c.conrelid = i.indrelid)
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass
+        ORDER BY i.indexrelid
+    """, (f"analytics.{table_name}",))
+    indices = cursor.fetchall()
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+    """, (f"analytics.{table_name}",))
+    return indices, cursor.fetchall()
+
+def _preparar_staging(conn, table_name: str, staging: str) -> int:
+    """Deja el staging listo para el intercambio: LOGGED, índices de la tabla padre creados de
+    una vez sobre los datos ya cargados, FK validadas y estadísticas. Devuelve nº de índices"""
+    cursor = conn.cursor()
+    indices, claves_foraneas = _definiciones_padre(cursor, table_name)
+    # Antes de los índices: SET LOGGED reescribe la tabla y sus índices
+    cursor.execute(f"ALTER TABLE analytics.{staging} SET LOGGED")
+    for numero, (definicion, restriccion) in enumerate(indices):
+        indice = f"{staging}_i{numero}"
+        cursor.execute(re.sub(
+            r'^CREATE (UNIQUE )?INDEX \S+ ON ONLY \S+',
+            lambda m: f"CREATE {m.group(1) or ''}INDEX {indice} ON analytics.{staging}",
+            definicion
+        ))
+        # ATTACH solo reutiliza el índice si respalda la misma restricción que en la tabla padre
+        if restriccion is not None:
+            cursor.execute(f"ALTER TABLE analytics.{staging} ADD CONSTRAINT {indice} {restriccion} USING INDEX {indice}")
+    for nombre, definicion in claves_foraneas:
+        cursor.execute(f"ALTER TABLE analytics.{staging} ADD CONSTRAINT {nombre} {definicion}")
+    cursor.execute(f"ANALYZE analytics.{staging}")
+    conn.commit()
+    return len(indices)
+
+def _intercambiar_particiones(conn, table_name: str, staging: Dict[pd.Period, str],
+                              conservar_otros_meses: bool):
+    """Sustituye las particiones de los meses cargados por sus staging en una sola transacción:
+    los lectores ven los datos anteriores o los nuevos, nunca una carga a medias.
+    Sin conservar_otros_meses (recarga completa) se eliminan además los meses que ya no vienen.
+    Si no consigue el bloqueo en SWAP_LOCK_TIMEOUT deshace el intento y lo repite"""
+    for intento in range(1, SWAP_REINTENTOS + 1):
+        try:
+            retirar, nuevas = _intercambio(conn, table_name, staging, conservar_otros_meses)
+            break
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            if intento == SWAP_REINTENTOS:
+                raise
+            logger.warning(f"  ⏳ {table_name}: tabla ocupada, intercambio aplazado "
+                           f"(intento {intento}/{SWAP_REINTENTOS}, espera {SWAP_ESPERA * intento:g}s)")
+            time.sleep(SWAP_ESPERA * intento)
     
-    # Insertar
-    placeholders = ','.join(['%s'] * len(columns))
-    query = f"""
-        INSERT INTO analytics.{table_name} ({','.join(columns)})
-        VALUES ({placeholders})
-    """
+    eliminadas = len(retirar - nuevas)
+    logger.info(f"  🔁 {table_name}: {len(staging)} particiones mensuales intercambiadas "
+                f"({min(staging)} → {max(staging)})"
+                + (f", {eliminadas} meses sin datos eliminados" if eliminadas else ""))
+
+def _intercambio(conn, table_name: str, staging: Dict[pd.Period, str],
+                 conservar_otros_meses: bool) -> Tuple[set, set]:
+    """Un intento del intercambio (una transacción). Devuelve las particiones retiradas y las nuevas"""
+    cursor = conn.cursor()
+    # Solo para esta transacción: la conexión vuelve al pool sin el límite
+    cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    # El bloqueo se pide de una vez al principio: si no llega, no queda nada a medias
+    cursor.execute(f"LOCK TABLE analytics.{table_name} IN ACCESS EXCLUSIVE MODE")
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits h JOIN pg_class c ON c.oid = h.inhrelid
+        WHERE h.inhparent = %s::regclass
+    """, (f"analytics.{table_name}",))
+    vigentes = {fila[0] for fila in cursor.fetchall()}
+    nuevas = {_particion(table_name, mes)[0] for mes in staging}
+    retirar = vigentes & nuevas if conservar_otros_meses else vigentes
     
-    execute_batch(cursor, query, values)
+    for nombre in sorted(retirar):
+        cursor.execute(f"ALTER TABLE analytics.{table_name} DETACH PARTITION analytics.{nombre}")
+        cursor.execute(f"DROP TABLE analytics.{nombre}")
+    for mes in sorted(staging):
+        nombre, desde, hasta = _particion(table_name, mes)
+        cursor.execute(f"ALTER TABLE analytics.{staging[mes]} RENAME TO {nombre}")
+        # Los índices toman el nombre de la partición (el próximo staging reutiliza el suyo)
+        cursor.execute("""
+            SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass
+        """, (f"analytics.{nombre}",))
+        for (indice,) in cursor.fetchall():
+            cursor.execute(f"ALTER INDEX analytics.{indice} RENAME TO {nombre}{indice[len(staging[mes]):]}")
+        # Índices, FK y rango ya existen: ATTACH solo los enlaza, sin recorrer la tabla
+        cursor.execute(f"""
+            ALTER TABLE analytics.{table_name}
+            ATTACH PARTITION analytics.{nombre} FOR VALUES FROM ('{desde}') TO ('{hasta}')
+        """)
+    conn.commit()
+    return retirar, nuevas
+
+def load_particiones(conn, table_name: str, frames: Iterable[pd.DataFrame], columns: List[str],
+                     conservar_otros_meses: bool = False, meses: Optional[Iterable[pd.Period]] = None,
+                     formato: str = COPY_FORMAT) -> int:
+    """Carga cada mes presente en los datos en su staging (COPY → índices → ANALYZE) y lo
+    intercambia por la partición vigente en una única transacción al final.
+    Los `meses` pedidos sin filas (vacíos en el origen o todo en cuarentena) se intercambian
+    por un staging vacío: si no, conservarían la partición anterior"""
+    cursor = conn.cursor()
+    staging: Dict[pd.Period, str] = {}
+    filas = 0
+    for bloque in frames:
+        for mes, grupo in bloque.groupby(_meses(bloque['fecha']), sort=False):
+            if mes not in staging:
+                staging[mes] = _crear_staging_particion(cursor, table_name, mes)
+            filas += copy_dataframe(conn, staging[mes], grupo, columns=columns, formato=formato)
+    for mes in sorted(set(meses or ()) - set(staging)):
+        staging[mes] = _crear_staging_particion(cursor, table_name, mes)
     conn.commit()
+    if not staging:
+        return 0
     
-    logger.info(f"  ✅ {table_name}: {len(df)} registros cargados")
+    inicio = time.perf_counter()
+    for mes in sorted(staging):
+        n_indices = _preparar_staging(conn, table_name, staging[mes])
+    logger.info(f"  🏗️  {table_name}: {n_indices} índices construidos en bloque y ANALYZE "
+                f"en {len(staging)} staging ({time.perf_counter() - inicio:.2f}s)")
+    _intercambiar_particiones(conn, table_name, staging, conservar_otros_meses)
+    return filas
 
-def load_fact_table(conn, table_name: str, df: pd.DataFrame, unique_columns: list):
-    """Carga datos en tabla de hechos con manejo de duplicados"""
+def load_fact_table(conn, table_name: str, df: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+                    unique_columns: list, incremental: bool = False,
+                    conservar_otros_meses: bool = False, meses: Optional[Iterable[pd.Period]] = None,
+                    formato: str = COPY_FORMAT) -> int:
+    """Carga datos (DataFrame o bloques) en tabla de hechos: UPSERT en modo incremental,
+    si no, sustituye las particiones mensuales (todas, o las de los meses cargados y los `meses` pedidos)"""
     logger.info(f"💾 Cargando {table_name}...")
     
+    frames = iter([df] if isinstance(df, pd.DataFrame) else df)
+    primero = next(frames, None)
+    if primero is None and (incremental or not meses):
+        logger.info(f"  ✅ {table_name}: 0 registros cargados")
+        return 0
+    
+    # Las claves subrogadas (venta_id / incidencia_id) las genera la BD
+    columns = [] if primero is None else [col for col in primero.columns
+                                          if col != 'incidencia_id' and col != 'venta_id']
+    frames = iter(()) if primero is None else _encadenar(primero, frames)
+    
+    if incremental:
+        filas = 0
+        conteos = {'insertadas': 0, 'actualizadas': 0, 'sin_cambios': 0}
+        for bloque in frames:
+            filas += len(bloque)
+            asegurar_particiones(conn, table_name, _meses(bloque['fecha']).unique())
+            for clave, n in upsert_dataframe(conn, table_name, bloque, unique_columns, columns=columns,
+                                             formato=formato).items():
+                conteos[clave] += n
+        logger.info(f"  🔀 {table_name}: {conteos['insertadas']} insertadas, {conteos['actualizadas']} "
+                    f"actualizadas, {conteos['sin_cambios']} sin cambios")
+    else:
+        filas = load_particiones(conn, table_name, frames, columns, conservar_otros_meses, meses, formato)
+    conn.commit()
+    
+    logger.info(f"  ✅ {table_name}: {filas} registros cargados")
+    return filas
+
+def _crear_claves_afectadas(conn, claves: pd.DataFrame):
+    """Sube los pares (fecha, rutaid) a la tabla temporal pg_temp.claves_afectadas (hasta el commit)"""
     cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS pg_temp.claves_afectadas")
+    cursor.execute("CREATE TEMP TABLE claves_afectadas (fecha DATE, rutaid INTEGER) ON COMMIT DROP")
+    copy_dataframe(conn, 'claves_afectadas', claves, schema='pg_temp')
+    cursor.execute("ANALYZE pg_temp.claves_afectadas")
+
+def refresh_tiene_incidencia(conn, claves: pd.DataFrame) -> int:
+    """Recalcula fact_ventas.tiene_incidencia solo para los pares (fecha, rutaid) afectados"""
+    claves = claves[['fecha', 'rutaid']].drop_duplicates()
+    if claves.empty:
+        return 0
     
-    # Limpiar tabla primero (alternativa: usar UPSERT con ON CONFLICT)
-    cursor.execute(f"DELETE FROM analytics.{table_name}")
+    cursor = conn.cursor()
+    _crear_claves_afectadas(conn, claves)
+    cursor.execute("""
+        UPDATE analytics.fact_ventas v
+        SET tiene_incidencia = k.tiene_incidencia
+        FROM (
+            SELECT c.fecha, c.rutaid,
+                   EXISTS (
+                       SELECT 1 FROM analytics.fact_incidencias i
+                       WHERE i.fecha = c.fecha AND i.rutaid = c.rutaid
+                   ) AS tiene_incidencia
+            FROM pg_temp.claves_afectadas c
+        ) k
+        WHERE v.fecha = k.fecha AND v.rutaid = k.rutaid
+          AND v.tiene_incidencia IS DISTINCT FROM k.tiene_incidencia
+    """)
+    actualizadas = cursor.rowcount
+    conn.commit()
     
-    # Preparar datos
-    columns = [col for col in df.columns if col != 'incidencia_id' and col != 'venta_id']
-    values = [tuple(row[columns]) for _, row in df.iterrows()]
+    logger.info(f"  ✅ tiene_incidencia recalculado: {len(claves)} claves (fecha, ruta), "
+                f"{actualizadas} ventas actualizadas")
+    return actualizadas
+
+# =====================================================
+# ROLLUP DIARIO (agg_ventas_incidencias_diarias)
+# =====================================================
+
+ROLLUP_SQL = Path(__file__).parent / '03_create_rollup_diario.sql'
+
+# Incidencias agregadas por día-ruta ANTES del JOIN (sin fan-out sobre las ventas).
+# {filtro_ventas} / {filtro_incidencias} restringen a las claves afectadas en modo incremental.
+ROLLUP_SELECT = """
+    SELECT v.fecha, v.rutaid,
+           COUNT(DISTINCT v.ticketid), SUM(v.cantidad), SUM(v.ingresos_total),
+           AVG(v.precio_unitario), AVG(v.pasajeros), MAX(v.objetivo_ventas),
+           COALESCE(i.num_incidencias, 0), COALESCE(i.duracion_total, 0), COALESCE(i.tuvo_alta, 0),
+           CASE WHEN COALESCE(i.num_incidencias, 0) > 0 THEN 'Con Incidencia' ELSE 'Sin Incidencia' END,
+           CASE WHEN COALESCE(i.num_incidencias, 0) > 0
+                THEN SUM(v.ingresos_total) * 0.85 -- Asume 15% de pérdida
+                ELSE SUM(v.ingresos_total) END
+    FROM analytics.fact_ventas v
+    {filtro_ventas}
+    LEFT JOIN (
+        SELECT fi.fecha, fi.rutaid,
+               COUNT(*) AS num_incidencias,
+               SUM(fi.duracion_minutos) AS duracion_total,
+               MAX(CASE WHEN fi.severidad = 'Alta' THEN 1 ELSE 0 END) AS tuvo_alta
+        FROM analytics.fact_incidencias fi
+        {filtro_incidencias}
+        GROUP BY fi.fecha, fi.rutaid
+    ) i ON i.fecha = v.fecha AND i.rutaid = v.rutaid
+    GROUP BY v.fecha, v.rutaid, i.num_incidencias, i.duracion_total, i.tuvo_alta
+"""
+ROLLUP_COLUMNAS = """
+    fecha, rutaid, num_tickets, cantidad_total_vendida, ingresos_totales,
+    precio_promedio, pasajeros_promedio, objetivo_ventas,
+    num_incidencias, duracion_total_incidencias, tuvo_incidencia_alta,
+    estado_dia, ingresos_ajustados
+"""
+
+def ensure_rollup(conn):
+    """Crea el rollup diario y su vista de compatibilidad si faltan (03_create_rollup_diario.sql)"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT to_regclass('analytics.agg_ventas_incidencias_diarias') IS NOT NULL
+           AND to_regclass('analytics.vw_ventas_incidencias_diarias') IS NOT NULL
+    """)
+    if not cursor.fetchone()[0]:
+        cursor.execute(ROLLUP_SQL.read_text(encoding='utf-8'))
+        logger.info("🧱 Rollup diario analytics.agg_ventas_incidencias_diarias creado")
+    conn.commit()
+
+def _crear_meses_afectados(conn, meses: Iterable[pd.Period]):
+    """Sube los rangos [desde, hasta) de los meses a pg_temp.meses_afectados (hasta el commit)"""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS pg_temp.meses_afectados")
+    cursor.execute("CREATE TEMP TABLE meses_afectados (desde DATE, hasta DATE) ON COMMIT DROP")
+    cursor.executemany("INSERT INTO pg_temp.meses_afectados VALUES (%s, %s)",
+                       [(mes.start_time.date(), (mes + 1).start_time.date()) for mes in sorted(set(meses))])
+
+def refresh_rollup_diario(conn, claves: Optional[pd.DataFrame] = None,
+                          meses: Optional[Iterable[pd.Period]] = None) -> int:
+    """Recalcula el rollup día-ruta: completo (claves=None), solo los pares (fecha, rutaid) afectados
+    o, con `meses`, todos los días de esos meses (la recarga por meses también quita pares)"""
+    cursor = conn.cursor()
+    if meses is not None:
+        meses = sorted(set(meses))
+        _crear_meses_afectados(conn, meses)
+        cursor.execute("""
+            DELETE FROM analytics.agg_ventas_incidencias_diarias a
+            USING pg_temp.meses_afectados m
+            WHERE a.fecha >= m.desde AND a.fecha < m.hasta
+        """)
+        filtro_ventas = "JOIN pg_temp.meses_afectados m ON v.fecha >= m.desde AND v.fecha < m.hasta"
+        filtro_incidencias = ("JOIN pg_temp.meses_afectados mi "
+                              "ON fi.fecha >= mi.desde AND fi.fecha < mi.hasta")
+    elif claves is None:
+        cursor.execute("TRUNCATE analytics.agg_ventas_incidencias_diarias")
+        filtro_ventas = filtro_incidencias = ''
+    else:
+        claves = claves[['fecha', 'rutaid']].drop_duplicates()
+        if claves.empty:
+            return 0
+        _crear_claves_afectadas(conn, claves)
+        cursor.execute("""
+            DELETE FROM analytics.agg_ventas_incidencias_diarias a
+            USING pg_temp.claves_afectadas k
+            WHERE a.fecha = k.fecha AND a.rutaid = k.rutaid
+        """)
+        filtro_ventas = "JOIN pg_temp.claves_afectadas k ON k.fecha = v.fecha AND k.rutaid = v.rutaid"
+        filtro_incidencias = ("JOIN pg_temp.claves_afectadas ki "
+                              "ON ki.fecha = fi.fecha AND ki.rutaid = fi.rutaid")
     
-    # Insertar
-    placeholders = ','.join(['%s'] * len(columns))
-    query = f"""
-        INSERT INTO analytics.{table_name} ({','.join(columns)})
-        VALUES ({placeholders})
-    """
+    cursor.execute(
+        f"INSERT INTO analytics.agg_ventas_incidencias_diarias ({ROLLUP_COLUMNAS}) "
+        + ROLLUP_SELECT.format(filtro_ventas=filtro_ventas, filtro_incidencias=filtro_incidencias)
+    )
+    filas = cursor.rowcount
+    conn.commit()
     
-    execute_batch(cursor, query, values, page_size=500)
+    if meses is not None:
+        alcance = f"{len(meses)} meses ({', '.join(str(m) for m in meses)})"
+    else:
+        alcance = "completo" if claves is None else f"{len(claves)} claves (fecha, ruta)"
+    logger.info(f"  ✅ Rollup diario refrescado ({alcance}): {filas} filas día-ruta")
+    return filas
+
+# =====================================================
+# ESTADO ETL (WATERMARKS)
+# =====================================================
+
+def ensure_etl_state(conn):
+    """Crea la tabla analytics.etl_state si no existe"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics.etl_state (
+            tabla VARCHAR(50) PRIMARY KEY,
+            columna_watermark VARCHAR(50) NOT NULL,
+            watermark TEXT,
+            filas_ultima_carga INTEGER,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
     conn.commit()
+
+def _clave_estado(tabla: str, fuente_id: str = FUENTE_PRINCIPAL) -> str:
+    """Fila de etl_state: 'ventas' para la fuente principal, 'norte/ventas' para las demás"""
+    return tabla if fuente_id == FUENTE_PRINCIPAL else f"{fuente_id}/{tabla}"
+
+def get_watermarks(conn, fuente_id: str = FUENTE_PRINCIPAL) -> Dict[str, Optional[str]]:
+    """Lee los watermarks vigentes de una fuente (se ignoran si cambió la columna configurada)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT tabla, columna_watermark, watermark FROM analytics.etl_state")
+    estado = {tabla: (columna, valor) for tabla, columna, valor in cursor.fetchall()}
     
-    logger.info(f"  ✅ {table_name}: {len(df)} registros cargados")
+    watermarks = {}
+    for tabla, columna in WATERMARKS.items():
+        columna_guardada, valor = estado.get(_clave_estado(tabla, fuente_id), (None, None))
+        watermarks[tabla] = valor if columna_guardada == columna else None
+    return watermarks
+
+def save_watermarks(conn, maximos: Dict[str, Tuple[object, int]], fuente_id: str = FUENTE_PRINCIPAL):
+    """Avanza el watermark de cada tabla al máximo (valor, filas) extraído en esta ejecución"""
+    cursor = conn.cursor()
+    for tabla, columna in WATERMARKS.items():
+        maximo, filas = maximos.get(tabla, (None, 0))
+        if maximo is None or filas == 0:
+            continue
+        if isinstance(maximo, pd.Timestamp) and maximo == maximo.normalize():
+            maximo = maximo.date()  # Columnas DATE: se guarda 'YYYY-MM-DD'
+        cursor.execute("""
+            INSERT INTO analytics.etl_state (tabla, columna_watermark, watermark, filas_ultima_carga, actualizado)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (tabla) DO UPDATE SET
+                columna_watermark = EXCLUDED.columna_watermark,
+                watermark = EXCLUDED.watermark,
+                filas_ultima_carga = EXCLUDED.filas_ultima_carga,
+                actualizado = EXCLUDED.actualizado
+        """, (_clave_estado(tabla, fuente_id), columna, str(maximo), filas))
+        logger.info(f"  🔖 Watermark {_clave_estado(tabla, fuente_id)}.{columna} = {maximo}")
+    conn.commit()
+
+def truncate_analytics(conn):
+    """Vacía hechos y dimensiones (respetando las FK). run_etl ya no lo usa: la recarga completa
+    sustituye los hechos por intercambio de particiones sin dejar el schema vacío"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        TRUNCATE analytics.agg_ventas_incidencias_diarias,
+                 analytics.fact_ventas, analytics.fact_incidencias,
+                 analytics.dim_calendario, analytics.dim_productos,
+                 analytics.dim_rutas, analytics.dim_tipo_incidencia
+    """)
+    cursor.execute("DELETE FROM analytics.etl_state")
+    conn.commit()
+    logger.info("🧹 Schema analytics vaciado para recarga completa")
+
+def purgar_dimensiones(conn, vigentes: Dict[str, Tuple[str, pd.Series]]) -> int:
+    """Recarga completa sin vaciar: borra de cada dimensión las claves que ya no vienen en el
+    origen. Va después de sustituir los hechos, cuando ninguna partición las referencia"""
+    cursor = conn.cursor()
+    borradas = 0
+    for tabla, (columna, valores) in vigentes.items():
+        valores = pd.Series(valores).drop_duplicates()
+        if pd.api.types.is_datetime64_any_dtype(valores):
+            valores = valores.dt.date
+        cursor.execute(f"DELETE FROM analytics.{tabla} WHERE NOT ({columna} = ANY(%s))", (valores.tolist(),))
+        borradas += cursor.rowcount
+    conn.commit()
+    if borradas:
+        logger.info(f"  🧹 Dimensiones: {borradas} claves que ya no están en el origen eliminadas")
+    return borradas
 
-def create_tipo_incidencia_catalog(conn, incidencias_df: pd.DataFrame):
+def create_tipo_incidencia_catalog(conn, incidencias_df: pd.DataFrame, incremental: bool = False,
+                                   formato: str = COPY_FORMAT):
     """Crea catálogo de tipos de incidencia"""
     logger.info("📋 Creando catálogo dim_tipo_incidencia...")
     
@@ -283,80 +1265,398 @@ def create_tipo_incidencia_catalog(conn, incidencias_df: pd.DataFrame):
         })
     
     df_catalog = pd.DataFrame(catalog)
-    load_dimension(conn, 'dim_tipo_incidencia', df_catalog, 'tipo_incidencia')
+    load_dimension(conn, 'dim_tipo_incidencia', df_catalog, 'tipo_incidencia', incremental, formato)
 
 # =====================================================
 # PROCESO ETL PRINCIPAL
 # =====================================================
 
-def run_etl():
-    """Ejecuta el proceso ETL completo"""
+def run_etl(modo: str = 'incremental', meses: Optional[List[str]] = None,
+            streaming: bool = True, fetch_size: int = FETCH_SIZE,
+            extract_workers: int = EXTRACT_WORKERS, workers: int = DAG_WORKERS, usar_cache: bool = True,
+            metricas_path: Optional[str] = str(METRICAS_PATH), prometheus_path: Optional[str] = None,
+            perfilar: Optional[List[str]] = None, dir_perfiles: str = str(PERFILES_DIR),
+            resume: Optional[str] = None, checkpoints: bool = True, fuentes: Optional[str] = None,
+            copy_format: str = COPY_FORMAT):
+    """Ejecuta el proceso ETL ('incremental' por watermark, 'completo' o 'meses' a recargar).
+    Con `fuentes` (JSON de regiones) extrae de todas esas bases raw a la vez hacia un único analytics"""
     start_time = datetime.now()
+    parametros = None
+    if resume:
+        # Misma ejecución: mismo modo, meses y watermarks que cuando falló
+        if not CheckpointDAG.existe(resume):
+            raise ValueError(f"No hay checkpoint de la ejecución {resume} en {RUNS_DIR}")
+        parametros = CheckpointDAG(resume).leer_parametros()
+        modo, meses, fuentes = parametros['modo'], parametros['meses'], parametros.get('fuentes')
+    incremental = modo == 'incremental'
+    completo = modo == 'completo'
+    if modo == 'meses' and not meses:
+        raise ValueError("El modo 'meses' necesita la lista de meses a recargar (YYYY-MM)")
+    # Meses cuyas particiones se sustituyen enteras (aunque ahora vengan vacíos)
+    periodos = sorted({pd.Period(m, 'M') for m in meses}) if modo == 'meses' else None
+    lista_fuentes = cargar_fuentes(fuentes) if fuentes else []
+    metricas = MetricasETL(metricas_path, prometheus_path, perfilar, dir_perfiles, run_id=resume)
+    checkpoint = CheckpointDAG(metricas.run_id) if resume or checkpoints else None
     logger.info("=" * 60)
-    logger.info("🚀 INICIANDO ETL PIPELINE")
+    logger.info(f"🚀 {'REANUDANDO' if resume else 'INICIANDO'} ETL PIPELINE (modo {modo}, run {metricas.run_id})")
     logger.info("=" * 60)
     
+    pool = None
+    exito = False
     try:
         # 1. CONECTAR
-        conn = get_connection()
+        with metricas.etapa('conexion'):
+            conn = get_connection()
+            # Pool: una conexión por tabla en la extracción y hasta dos por etapa del DAG
+            # (la carga de ventas en streaming lee con un cursor y escribe con otra)
+            pool = create_pool(max(extract_workers, 2 * workers) + 1)
+        cache = StagingCache() if usar_cache else None
+        if cache is not None and not cache.disponible:
+            cache = None
+        ensure_etl_state(conn)
+        ensure_rollup(conn)
+        ensure_cuarentena(conn)
+        verificar_particiones(conn)
         
-        # 2. EXTRACT
-        raw_data = extract_raw_data(conn)
+        if lista_fuentes:
+            logger.info(f"📡 Fuentes: {', '.join(f.fuente_id for f in lista_fuentes)}")
+        if incremental:
+            if parametros:
+                watermarks = parametros['watermarks']
+            elif lista_fuentes:
+                # Un juego de watermarks por fuente
+                watermarks = {f.fuente_id: get_watermarks(conn, f.fuente_id) for f in lista_fuentes}
+            else:
+                watermarks = get_watermarks(conn)
+            logger.info(f"🔖 Watermarks: {watermarks}")
+        elif not completo:
+            # Solo los hechos de esos meses; las dimensiones se extraen enteras y se actualizan
+            watermarks = ventana_meses(meses)
+            logger.info(f"📅 Recarga de meses: {', '.join(sorted(set(meses)))}")
+        else:
+            # Sin vaciar nada: los hechos se sustituyen al final, de una vez, por intercambio de
+            # particiones y Power BI sigue viendo los datos anteriores mientras tanto
+            watermarks = None
+        conn.close()
+        if checkpoint is not None and parametros is None:
+            checkpoint.guardar_parametros({'modo': modo, 'meses': meses, 'fuentes': fuentes,
+                                           'watermarks': watermarks if incremental else None})
         
-        # 3. TRANSFORM
-        logger.info("\n🔄 FASE DE TRANSFORMACIÓN")
-        logger.info("-" * 60)
+        # 2. DAG DE ETAPAS
+        # Cada etapa de BD usa su propia conexión del pool: las independientes se solapan
+        # Con varias fuentes todas las tablas (también ventas) salen de la extracción asíncrona
+        tablas_stream = TABLAS_STREAMING if streaming and not lista_fuentes else []
         
-        dim_calendario = transform_calendario(raw_data['calendario'])
-        dim_productos = transform_productos(raw_data['productos'])
-        dim_rutas = transform_rutas(raw_data['rutas'])
+        def extraer_tabla_fuente(conexion, fuente_id: str, name: str) -> pd.DataFrame:
+            # Incremental: cada fuente tiene sus propios watermarks; meses / completo: los mismos
+            query, params = build_extract_queries(watermarks[fuente_id] if incremental else watermarks)[name]
+            return aplicar_esquema(pd.read_sql(query, conexion, params=params or None), name)
         
-        # Transformar hechos (incidencias primero para usar en ventas)
-        fact_incidencias = transform_incidencias(raw_data['incidencias'])
-        fact_ventas = transform_ventas(raw_data['ventas'], raw_data['incidencias'])
+        def extraer():
+            if lista_fuentes:
+                raw, resultados = extraer_fuentes(lista_fuentes, TABLAS_RAW, extraer_tabla_fuente,
+                                                  list(WATERMARKS), metricas)
+                apartadas = [r.fuente_id for r in resultados if r.error is not None]
+                if apartadas and not incremental:
+                    # El intercambio de particiones dejaría esos meses sin las filas de estas fuentes
+                    raise RuntimeError(f"Fuentes no disponibles en recarga {modo}: {', '.join(apartadas)}")
+            else:
+                raw = extract_raw_data_parallel(
+                    pool, watermarks, [t for t in TABLAS_RAW if t not in tablas_stream], extract_workers,
+                    cache, metricas
+                )
+            acumular(filas=sum(len(df) for df in raw.values()))
+            return raw
         
-        # 4. LOAD
-        logger.info("\n💾 FASE DE CARGA")
-        logger.info("-" * 60)
+        def transformar(funcion: Callable[[pd.DataFrame], pd.DataFrame], tabla: str):
+            def etapa(raw):
+                acumular(filas=len(raw[tabla]))
+                return funcion(raw[tabla])
+            return etapa
         
-        # Cargar dimensiones primero
-        load_dimension(conn, 'dim_calendario', dim_calendario, 'fecha')
-        load_dimension(conn, 'dim_productos', dim_productos, 'productoid')
-        load_dimension(conn, 'dim_rutas', dim_rutas, 'rutaid')
-        create_tipo_incidencia_catalog(conn, fact_incidencias)
+        def transformar_incidencias(incidencias_resueltas):
+            acumular(filas=len(incidencias_resueltas))
+            return transform_incidencias(incidencias_resueltas)
         
-        # Cargar hechos
-        load_fact_table(conn, 'fact_incidencias', fact_incidencias, ['incidenciaid'])
-        load_fact_table(conn, 'fact_ventas', fact_ventas, ['ticketid', 'fecha_ruta', 'productoid'])
+        def resolver_incidencias(raw, resolutor):
+            acumular(filas=len(raw['incidencias']))
+            resueltas, apartadas = resolutor.separar(raw['incidencias'], 'incidencias')
+            return resueltas, [] if apartadas is None else [apartadas]
         
-        # 5. CERRAR CONEXIÓN
-        conn.close()
+        def cargar_dimension(tabla: str, clave: str):
+            def etapa(df):
+                acumular(filas=len(df))
+                with conexion_pool(pool) as conexion:
+                    return load_dimension(conexion, tabla, df, clave, True, copy_format)
+            return etapa
+        
+        # Restricciones del DDL (catálogo) y claves válidas de las dimensiones transformadas
+        def leer_restricciones(dim_calendario, dim_productos, dim_rutas):
+            with conexion_pool(pool) as conexion:
+                return ValidadorHechos.desde_catalogo(conexion, TABLAS_PARTICIONADAS, {
+                    'dim_calendario': dim_calendario, 'dim_productos': dim_productos, 'dim_rutas': dim_rutas,
+                })
+        
+        def validar_incidencias(incidencias_transformadas, validador):
+            acumular(filas=len(incidencias_transformadas))
+            validas, apartadas = validador.validar(incidencias_transformadas, 'fact_incidencias')
+            return validas, [apartadas]
+        
+        def cargar_tipos_incidencia(fact_incidencias):
+            with conexion_pool(pool) as conexion:
+                create_tipo_incidencia_catalog(conexion, fact_incidencias, True, copy_format)
+        
+        # Hechos: UPSERT en incremental; si no, staging UNLOGGED por mes e intercambio de
+        # particiones (todas en recarga completa, solo las de --meses en modo meses)
+        def cargar_incidencias(fact_incidencias):
+            with conexion_pool(pool) as conexion:
+                acumular(filas=load_fact_table(conexion, 'fact_incidencias', fact_incidencias,
+                                               ['incidenciaid', 'fecha', 'fuente_id'], incremental,
+                                               conservar_otros_meses=not completo, meses=periodos,
+                                               formato=copy_format))
+        
+        # Ventas: pipeline extract → transform → load por bloques (la etapa incluye las tres).
+        # El cursor de servidor necesita su propia conexión mientras COPY usa otra.
+        def cargar_ventas(raw, incidencias_resueltas, resolutor, validador):
+            resumen_ventas = {'filas': 0, 'watermark': None, 'claves': [], 'cuarentena': [],
+                              'cuarentena_claves': []}
+            with contextlib.ExitStack() as pila:
+                if tablas_stream:
+                    extract_conn = pila.enter_context(conexion_pool(pool))
+                    bloques_ventas = stream_raw_table(extract_conn, 'ventas', watermarks, fetch_size, cache)
+                else:
+                    bloques_ventas = [raw['ventas']]
+                fact_ventas = validador.validar_bloques(
+                    transform_ventas_stream(bloques_ventas, incidencias_resueltas, resumen_ventas, resolutor),
+                    'fact_ventas', resumen_ventas['cuarentena']
+                )
+                conexion = pila.enter_context(conexion_pool(pool))
+                acumular(filas=load_fact_table(conexion, 'fact_ventas', fact_ventas,
+                                               ['ticketid', 'fecha_ruta', 'productoid', 'fecha', 'fuente_id'],
+                                               incremental,
+                                               conservar_otros_meses=not completo, meses=periodos,
+                                               formato=copy_format))
+            return resumen_ventas
+        
+        def purgar(dim_calendario, dim_productos, dim_rutas, fact_incidencias):
+            with conexion_pool(pool) as conexion:
+                acumular(filas=purgar_dimensiones(conexion, {
+                    'dim_tipo_incidencia': ('tipo_incidencia', fact_incidencias['tipo_incidencia']),
+                    'dim_calendario': ('fecha', dim_calendario['fecha']),
+                    'dim_productos': ('productoid', dim_productos['productoid']),
+                    'dim_rutas': ('rutaid', dim_rutas['rutaid']),
+                }))
+        
+        def claves_afectadas(resumen_ventas, fact_incidencias) -> Optional[pd.DataFrame]:
+            if completo:
+                return None
+            # Incidencias nuevas pueden afectar a ventas ya cargadas de días anteriores
+            claves = pd.concat(resumen_ventas['claves'] + [fact_incidencias[['fecha', 'rutaid']]])
+            acumular(filas=len(claves))
+            return claves
+        
+        def refrescar_tiene_incidencia(claves):
+            with conexion_pool(pool) as conexion:
+                refresh_tiene_incidencia(conexion, claves)
+        
+        def refrescar_rollup(claves):
+            with conexion_pool(pool) as conexion:
+                acumular(filas=refresh_rollup_diario(conexion, claves, periodos))
         
-        # 6. RESUMEN
+        # El watermark solo avanza cuando la carga ha terminado (recargar meses pasados no lo mueve)
+        def guardar_watermarks(raw, resumen_ventas):
+            if not (incremental or completo):
+                return
+            incidencias_raw = raw['incidencias']
+            if lista_fuentes:
+                # Por fuente: una fuente apartada no tiene filas y conserva su watermark
+                with conexion_pool(pool) as conexion:
+                    for fuente in lista_fuentes:
+                        maximos = {}
+                        for tabla, columna in WATERMARKS.items():
+                            valores_fuente = raw[tabla].loc[raw[tabla]['fuente_id'] == fuente.fuente_id, columna]
+                            maximos[tabla] = (valores_fuente.max() if len(valores_fuente) else None,
+                                              len(valores_fuente))
+                        save_watermarks(conexion, maximos, fuente.fuente_id)
+                return
+            with conexion_pool(pool) as conexion:
+                save_watermarks(conexion, {
+                    'ventas': (resumen_ventas['watermark'], resumen_ventas['filas']),
+                    'incidencias': (
+                        incidencias_raw[WATERMARKS['incidencias']].max() if len(incidencias_raw) else None,
+                        len(incidencias_raw)
+                    ),
+                })
+        
+        cargas_dimensiones = ['load:dim_calendario', 'load:dim_productos', 'load:dim_rutas']
+        cargas_hechos = ['load:fact_incidencias', 'load:fact_ventas']
+        etapas = [
+            Etapa('extract', extraer, salidas=['raw']),
+            Etapa('transform:calendario', transformar(transform_calendario, 'calendario'), ['raw'],
+                  ['dim_calendario']),
+            Etapa('transform:productos', transformar(transform_productos, 'productos'), ['raw'], ['dim_productos']),
+            Etapa('transform:rutas', transformar(transform_rutas, 'rutas'), ['raw'], ['dim_rutas']),
+            # Claves naturales → surrogate: mapas construidos una vez desde las dimensiones.
+            # Incidencias y ventas comparten las claves enteras ya resueltas; las filas sin clave
+            # son salida de la etapa que las aparta (el resolutor no cambia tras construirse)
+            Etapa('resolver_claves:dimensiones', ResolutorClaves, ['dim_rutas', 'dim_productos', 'dim_calendario'],
+                  ['resolutor']),
+            Etapa('resolver_claves:incidencias', resolver_incidencias, ['raw', 'resolutor'],
+                  ['incidencias_resueltas', 'cuarentena_claves_incidencias']),
+            Etapa('transform:incidencias', transformar_incidencias, ['incidencias_resueltas'],
+                  ['incidencias_transformadas']),
+            # Validación previa a la carga: las filas que romperían el COPY / UPSERT se apartan
+            Etapa('validar:restricciones', leer_restricciones, ['dim_calendario', 'dim_productos', 'dim_rutas'],
+                  ['validador']),
+            Etapa('validar:fact_incidencias', validar_incidencias, ['incidencias_transformadas', 'validador'],
+                  ['fact_incidencias', 'cuarentena_incidencias']),
+            # Dimensiones siempre con UPSERT: los hechos vigentes las siguen referenciando
+            Etapa('load:dim_calendario', cargar_dimension('dim_calendario', 'fecha'), ['dim_calendario']),
+            Etapa('load:dim_productos', cargar_dimension('dim_productos', 'productoid'), ['dim_productos']),
+            Etapa('load:dim_rutas', cargar_dimension('dim_rutas', 'rutaid'), ['dim_rutas']),
+            Etapa('load:dim_tipo_incidencia', cargar_tipos_incidencia, ['fact_incidencias']),
+            # Los hechos solo esperan a las dimensiones que referencian (FK)
+            Etapa('load:fact_incidencias', cargar_incidencias, ['fact_incidencias'],
+                  despues=['load:dim_calendario', 'load:dim_rutas', 'load:dim_tipo_incidencia']),
+            Etapa('load:fact_ventas', cargar_ventas, ['raw', 'incidencias_resueltas', 'resolutor', 'validador'],
+                  ['resumen_ventas'], despues=cargas_dimensiones),
+            Etapa('claves_afectadas', claves_afectadas, ['resumen_ventas', 'fact_incidencias'], ['claves']),
+            Etapa('refresh_rollup_diario', refrescar_rollup, ['claves'], despues=cargas_hechos),
+        ]
+        if completo:
+            etapas.append(Etapa('purgar_dimensiones', purgar,
+                                ['dim_calendario', 'dim_productos', 'dim_rutas', 'fact_incidencias'],
+                                despues=cargas_hechos))
+        else:
+            etapas.append(Etapa('refresh_tiene_incidencia', refrescar_tiene_incidencia, ['claves'],
+                                despues=cargas_hechos))
+        etapas.append(Etapa('commit', guardar_watermarks, ['raw', 'resumen_ventas'],
+                            despues=[e.nombre for e in etapas if e.nombre.startswith(('load:', 'refresh_', 'purgar_'))]))
+        
+        # Con checkpoint, cada etapa terminada deja sus salidas en runs/<run_id>/ y al reanudar
+        # no se repite: las cargas ya confirmadas no se vuelven a hacer y la que falló sí
+        dag = PlanificadorDAG(etapas, workers, metricas, checkpoint)
+        try:
+            valores = dag.ejecutar()
+        finally:
+            dag.registrar_resumen()
+        resumen_ventas = valores['resumen_ventas']
+        registrar_cuarentena({'incidencias': valores['cuarentena_claves_incidencias'],
+                              'ventas': resumen_ventas['cuarentena_claves']})
+        # Claves no resueltas y filas que incumplen el DDL, en analytics.quarantine_<tabla>
+        with conexion_pool(pool) as conexion:
+            en_cuarentena = guardar_cuarentena(conexion, metricas.run_id, {
+                'fact_ventas': resumen_ventas['cuarentena_claves'] + resumen_ventas['cuarentena'],
+                'fact_incidencias': valores['cuarentena_claves_incidencias'] + valores['cuarentena_incidencias'],
+            })
+        
+        # 3. RESUMEN
         duration = (datetime.now() - start_time).total_seconds()
         logger.info("\n" + "=" * 60)
         logger.info("✅ ETL COMPLETADO EXITOSAMENTE")
         logger.info(f"⏱️  Duración: {duration:.2f} segundos")
         logger.info("=" * 60)
         logger.info(f"📊 Registros procesados:")
-        logger.info(f"   - Calendario: {len(dim_calendario)}")
-        logger.info(f"   - Productos: {len(dim_productos)}")
-        logger.info(f"   - Rutas: {len(dim_rutas)}")
-        logger.info(f"   - Ventas: {len(fact_ventas)}")
-        logger.info(f"   - Incidencias: {len(fact_incidencias)}")
+        logger.info(f"   - Calendario: {len(valores['dim_calendario'])}")
+        logger.info(f"   - Productos: {len(valores['dim_productos'])}")
+        logger.info(f"   - Rutas: {len(valores['dim_rutas'])}")
+        logger.info(f"   - Ventas: {valores['resumen_ventas']['filas']}")
+        logger.info(f"   - Incidencias: {len(valores['fact_incidencias'])}")
+        if en_cuarentena:
+            logger.info(f"   - En cuarentena (claves no resueltas o fuera del DDL): {en_cuarentena}")
+        logger.info(f"⏱️  Etapas (de más a menos lenta):")
+        for linea in metricas.resumen():
+            logger.info(linea)
         logger.info("=" * 60)
         
+        exito = True
+        if checkpoint is not None:
+            checkpoint.borrar()
         return True
         
     except Exception as e:
         logger.error(f"\n❌ ERROR EN ETL: {e}")
         logger.exception("Detalles del error:")
+        if checkpoint is not None:
+            logger.error(f"💾 Etapas terminadas guardadas en {checkpoint.directorio}: "
+                         f"reanudar con --resume {metricas.run_id}")
         return False
+    
+    finally:
+        if pool is not None:
+            pool.closeall()
+        metricas.escribir_prometheus(exito)
 
-# =====================================================
-# EJECUTAR
-# =====================================================
+def parse_args(argv=None):
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="ETL PIPELINE: RAW → ANALYTICS")
+    parser.add_argument(
+        '--modo', choices=['incremental', 'completo', 'meses'], default='incremental',
+        help="incremental: solo filas >= watermark con UPSERT; completo: recarga todo y sustituye los hechos "
+             "de una vez; "
+             "meses: sustituye solo las particiones de los meses de --meses"
+    )
+    parser.add_argument(
+        '--meses', nargs='+', default=None, metavar='YYYY-MM',
+        help="Meses a recargar con --modo meses (ej: 2025-03 2025-04)"
+    )
+    parser.add_argument(
+        '--sin-streaming', dest='streaming', action='store_false',
+        help="Extrae ventas de una vez en memoria en lugar de por bloques con cursor de servidor"
+    )
+    parser.add_argument(
+        '--fetch-size', type=int, default=FETCH_SIZE,
+        help=f"Filas por bloque en la extracción en streaming (por defecto {FETCH_SIZE})"
+    )
+    parser.add_argument(
+        '--extract-workers', type=int, default=EXTRACT_WORKERS,
+        help=f"Hilos/conexiones para extraer las tablas raw en paralelo (por defecto {EXTRACT_WORKERS})"
+    )
+    parser.add_argument(
+        '--workers', type=int, default=DAG_WORKERS,
+        help=f"Etapas del ETL (transformaciones y cargas independientes) en paralelo (por defecto {DAG_WORKERS})"
+    )
+    parser.add_argument(
+        '--copy-format', choices=['text', 'binary'], default=COPY_FORMAT,
+        help=f"Formato de COPY FROM STDIN en las cargas: text (CSV) o binary (PGCOPY) (por defecto {COPY_FORMAT})"
+    )
+    parser.add_argument(
+        '--sin-cache', dest='usar_cache', action='store_false',
+        help="Ignora el staging local en Parquet y vuelve a descargar todas las tablas raw"
+    )
+    parser.add_argument(
+        '--metricas', dest='metricas_path', default=str(METRICAS_PATH),
+        help=f"Fichero JSON lines con las métricas por etapa (por defecto {METRICAS_PATH})"
+    )
+    parser.add_argument(
+        '--prometheus', dest='prometheus_path', default=None,
+        help="Escribe también las métricas en formato texto de Prometheus en este fichero"
+    )
+    parser.add_argument(
+        '--perfilar', nargs='*', default=None, metavar='ETAPA',
+        help="Guarda un perfil cProfile por etapa (todas si no se indica ninguna; ej: extract load:fact_ventas)"
+    )
+    parser.add_argument(
+        '--dir-perfiles', default=str(PERFILES_DIR),
+        help=f"Directorio de los .prof (por defecto {PERFILES_DIR})"
+    )
+    parser.add_argument(
+        '--fuentes', default=None, metavar='JSON',
+        help="Fichero JSON con las bases raw de cada región ([{\"id\", \"dsn\", \"max_conexiones\", "
+             "\"timeout\"}]): se extraen a la vez y se cargan en el analytics de DB_CONFIG"
+    )
+    parser.add_argument(
+        '--resume', default=None, metavar='RUN_ID',
+        help="Reanuda una ejecución fallida: salta las etapas ya terminadas y sigue desde la que falló "
+             "(con el modo, meses y watermarks de esa ejecución)"
+    )
+    parser.add_argument(
+        '--sin-checkpoint', dest='checkpoints', action='store_false',
+        help=f"No guarda las salidas de cada etapa en {RUNS_DIR}/<run_id> (la ejecución no se podrá reanudar)"
+    )
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    success = run_etl()
+    args = parse_args()
+    success = run_etl(**vars(args))
     sys.exit(0 if success else 1)
@@ -3,16 +3,35 @@ Script para generar datos de ventas realistas con:
 - Múltiples tickets por Fecha-Ruta
 - Cada ticket con varios productos
 - PK: TicketID + Producto (línea de venta)
+
+La generación está vectorizada con NumPy, es reproducible (semilla) y
+escala a decenas de millones de filas: las fechas se reparten en bloques
+que generan procesos independientes, y cada bloque se escribe como un
+shard CSV (opcionalmente comprimido) en el directorio de salida.
+
+Factor de escala: cada ruta-día suma `escala` tandas de 2-8 tickets, así
+que las distribuciones por ticket y por línea no cambian y el volumen
+crece linealmente (escala 1 ≈ 7.300 filas para Q1 2024). Con la misma
+semilla y el mismo --filas-por-bloque la salida es idéntica, con
+independencia del número de procesos.
+
+Uso:
+    python generar_ventas_realistas.py
+    python generar_ventas_realistas.py --escala 100 --semilla 7 --compresion gzip
+    python generar_ventas_realistas.py --inicio 2024-01-01 --fin 2024-12-31 --salida D:/datos/ventas
 """
 
-import pandas as pd
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import numpy as np
-from datetime import datetime, timedelta
-import random
+import pandas as pd
 
 # Configuración
-FECHA_INICIO = datetime(2024, 1, 1)
-FECHA_FIN = datetime(2024, 3, 31)
+FECHA_INICIO = "2024-01-01"
+FECHA_FIN = "2024-03-31"
 RUTAS = ["MAD-BCN", "BCN-MAD", "MAD-PMI", "PMI-MAD", "MAD-AGP", "AGP-MAD", "BCN-PMI", "PMI-BCN"]
 PRODUCTOS = ["Agua", "Cerveza", "Refresco", "Café", "Bocadillo", "Snack"]
 CATEGORIAS = {
@@ -36,66 +55,189 @@ PRECIOS = {
 PASAJEROS_MIN = 50
 PASAJEROS_MAX = 250
 
-datos = []
-ticket_id = 1
-
-# Iterar por fechas
-fecha_actual = FECHA_INICIO
-while fecha_actual <= FECHA_FIN:
-    dia_semana = fecha_actual.strftime("%A")
-    
-    # Por cada ruta
-    for ruta in RUTAS:
-        # Tickets aleatorios por ruta-día (2-8 tickets)
-        num_tickets_ruta = random.randint(2, 8)
-        
-        # Pasajeros en esa ruta-día (1 valor para toda la ruta)
-        pasajeros_ruta = random.randint(PASAJEROS_MIN, PASAJEROS_MAX)
-        
-        for _ in range(num_tickets_ruta):
-            # Cada ticket tiene 1-3 productos
-            num_productos = random.randint(1, 3)
-            productos_ticket = random.sample(PRODUCTOS, num_productos)
-            
-            for producto in productos_ticket:
-                cantidad = random.randint(1, 3)
-                precio_unitario = PRECIOS[producto] + random.uniform(-0.5, 0.5)  # Variación
-                precio_unitario = round(precio_unitario, 2)
-                
-                # Objetivo de ventas (aproximado por ruta)
-                objetivo_ventas = random.randint(600, 2000)
-                
-                # Crear fila
-                fila = {
-                    "TicketID": ticket_id,
-                    "Fecha": fecha_actual.strftime("%Y-%m-%d"),
-                    "Ruta": ruta,
-                    "Fecha-Ruta": f"{fecha_actual.strftime('%Y-%m-%d')}_{ruta}",
-                    "Producto": producto,
-                    "Cantidad": cantidad,
-                    "PrecioUnit": precio_unitario,
-                    "Pasajeros": pasajeros_ruta,
-                    "ObjetivoVentas": objetivo_ventas,
-                    "DiaSemana": dia_semana
-                }
-                datos.append(fila)
-            
-            ticket_id += 1
-    
-    fecha_actual += timedelta(days=1)
-
-# Crear DataFrame
-df = pd.DataFrame(datos)
-
-# Guardar CSV
-ruta_salida = r"D:\OneDrive\Documentos\GitHub\Proyecto-Ventas-Incidencias\data\raw\Ventas_Realistas.csv"
-df.to_csv(ruta_salida, index=False)
-
-print(f"✅ Datos realistas generados: {ruta_salida}")
-print(f"📊 Total de filas: {len(df)}")
-print(f"🎫 Total de tickets únicos: {df['TicketID'].max()}")
-print(f"📅 Período: {df['Fecha'].min()} a {df['Fecha'].max()}")
-print(f"\n📋 Vista previa:")
-print(df.head(15))
-print(f"\n📈 Resumen por ruta:")
-print(df.groupby("Ruta")["TicketID"].nunique().sort_values(ascending=False))
+# Tickets por ruta-día en cada tanda (2-8) y productos por ticket (1-3)
+TICKETS_MIN, TICKETS_MAX = 2, 8
+PRODUCTOS_MIN, PRODUCTOS_MAX = 1, 3
+CANTIDAD_MIN, CANTIDAD_MAX = 1, 3
+OBJETIVO_MIN, OBJETIVO_MAX = 600, 2000
+VARIACION_PRECIO = 0.5
+
+# Filas aproximadas por bloque/shard (acota la memoria de cada proceso)
+FILAS_POR_BLOQUE = 1_000_000
+FILAS_MEDIAS_POR_TICKET = (PRODUCTOS_MIN + PRODUCTOS_MAX) / 2
+TICKETS_MEDIOS_POR_TANDA = (TICKETS_MIN + TICKETS_MAX) / 2
+
+# Mismo texto que strftime("%A") en locale C
+DIAS_SEMANA = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+SALIDA_POR_DEFECTO = Path(__file__).parent.parent / "data" / "raw"
+EXTENSIONES = {None: "", "gzip": ".gz", "bz2": ".bz2", "zstd": ".zst"}
+
+COLUMNAS = [
+    "TicketID", "Fecha", "Ruta", "Fecha-Ruta", "Producto", "Cantidad",
+    "PrecioUnit", "Pasajeros", "ObjetivoVentas", "DiaSemana"
+]
+
+
+def _generar_bloque(tarea: dict) -> dict:
+    """Genera y escribe un shard con todas las líneas de venta de un bloque de fechas"""
+    rng = np.random.default_rng(tarea["semilla"])
+    fechas = pd.DatetimeIndex(tarea["fechas"])
+    num_tickets = tarea["num_tickets"]          # (fechas, rutas)
+    pasajeros = tarea["pasajeros"]              # (fechas, rutas)
+    n_rutas = len(RUTAS)
+
+    # Ruta-día de cada ticket, en el mismo orden que el bucle original (fecha → ruta)
+    ruta_dia = np.repeat(np.arange(num_tickets.size), num_tickets.ravel())
+    n_tickets = len(ruta_dia)
+    ticket_ids = tarea["primer_ticket"] + np.arange(n_tickets, dtype=np.int64)
+
+    # Cada ticket lleva 1-3 productos distintos (muestra sin reemplazo = permutación truncada)
+    num_productos = rng.integers(PRODUCTOS_MIN, PRODUCTOS_MAX + 1, size=n_tickets)
+    permutaciones = np.argsort(rng.random((n_tickets, len(PRODUCTOS))), axis=1)
+    seleccion = np.arange(len(PRODUCTOS))[None, :] < num_productos[:, None]
+    ticket_linea = np.nonzero(seleccion)[0]
+    producto_linea = permutaciones[seleccion]
+    n_lineas = len(ticket_linea)
+
+    # Métricas por línea
+    precios_base = np.array([PRECIOS[p] for p in PRODUCTOS])
+    cantidad = rng.integers(CANTIDAD_MIN, CANTIDAD_MAX + 1, size=n_lineas)
+    precio_unitario = np.round(
+        precios_base[producto_linea] + rng.uniform(-VARIACION_PRECIO, VARIACION_PRECIO, size=n_lineas), 2
+    )
+    objetivo_ventas = rng.integers(OBJETIVO_MIN, OBJETIVO_MAX + 1, size=n_lineas)
+
+    # Atributos de la ruta-día (como categóricas: no se repiten strings por fila)
+    rd_linea = ruta_dia[ticket_linea]
+    fecha_linea = rd_linea // n_rutas
+    ruta_linea = rd_linea % n_rutas
+    fechas_txt = fechas.strftime("%Y-%m-%d")
+    fecha_ruta_txt = [f"{fecha}_{ruta}" for fecha in fechas_txt for ruta in RUTAS]
+
+    df = pd.DataFrame({
+        "TicketID": ticket_ids[ticket_linea],
+        "Fecha": pd.Categorical.from_codes(fecha_linea, categories=fechas_txt),
+        "Ruta": pd.Categorical.from_codes(ruta_linea, categories=RUTAS),
+        "Fecha-Ruta": pd.Categorical.from_codes(rd_linea, categories=fecha_ruta_txt),
+        "Producto": pd.Categorical.from_codes(producto_linea, categories=PRODUCTOS),
+        "Cantidad": cantidad,
+        "PrecioUnit": precio_unitario,
+        "Pasajeros": pasajeros.ravel()[rd_linea],
+        "ObjetivoVentas": objetivo_ventas,
+        "DiaSemana": pd.Categorical.from_codes(fechas.dayofweek.values[fecha_linea], categories=DIAS_SEMANA),
+    }, columns=COLUMNAS)
+
+    ruta = Path(tarea["salida"]) / f"Ventas_Realistas_part-{tarea['indice']:05d}.csv{EXTENSIONES[tarea['compresion']]}"
+    df.to_csv(ruta, index=False, compression=tarea["compresion"])
+
+    return {"shard": str(ruta), "filas": n_lineas, "tickets": n_tickets}
+
+
+def generar_ventas(escala: int = 1, fecha_inicio: str = FECHA_INICIO, fecha_fin: str = FECHA_FIN,
+                   semilla: int = 42, salida: Path = None, compresion: str = None,
+                   procesos: int = None, filas_por_bloque: int = FILAS_POR_BLOQUE) -> dict:
+    """Genera el dataset completo en shards y devuelve un resumen"""
+    if escala < 1:
+        raise ValueError("La escala debe ser >= 1")
+    if compresion not in EXTENSIONES:
+        raise ValueError(f"Compresión no soportada: {compresion}")
+
+    salida = Path(salida) if salida is not None else SALIDA_POR_DEFECTO / f"ventas_sf{escala}"
+    salida.mkdir(parents=True, exist_ok=True)
+
+    fechas = pd.date_range(fecha_inicio, fecha_fin, freq="D")
+    n_fechas, n_rutas = len(fechas), len(RUTAS)
+
+    # El proceso padre sortea lo que fija los TicketID (tickets por ruta-día) y los pasajeros,
+    # así cada bloque conoce su primer TicketID sin depender de los demás
+    semillas = np.random.SeedSequence(semilla)
+    semilla_padre, semilla_bloques = semillas.spawn(2)
+    rng = np.random.default_rng(semilla_padre)
+
+    num_tickets = np.zeros((n_fechas, n_rutas), dtype=np.int64)
+    for inicio in range(0, escala, 256):
+        tandas = min(256, escala - inicio)
+        num_tickets += rng.integers(TICKETS_MIN, TICKETS_MAX + 1, size=(n_fechas, n_rutas, tandas)).sum(axis=2)
+    pasajeros = rng.integers(PASAJEROS_MIN, PASAJEROS_MAX + 1, size=(n_fechas, n_rutas))
+
+    # Bloques de fechas con ~filas_por_bloque líneas cada uno
+    filas_por_dia = n_rutas * escala * TICKETS_MEDIOS_POR_TANDA * FILAS_MEDIAS_POR_TICKET
+    dias_por_bloque = max(1, int(filas_por_bloque // filas_por_dia))
+    cortes = list(range(0, n_fechas, dias_por_bloque))
+    tickets_por_bloque = [num_tickets[c:c + dias_por_bloque].sum() for c in cortes]
+    primeros_tickets = 1 + np.concatenate([[0], np.cumsum(tickets_por_bloque)[:-1]])
+
+    tareas = [
+        {
+            "indice": i,
+            "fechas": fechas[c:c + dias_por_bloque].values,
+            "num_tickets": num_tickets[c:c + dias_por_bloque],
+            "pasajeros": pasajeros[c:c + dias_por_bloque],
+            "primer_ticket": int(primeros_tickets[i]),
+            "semilla": semilla_hija,
+            "salida": str(salida),
+            "compresion": compresion,
+        }
+        for i, (c, semilla_hija) in enumerate(zip(cortes, semilla_bloques.spawn(len(cortes))))
+    ]
+
+    procesos = min(procesos or os.cpu_count() or 1, len(tareas))
+    if procesos > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            shards = list(executor.map(_generar_bloque, tareas))
+    else:
+        shards = [_generar_bloque(tarea) for tarea in tareas]
+
+    return {
+        "salida": salida,
+        "shards": shards,
+        "filas": sum(s["filas"] for s in shards),
+        "tickets": int(num_tickets.sum()),
+        "procesos": procesos,
+        "periodo": (fechas[0].strftime("%Y-%m-%d"), fechas[-1].strftime("%Y-%m-%d")),
+        "tickets_por_ruta": pd.Series(num_tickets.sum(axis=0), index=RUTAS),
+    }
+
+
+def parse_args(argv=None):
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Generador de ventas realistas (sintéticas)")
+    parser.add_argument("--escala", type=int, default=1, help="Factor de escala del volumen (1 ≈ 7.300 filas)")
+    parser.add_argument("--inicio", default=FECHA_INICIO, help="Primera fecha (YYYY-MM-DD)")
+    parser.add_argument("--fin", default=FECHA_FIN, help="Última fecha (YYYY-MM-DD)")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla para resultados reproducibles")
+    parser.add_argument("--salida", type=Path, default=None,
+                        help="Directorio de los shards (por defecto data/raw/ventas_sf<escala>)")
+    parser.add_argument("--compresion", choices=["gzip", "bz2", "zstd"], default=None,
+                        help="Comprime cada shard (zstd requiere el paquete zstandard)")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (por defecto nº de CPUs)")
+    parser.add_argument("--filas-por-bloque", type=int, default=FILAS_POR_BLOQUE,
+                        help="Filas aproximadas por shard")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    resumen = generar_ventas(
+        escala=args.escala,
+        fecha_inicio=args.inicio,
+        fecha_fin=args.fin,
+        semilla=args.semilla,
+        salida=args.salida,
+        compresion=args.compresion,
+        procesos=args.procesos,
+        filas_por_bloque=args.filas_por_bloque,
+    )
+
+    print(f"✅ Datos realistas generados: {resumen['salida']}")
+    print(f"📦 Shards: {len(resumen['shards'])} (procesos: {resumen['procesos']})")
+    print(f"📊 Total de filas: {resumen['filas']:,}")
+    print(f"🎫 Total de tickets únicos: {resumen['tickets']:,}")
+    print(f"📅 Período: {resumen['periodo'][0]} a {resumen['periodo'][1]}")
+    print(f"\n📈 Resumen por ruta:")
+    print(resumen["tickets_por_ruta"].sort_values(ascending=False))
+
+
+if __name__ == "__main__":
+    main()
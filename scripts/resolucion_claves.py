@@ -0,0 +1,174 @@
+"""
+=====================================================
+RESOLUCIÓN DE CLAVES NATURALES → SURROGATE
+=====================================================
+Etapa entre extract y transform de los hechos:
+
+- Construye una vez, a partir de las dimensiones ya
+  transformadas, los mapas nombre de ruta → rutaid,
+  nombre de producto → productoid y el índice de fechas
+  del calendario
+- Resuelve las columnas de los hechos con
+  Index.get_indexer sobre los valores distintos (una
+  búsqueda por valor, no por fila, y sin merges):
+  ruta / producto en texto, o la ruta del texto
+  "YYYY-MM-DD_RUTA" si solo viene fecha_ruta
+- Si el hecho ya trae rutaid / productoid, comprueba
+  que existen en la dimensión
+- Las filas sin clave válida se apartan en bloque con
+  su motivo (cuarentena) en lugar de romper el COPY
+  por la foreign key; separar() las devuelve junto a
+  las resueltas para que el pipeline las trate como
+  salida de etapa (el resolutor no guarda estado y se
+  puede guardar en checkpoint al construirse)
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from esquema_tipos import aplicar_esquema
+
+logger = logging.getLogger(__name__)
+
+# Motivos de cuarentena
+SIN_FECHA = 'fecha_fuera_de_calendario'
+SIN_RUTA = 'ruta_desconocida'
+SIN_PRODUCTO = 'producto_desconocido'
+
+
+def _normalizar(valores) -> pd.Index:
+    """Texto comparable: sin espacios en los extremos y sin distinguir mayúsculas"""
+    return pd.Index(pd.Series(valores, dtype=object).astype(str).str.strip().str.casefold())
+
+
+def _buscar(valores: pd.Series, indice: pd.Index, normalizar: bool = False) -> np.ndarray:
+    """Posición en `indice` de cada valor (-1 si no está o es nulo), una búsqueda por valor distinto"""
+    codigos, distintos = pd.factorize(valores)
+    if len(distintos) == 0:
+        return np.full(len(valores), -1, dtype=np.int64)
+    distintos = _normalizar(distintos) if normalizar else pd.Index(distintos)
+    posiciones = indice.get_indexer(distintos)
+    return np.where(codigos >= 0, posiciones[codigos], -1)
+
+
+def _indice_unico(nombre: str, claves: pd.Index, ids: pd.Series):
+    """Índice sin duplicados (get_indexer lo exige); ante duplicados gana el primero"""
+    duplicados = claves.duplicated()
+    if duplicados.any():
+        logger.warning(f"  ⚠️ {nombre}: {int(duplicados.sum())} claves duplicadas en la dimensión, se usa la primera")
+    return claves[~duplicados], ids.to_numpy()[~duplicados]
+
+
+def _texto_ruta(df: pd.DataFrame) -> Optional[pd.Series]:
+    """Nombre de la ruta: columna `ruta` o la parte tras '_' de fecha_ruta (parseada por valor distinto)"""
+    if 'ruta' in df.columns:
+        return df['ruta']
+    if 'fecha_ruta' not in df.columns:
+        return None
+    codigos, distintos = pd.factorize(df['fecha_ruta'])
+    rutas = pd.Series(distintos, dtype=object).str.split('_', n=1).str[1].to_numpy(dtype=object)
+    return pd.Series(np.where(codigos >= 0, rutas[codigos] if len(rutas) else None, None), index=df.index)
+
+
+def _texto_fecha_ruta(fechas: pd.Series, nombres: np.ndarray, posiciones: np.ndarray) -> np.ndarray:
+    """Texto "YYYY-MM-DD_RUTA" (formateado una vez por par distinto)"""
+    pares = pd.MultiIndex.from_arrays([pd.to_datetime(fechas).to_numpy(), posiciones])
+    codigos, distintos = pares.factorize()
+    textos = (pd.DatetimeIndex(distintos.get_level_values(0)).strftime('%Y-%m-%d')
+              + '_' + nombres[distintos.get_level_values(1)])
+    return np.asarray(textos, dtype=object)[codigos]
+
+
+class ResolutorClaves:
+    """Mapas clave natural → surrogate construidos una vez a partir de las dimensiones"""
+
+    def __init__(self, dim_rutas: pd.DataFrame, dim_productos: pd.DataFrame,
+                 dim_calendario: Optional[pd.DataFrame] = None):
+        self.nombres_rutas, self.ids_por_nombre_ruta = _indice_unico(
+            'dim_rutas', _normalizar(dim_rutas['nombre_ruta']), dim_rutas['rutaid'])
+        self.nombres_productos, self.ids_por_nombre_producto = _indice_unico(
+            'dim_productos', _normalizar(dim_productos['nombre_producto']), dim_productos['productoid'])
+        self.ids_rutas = pd.Index(dim_rutas['rutaid'].astype('int64'))
+        self.ids_productos = pd.Index(dim_productos['productoid'].astype('int64'))
+        # Nombre original de cada ruta, por posición en ids_rutas (para reconstruir fecha_ruta)
+        self.textos_rutas = dim_rutas['nombre_ruta'].astype(str).to_numpy(dtype=object)
+        self.fechas = (pd.DatetimeIndex(pd.to_datetime(dim_calendario['fecha'])).unique()
+                       if dim_calendario is not None else None)
+
+    def _resolver_id(self, df: pd.DataFrame, columna_id: str, texto: Optional[pd.Series],
+                     indice_ids: pd.Index, nombres: pd.Index, ids_por_nombre: np.ndarray) -> np.ndarray:
+        """Posición en la dimensión de cada fila: por id si viene informado, si no por nombre"""
+        posiciones = np.full(len(df), -1, dtype=np.int64)
+        pendientes = np.ones(len(df), dtype=bool)
+        if columna_id in df.columns:
+            ids = pd.to_numeric(df[columna_id], errors='coerce')
+            informados = ids.notna().to_numpy()
+            posiciones[informados] = _buscar(ids[informados].astype('int64'), indice_ids)
+            pendientes = ~informados
+        if texto is not None and pendientes.any():
+            por_nombre = _buscar(texto[pendientes], nombres, normalizar=True)
+            # nombre → id → posición en el índice de ids
+            encontrados = por_nombre >= 0
+            resueltas = np.full(len(por_nombre), -1, dtype=np.int64)
+            resueltas[encontrados] = indice_ids.get_indexer(ids_por_nombre[por_nombre[encontrados]].astype('int64'))
+            posiciones[pendientes] = resueltas
+        return posiciones
+
+    def separar(self, df: pd.DataFrame, tabla: str) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+        """Filas con rutaid (y productoid en ventas) resueltos y filas apartadas con su motivo (o None)"""
+        if df.empty:
+            return df, None
+        texto_ruta = _texto_ruta(df)
+        pos_ruta = self._resolver_id(df, 'rutaid', texto_ruta, self.ids_rutas,
+                                     self.nombres_rutas, self.ids_por_nombre_ruta)
+        condiciones, motivos = [pos_ruta < 0], [SIN_RUTA]
+        columnas = {'rutaid': self.ids_rutas.to_numpy()[np.maximum(pos_ruta, 0)]}
+
+        if tabla == 'ventas':
+            pos_producto = self._resolver_id(df, 'productoid', df.get('producto'), self.ids_productos,
+                                             self.nombres_productos, self.ids_por_nombre_producto)
+            condiciones.append(pos_producto < 0)
+            motivos.append(SIN_PRODUCTO)
+            columnas['productoid'] = self.ids_productos.to_numpy()[np.maximum(pos_producto, 0)]
+
+        if self.fechas is not None:
+            condiciones.insert(0, _buscar(pd.to_datetime(df['fecha']), self.fechas) < 0)
+            motivos.insert(0, SIN_FECHA)
+
+        if 'fecha_ruta' not in df.columns:
+            columnas['fecha_ruta'] = _texto_fecha_ruta(df['fecha'], self.textos_rutas, np.maximum(pos_ruta, 0))
+
+        # Un único motivo por fila: el primero que falla (fecha, ruta, producto)
+        motivo = np.select(condiciones, motivos, default='')
+        validas = motivo == ''
+        apartadas = None if validas.all() else df.loc[~validas].assign(motivo=motivo[~validas])
+
+        resueltas = df.loc[validas].assign(**{c: v[validas] for c, v in columnas.items()})
+        return aplicar_esquema(resueltas, tabla), apartadas  # Claves enteras con los tipos compactos del esquema
+
+
+def registrar_cuarentena(cuarentena: Dict[str, List[pd.DataFrame]]) -> int:
+    """Loguea en bloque las claves no resueltas: motivo y valores más frecuentes (las filas se guardan
+    con las del validador en analytics.quarantine_<tabla>)"""
+    total = 0
+    for tabla, bloques in cuarentena.items():
+        if not bloques:
+            continue
+        apartadas = pd.concat(bloques, ignore_index=True)
+        total += len(apartadas)
+        logger.warning(f"  ⚠️ {tabla}: {len(apartadas)} filas en cuarentena por claves no resueltas")
+        for motivo, grupo in apartadas.groupby('motivo', sort=False):
+            candidatas = {SIN_FECHA: ['fecha'], SIN_RUTA: ['ruta', 'fecha_ruta', 'rutaid'],
+                          SIN_PRODUCTO: ['producto', 'productoid']}[motivo]
+            columna = next(c for c in candidatas + ['motivo'] if c in grupo)
+            ejemplos = grupo[columna].astype(str).value_counts().head(5)
+            detalle = ', '.join(f"{valor} ({n})" for valor, n in ejemplos.items())
+            logger.warning(f"     - {motivo}: {len(grupo)} filas · {detalle}")
+    return total
@@ -0,0 +1,139 @@
+"""
+=====================================================
+STAGING LOCAL EN PARQUET (EXTRACT → TRANSFORM)
+=====================================================
+Caché en disco de las tablas raw extraídas. Cada
+snapshot se guarda como Parquet y se indexa por la
+query y una huella barata calculada en el servidor
+(COUNT(*) + MAX(xmin)): si la tabla no ha cambiado
+desde la última extracción se lee del disco local en
+lugar de volver a descargarla.
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # El ETL funciona igual, solo sin caché
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = Path(__file__).parent.parent / 'data' / 'staging'
+STAGING_MAX_BYTES = 2 * 1024 ** 3  # Al superarlo se borran los snapshots menos usados
+
+
+class StagingCache:
+    """Snapshots Parquet de tablas raw indexados por query + huella del servidor"""
+
+    def __init__(self, directorio: Path = STAGING_DIR, max_bytes: int = STAGING_MAX_BYTES):
+        self.directorio = Path(directorio)
+        self.max_bytes = max_bytes
+        self.disponible = pq is not None
+        self._lock = threading.Lock()  # La extracción en paralelo guarda desde varios hilos
+        if not self.disponible:
+            logger.warning("⚠️ pyarrow no está instalado: caché de staging desactivada")
+        else:
+            self.directorio.mkdir(parents=True, exist_ok=True)
+
+    def huella(self, conn, tabla: str, where: str = '', params: tuple = ()) -> str:
+        """Huella del contenido: nº de filas y xmin máximo (cambia con cada INSERT/UPDATE)"""
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT COUNT(*), MAX(xmin::text::bigint) FROM {tabla}{where}",
+            params or None
+        )
+        filas, max_xmin = cursor.fetchone()
+        conn.rollback()  # No dejar la conexión en transacción abierta
+        return f"{filas}:{max_xmin}"
+
+    def ruta(self, nombre: str, query: str, params: tuple, huella: str) -> Path:
+        """Fichero del snapshot para esta query y huella"""
+        clave = hashlib.sha256(f"{query}|{params!r}|{huella}".encode('utf-8')).hexdigest()[:16]
+        return self.directorio / f"{nombre}-{clave}.parquet"
+
+    def existe(self, ruta: Path) -> bool:
+        return self.disponible and ruta.exists()
+
+    def leer(self, ruta: Path) -> pd.DataFrame:
+        """Lee un snapshot completo"""
+        ruta.touch()  # Marca de uso para la expulsión por antigüedad
+        return pq.read_table(ruta).to_pandas()
+
+    def leer_bloques(self, ruta: Path, batch_size: int) -> Iterator[pd.DataFrame]:
+        """Lee un snapshot por bloques de batch_size filas"""
+        ruta.touch()
+        archivo = pq.ParquetFile(ruta)
+        for batch in archivo.iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+
+    def guardar(self, ruta: Path, df: pd.DataFrame):
+        """Guarda un snapshot completo (escritura atómica vía fichero temporal)"""
+        temporal = ruta.with_suffix('.tmp')
+        try:
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temporal)
+            temporal.replace(ruta)
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"  ⚠️ No se pudo guardar {ruta.name} en staging: {e}")
+            temporal.unlink(missing_ok=True)
+            return
+        self.expulsar()
+
+    def guardar_bloques(self, ruta: Path, bloques: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """Reenvía los bloques tal cual mientras los escribe en el snapshot.
+
+        El snapshot solo se publica si el stream se consume entero; si el
+        consumidor falla a mitad, el fichero temporal se descarta.
+        """
+        temporal = ruta.with_suffix('.tmp')
+        writer: Optional['pq.ParquetWriter'] = None
+        escribiendo = True
+        completo = False
+        try:
+            for bloque in bloques:
+                if escribiendo:
+                    try:
+                        if writer is None:
+                            tabla = pa.Table.from_pandas(bloque, preserve_index=False)
+                            writer = pq.ParquetWriter(temporal, tabla.schema)
+                        else:
+                            tabla = pa.Table.from_pandas(bloque, schema=writer.schema, preserve_index=False)
+                        writer.write_table(tabla)
+                    except (pa.ArrowException, OSError) as e:
+                        # Ej: tipos distintos entre bloques; se sigue sin caché
+                        logger.warning(f"  ⚠️ Staging de {ruta.name} abandonado: {e}")
+                        escribiendo = False
+                yield bloque
+            completo = True
+        finally:
+            if writer is not None:
+                writer.close()
+            if completo and escribiendo and writer is not None:
+                temporal.replace(ruta)
+                self.expulsar()
+            else:
+                temporal.unlink(missing_ok=True)
+
+    def expulsar(self):
+        """Borra los snapshots usados hace más tiempo hasta quedar bajo max_bytes"""
+        with self._lock:
+            snapshots = [(p, p.stat()) for p in self.directorio.glob('*.parquet')]
+            snapshots.sort(key=lambda item: item[1].st_mtime)
+            total = sum(stat.st_size for _, stat in snapshots)
+            while snapshots and total > self.max_bytes:
+                antiguo, stat = snapshots.pop(0)
+                total -= stat.st_size
+                antiguo.unlink(missing_ok=True)
+                logger.info(f"  🗑️  Snapshot expulsado de staging: {antiguo.name}")
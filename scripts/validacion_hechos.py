@@ -0,0 +1,284 @@
+"""
+=====================================================
+VALIDACIÓN DE LOS HECHOS ANTES DE CARGAR
+=====================================================
+Etapa entre transform y load de los hechos:
+
+- Lee del catálogo de PostgreSQL las restricciones de
+  cada tabla de analytics (NOT NULL, CHECK, FOREIGN
+  KEY, UNIQUE y los límites de los tipos: NUMERIC(p,s),
+  VARCHAR(n), INTEGER): las reglas no se desincronizan
+  del DDL de 01_create_analytics_schema.sql
+- Las comprueba en bloque con máscaras vectorizadas:
+  claves foráneas contra las dimensiones ya
+  transformadas y grano único dentro del lote (y entre
+  los bloques de una carga en streaming)
+- Las filas que las incumplen se apartan con su motivo
+  (analytics.quarantine_<tabla>) en lugar de abortar
+  el COPY / UPSERT al final de la carga
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import io
+import logging
+import operator
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Prefijos de los motivos de cuarentena (seguidos de la columna o de la restricción)
+NULO = 'nulo'                 # nulo:<columna>
+DESBORDE = 'desborde'         # desborde:<columna> (no cabe en el tipo de la columna)
+CHECK = 'check'               # check:<restricción>
+CLAVE_FORANEA = 'fk'          # fk:<columna>
+GRANO_DUPLICADO = 'duplicado' # duplicado:<restricción>
+
+RANGOS_ENTEROS = {
+    'smallint': (-2 ** 15, 2 ** 15 - 1),
+    'integer': (-2 ** 31, 2 ** 31 - 1),
+}
+OPERADORES = {'>=': operator.ge, '>': operator.gt, '<=': operator.le, '<': operator.lt,
+              '=': operator.eq, '<>': operator.ne}
+# CHECK ((cantidad >= 0)) / CHECK ((precio_unitario >= (0)::numeric))
+PATRON_CHECK = re.compile(r"^CHECK \(\((\w+) (>=|>|<=|<|=|<>) \(?(-?\d+(?:\.\d+)?)\)?(?:::[\w ]+)?\)\)$")
+
+TABLAS_CUARENTENA = ['fact_ventas', 'fact_incidencias']
+
+
+def _leer_reglas(cursor, tabla: str) -> dict:
+    """Columnas y restricciones de analytics.<tabla> según el catálogo"""
+    cursor.execute("""
+        SELECT column_name, is_nullable = 'YES', data_type, numeric_precision, numeric_scale,
+               character_maximum_length, coalesce(column_default LIKE 'nextval(%%', false)
+        FROM information_schema.columns
+        WHERE table_schema = 'analytics' AND table_name = %s
+    """, (tabla,))
+    columnas, generadas = {}, set()
+    for nombre, nula, tipo, precision, escala, longitud, serial in cursor.fetchall():
+        if serial:
+            generadas.add(nombre)  # venta_id / incidencia_id: las genera la BD, no se cargan
+            continue
+        columnas[nombre] = {'nula': nula, 'tipo': tipo, 'precision': precision, 'escala': escala,
+                            'longitud': longitud}
+    cursor.execute("""
+        SELECT con.conname, con.contype, pg_get_constraintdef(con.oid),
+               ARRAY(SELECT a.attname FROM unnest(con.conkey) WITH ORDINALITY k(n, i)
+                     JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.n ORDER BY k.i)::text[],
+               c.relname,
+               ARRAY(SELECT a.attname FROM unnest(con.confkey) WITH ORDINALITY k(n, i)
+                     JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.n ORDER BY k.i)::text[]
+        FROM pg_constraint con
+        LEFT JOIN pg_class c ON c.oid = con.confrelid
+        WHERE con.conrelid = %s::regclass AND con.contype IN ('c', 'f', 'u', 'p')
+        ORDER BY con.conname
+    """, (f"analytics.{tabla}",))
+    checks, no_vectorizables, foraneas, unicas = [], [], [], []
+    for nombre, tipo, definicion, claves, referenciada, claves_ref in cursor.fetchall():
+        if tipo == 'c':
+            coincidencia = PATRON_CHECK.match(definicion)
+            if coincidencia:
+                columna, op, valor = coincidencia.groups()
+                checks.append((nombre, columna, op, float(valor)))
+            else:
+                no_vectorizables.append(nombre)
+        elif tipo == 'f' and len(claves) == 1:
+            foraneas.append((claves[0], referenciada, claves_ref[0]))
+        elif tipo in ('u', 'p') and not generadas & set(claves):
+            unicas.append((nombre, claves))
+    if no_vectorizables:
+        logger.warning(f"  ⚠️ {tabla}: restricciones CHECK sin validación previa: {', '.join(no_vectorizables)}")
+    return {'columnas': columnas, 'checks': checks, 'foraneas': foraneas, 'unicas': unicas}
+
+
+def _desborde(serie: pd.Series, columna: dict) -> Optional[np.ndarray]:
+    """Valores que no caben en el tipo de la columna (el COPY fallaría con 'out of range' / 'overflow')"""
+    tipo = columna['tipo']
+    if tipo == 'numeric' and columna['precision'] is not None:
+        valores = pd.to_numeric(serie, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        limite = 10.0 ** (columna['precision'] - (columna['escala'] or 0))
+        return np.abs(np.round(valores, columna['escala'] or 0)) >= limite
+    if tipo in RANGOS_ENTEROS and pd.api.types.is_numeric_dtype(serie):
+        minimo, maximo = RANGOS_ENTEROS[tipo]
+        valores = serie.to_numpy(dtype='float64', na_value=np.nan)
+        return (valores < minimo) | (valores > maximo)
+    if tipo == 'character varying' and columna['longitud'] is not None:
+        # Longitud calculada una vez por valor distinto
+        codigos, distintos = pd.factorize(serie)
+        largos = pd.Index(distintos).astype(str).str.len().to_numpy() > columna['longitud']
+        return np.where(codigos >= 0, largos[codigos] if len(largos) else False, False)
+    return None
+
+
+def _vistas(corridas: List[np.ndarray], ordenadas: np.ndarray) -> np.ndarray:
+    """Huellas (ya ordenadas) presentes en alguna corrida: con las agujas en orden, la búsqueda
+    binaria recorre cada corrida hacia delante y apenas falla en caché"""
+    presentes = np.zeros(len(ordenadas), dtype=bool)
+    for corrida in corridas:
+        posicion = np.minimum(np.searchsorted(corrida, ordenadas), len(corrida) - 1)
+        presentes |= corrida[posicion] == ordenadas
+    return presentes
+
+
+def _anadir_corrida(corridas: List[np.ndarray], nuevas: np.ndarray):
+    """Añade `nuevas` (ordenadas) como corrida y fusiona mientras la anterior no sea mayor: los tamaños
+    decrecen geométricamente (O(log n) corridas) y cada huella se copia O(log n) veces en total"""
+    if len(nuevas) == 0:
+        return
+    corridas.append(nuevas)
+    while len(corridas) > 1 and len(corridas[-2]) <= len(corridas[-1]):
+        fusion = np.concatenate([corridas[-2], corridas.pop()])
+        fusion.sort(kind='stable')  # Dos tramos ya ordenados: timsort los fusiona en tiempo lineal
+        corridas[-1] = fusion
+
+
+class ValidadorHechos:
+    """Restricciones del DDL de analytics comprobadas en bloque antes de cargar los hechos"""
+
+    def __init__(self, reglas: Dict[str, dict], dimensiones: Dict[Tuple[str, str], pd.Index]):
+        self.reglas = reglas
+        # (tabla referenciada, columna) → valores válidos de la clave foránea
+        self.dimensiones = dimensiones
+
+    @classmethod
+    def desde_catalogo(cls, conn, tablas: Iterable[str],
+                       dimensiones: Dict[str, pd.DataFrame]) -> 'ValidadorHechos':
+        """Lee las reglas de `tablas`; las FK se comprueban contra los DataFrames de `dimensiones`"""
+        cursor = conn.cursor()
+        reglas = {tabla: _leer_reglas(cursor, tabla) for tabla in tablas}
+        valores = {}
+        for regla in reglas.values():
+            for _, referenciada, columna_ref in regla['foraneas']:
+                dimension = dimensiones.get(referenciada)
+                if dimension is not None and columna_ref in dimension:
+                    valores[(referenciada, columna_ref)] = pd.Index(dimension[columna_ref].unique())
+        return cls(reglas, valores)
+
+    def validar(self, df: pd.DataFrame, tabla: str,
+                vistos: Optional[Dict[str, List[np.ndarray]]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Separa las filas válidas de las que incumplen alguna restricción (con su motivo).
+        `vistos` acumula el grano ya cargado por los bloques anteriores de la misma carga
+        (por restricción única, corridas ordenadas de huellas uint64)"""
+        if df.empty:
+            return df, df.assign(motivo=pd.Series(dtype=object))
+        regla = self.reglas[tabla]
+        condiciones, motivos = [], []
+
+        def anadir(mascara, motivo):
+            if mascara is not None:
+                condiciones.append(np.asarray(mascara, dtype=bool))
+                motivos.append(motivo)
+
+        for columna, definicion in regla['columnas'].items():
+            if columna in df.columns and not definicion['nula']:
+                anadir(df[columna].isna().to_numpy(), f"{NULO}:{columna}")
+        for columna, definicion in regla['columnas'].items():
+            if columna in df.columns:
+                anadir(_desborde(df[columna], definicion), f"{DESBORDE}:{columna}")
+        for nombre, columna, op, valor in regla['checks']:
+            if columna in df.columns:
+                valores = pd.to_numeric(df[columna], errors='coerce')
+                # Un NULL cumple el CHECK (lo rechaza, en su caso, el NOT NULL)
+                anadir((valores.notna() & ~OPERADORES[op](valores, valor)).to_numpy(), f"{CHECK}:{nombre}")
+        for columna, referenciada, columna_ref in regla['foraneas']:
+            validos = self.dimensiones.get((referenciada, columna_ref))
+            if columna in df.columns and validos is not None:
+                serie = df[columna]
+                anadir((serie.notna() & ~serie.isin(validos)).to_numpy(), f"{CLAVE_FORANEA}:{columna}")
+
+        # Un único motivo por fila: el primero que falla (nulo, desborde, check, fk)
+        motivo = (np.select(condiciones, motivos, default='') if condiciones else np.full(len(df), '')).astype(object)
+
+        # Grano: entre las filas por lo demás válidas, la primera aparición de cada clave se carga
+        for nombre, claves in regla['unicas']:
+            if not set(claves) <= set(df.columns):
+                continue  # Claves generadas por la BD (venta_id / incidencia_id)
+            candidatas = motivo == ''
+            huellas = pd.util.hash_pandas_object(df.loc[candidatas, claves], index=False).to_numpy()
+            if vistos is None:
+                repetidas = pd.Series(huellas).duplicated().to_numpy()
+            else:
+                # Huellas del bloque ordenadas una vez (estable: la primera aparición va delante):
+                # el duplicado interno es la igual a la anterior y lo nuevo ya es una corrida ordenada
+                orden = np.argsort(huellas, kind='stable')
+                ordenadas = huellas[orden]
+                repetidas_orden = np.zeros(len(ordenadas), dtype=bool)
+                repetidas_orden[1:] = ordenadas[1:] == ordenadas[:-1]
+                corridas = vistos.setdefault(nombre, [])
+                repetidas_orden |= _vistas(corridas, ordenadas)
+                _anadir_corrida(corridas, ordenadas[~repetidas_orden])
+                repetidas = np.empty_like(repetidas_orden)
+                repetidas[orden] = repetidas_orden
+            posiciones = np.flatnonzero(candidatas)[repetidas]
+            motivo[posiciones] = f"{GRANO_DUPLICADO}:{nombre}"
+
+        validas = motivo == ''
+        if validas.all():
+            return df, df.iloc[0:0].assign(motivo=pd.Series(dtype=object))
+        return df.loc[validas], df.loc[~validas].assign(motivo=motivo[~validas])
+
+    def validar_bloques(self, bloques: Iterable[pd.DataFrame], tabla: str,
+                        apartadas: List[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """Valida una carga en streaming bloque a bloque; las filas apartadas se añaden a `apartadas`"""
+        vistos: Dict[str, List[np.ndarray]] = {}
+        for bloque in bloques:
+            validas, rechazadas = self.validar(bloque, tabla, vistos)
+            if len(rechazadas):
+                apartadas.append(rechazadas)
+            if len(validas):
+                yield validas
+
+
+# =====================================================
+# TABLAS DE CUARENTENA (analytics.quarantine_<tabla>)
+# =====================================================
+
+def ensure_cuarentena(conn):
+    """Crea las tablas de cuarentena si no existen (la fila original va en JSONB con su motivo)"""
+    cursor = conn.cursor()
+    for tabla in TABLAS_CUARENTENA:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS analytics.quarantine_{tabla} (
+                cuarentena_id BIGSERIAL PRIMARY KEY,
+                run_id VARCHAR(50) NOT NULL,
+                motivo VARCHAR(150) NOT NULL,
+                fila JSONB NOT NULL,
+                registrado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_quarantine_{tabla}_run "
+                       f"ON analytics.quarantine_{tabla}(run_id)")
+    conn.commit()
+
+
+def guardar_cuarentena(conn, run_id: str, apartadas: Dict[str, List[pd.DataFrame]]) -> int:
+    """Inserta las filas apartadas en analytics.quarantine_<tabla> (sustituye las de este run_id,
+    así reanudar una ejecución no las duplica). Devuelve el total de filas"""
+    cursor = conn.cursor()
+    total = 0
+    for tabla, bloques in apartadas.items():
+        bloques = [b for b in bloques if len(b)]
+        cursor.execute(f"DELETE FROM analytics.quarantine_{tabla} WHERE run_id = %s", (run_id,))
+        if not bloques:
+            continue
+        filas = pd.concat(bloques, ignore_index=True)
+        conteo = filas['motivo'].value_counts()
+        logger.warning(f"  ⚠️ {tabla}: {len(filas)} filas en cuarentena "
+                       f"({', '.join(f'{m}: {n}' for m, n in conteo.items())})")
+        # Una fila JSON por registro (fechas ISO, NaN → null)
+        json_filas = filas.drop(columns='motivo').to_json(orient='records', lines=True, date_format='iso')
+        salida = pd.DataFrame({'run_id': run_id, 'motivo': filas['motivo'].to_numpy(),
+                               'fila': json_filas.splitlines()})
+        buffer = io.StringIO(salida.to_csv(index=False, header=False))
+        cursor.copy_expert(f"COPY analytics.quarantine_{tabla} (run_id, motivo, fila) FROM STDIN WITH (FORMAT csv)",
+                           buffer)
+        logger.warning(f"     💾 Filas apartadas en analytics.quarantine_{tabla} (run_id = '{run_id}')")
+        total += len(filas)
+    conn.commit()
+    return total
@@ -0,0 +1,8 @@
+"""Los módulos del ETL y del análisis se importan como en sus scripts (sin paquete)"""
+
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+for carpeta in ('scripts', 'analysis'):
+    sys.path.insert(0, str(BASE_DIR / carpeta))
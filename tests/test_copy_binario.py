@@ -0,0 +1,117 @@
+"""
+=====================================================
+TESTS: COPY FROM STDIN EN FORMATO BINARIO (PGCOPY)
+=====================================================
+- _numeric_binario contra los bytes de numeric_send()
+  de PostgreSQL 16
+- Tuplas de _serializar_binario y lectura por trozos
+  de CopyStream
+- Tipos de columna sin codificador: error explícito
+
+Ejecutar: python -m pytest -q tests
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import struct
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+import etl_pipeline as etl
+
+
+# =====================================================
+# NUMERIC (dígitos en base 10000)
+# =====================================================
+
+# SELECT numeric_send('<valor>'::numeric)
+NUMERIC_SEND = {
+    '0': '0000000000000000',
+    '123.45': '0002000000000002007b1194',
+    '-0.001': '0001ffff40000003000a',
+    '10000': '00010001000000000001',
+    '0.0010': '0001ffff00000004000a',
+    '12345678.9': '000300010000000104d2162e2328',
+    '-99999.99': '00030001400000020009270f26ac',
+    'NaN': '00000000c0000000',
+}
+
+
+@pytest.mark.parametrize('valor, esperado', NUMERIC_SEND.items())
+def test_numeric_como_postgresql(valor, esperado):
+    assert etl._numeric_binario(Decimal(valor)).hex() == esperado
+
+
+@pytest.mark.parametrize('valor, signo', [(Decimal('Infinity'), 0xD000), (Decimal('-Infinity'), 0xF000),
+                                          (float('inf'), 0xD000), (float('-inf'), 0xF000)])
+def test_numeric_infinitos(valor, signo):
+    # Sin dígitos; PostgreSQL 14+ solo mira el signo (no se codifican como NaN)
+    assert struct.unpack('>hhH', etl._numeric_binario(valor)[:6]) == (0, 0, signo)
+
+
+def test_numeric_desde_float_y_entero():
+    assert etl._numeric_binario(4.1) == etl._numeric_binario(Decimal('4.1'))
+    assert etl._numeric_binario(3) == etl._numeric_binario(Decimal('3'))
+
+
+# =====================================================
+# TUPLAS Y STREAM
+# =====================================================
+
+def test_serializar_binario_tuplas_y_nulos():
+    bloque = pd.DataFrame({'id': [7, 8], 'nombre': ['añil', None]})
+    codificadores = [etl.CODIFICADORES_BINARIOS['integer'], etl.CODIFICADORES_BINARIOS['text']]
+    esperado = (struct.pack('>h', 2) + struct.pack('>i', 4) + struct.pack('>i', 7)
+                + struct.pack('>i', 5) + 'añil'.encode('utf-8')
+                + struct.pack('>h', 2) + struct.pack('>i', 4) + struct.pack('>i', 8)
+                + struct.pack('>i', -1))
+    assert etl._serializar_binario(bloque, codificadores) == esperado
+
+
+def test_fecha_y_timestamp_desde_la_epoca_de_postgresql():
+    assert etl.CODIFICADORES_BINARIOS['date'](pd.Timestamp('2000-01-02')) == struct.pack('>i', 1)
+    assert (etl.CODIFICADORES_BINARIOS['timestamp without time zone'](pd.Timestamp('1999-12-31 23:59:59'))
+            == struct.pack('>q', -1_000_000))
+
+
+def test_copystream_lee_por_trozos_entre_bloques():
+    stream = etl.CopyStream(iter([etl.PGCOPY_HEADER, b'', b'abcde', b'fg', etl.PGCOPY_TRAILER]))
+    leido = [stream.read(4) for _ in range(8)]  # 19 + 7 + 2 bytes: 7 lecturas llenas
+    assert b''.join(leido) == etl.PGCOPY_HEADER + b'abcdefg' + etl.PGCOPY_TRAILER
+    assert all(len(trozo) == 4 for trozo in leido[:7]) and leido[-1] == b''
+    assert stream.bytes_enviados == len(etl.PGCOPY_HEADER) + 7 + 2
+
+
+def test_copystream_lectura_completa():
+    stream = etl.CopyStream(iter([b'ab', b'cd']))
+    assert stream.read() == b'abcd'
+    assert stream.read() == b''
+
+
+# =====================================================
+# TIPOS SIN CODIFICADOR
+# =====================================================
+
+class _CursorCatalogo:
+    """Solo responde a la consulta de tipos de _tipos_columnas"""
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return [('id', 'integer'), ('datos', 'jsonb'), ('creado', 'timestamp with time zone')]
+
+
+class _ConexionCatalogo:
+    def cursor(self):
+        return _CursorCatalogo()
+
+
+def test_copy_binario_tipo_sin_codificador():
+    df = pd.DataFrame({'id': [1], 'datos': ['{}'], 'creado': [pd.Timestamp('2024-01-01', tz='UTC')]})
+    with pytest.raises(ValueError, match=r"datos \(jsonb\), creado \(timestamp with time zone\)"):
+        etl.copy_dataframe(_ConexionCatalogo(), 'tabla', df, formato='binary')
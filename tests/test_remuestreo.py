@@ -0,0 +1,44 @@
+"""
+=====================================================
+TESTS: REMUESTREO (BOOTSTRAP Y PERMUTACIONES)
+=====================================================
+- Posiciones distintas sin repetir y uniformes
+- Reproducibilidad con la misma semilla
+
+Ejecutar: python -m pytest -q tests
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import remuestreo
+
+
+def test_posiciones_distintas_sin_repetir_y_uniformes():
+    rng = np.random.default_rng(0)
+    posiciones = remuestreo.posiciones_distintas(rng, 6, 2, 30_000)
+    assert posiciones.shape == (2, 30_000)
+    assert (posiciones[0] != posiciones[1]).all()
+    # Las 15 parejas no ordenadas salen con la misma frecuencia (≈ 2000 cada una)
+    parejas = np.sort(posiciones, axis=0)
+    _, frecuencias = np.unique(parejas[0] * 6 + parejas[1], return_counts=True)
+    assert len(frecuencias) == 15
+    assert stats.chisquare(frecuencias).pvalue > 0.001
+
+
+def test_analizar_remuestreo_reproducible():
+    rng = np.random.default_rng(1)
+    num_incidencias = rng.poisson(0.4, 200)
+    df_diario = pd.DataFrame({
+        'Ingresos': rng.normal(1000, 100, 200) - 40 * num_incidencias,
+        'NumIncidencias': num_incidencias,
+        'TieneIncidencia': (num_incidencias > 0).astype(int),
+    })
+    primero = remuestreo.analizar_remuestreo(df_diario, n_remuestreos=500, semilla=5)
+    segundo = remuestreo.analizar_remuestreo(df_diario, n_remuestreos=500, semilla=5)
+    assert pd.Series(primero).to_json() == pd.Series(segundo).to_json()
@@ -0,0 +1,69 @@
+"""
+=====================================================
+TESTS: RESOLUCIÓN DE CLAVES SUSTITUTAS
+=====================================================
+- ResolutorClaves: claves por id o por nombre y
+  motivo de cada fila apartada por claves no
+  resueltas
+
+Ejecutar: python -m pytest -q tests
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import pandas as pd
+import pytest
+
+from resolucion_claves import SIN_FECHA, SIN_PRODUCTO, SIN_RUTA, ResolutorClaves
+
+
+@pytest.fixture
+def resolutor():
+    return ResolutorClaves(
+        pd.DataFrame({'rutaid': [1, 2], 'nombre_ruta': ['MAD-BCN', 'BCN-VAL']}),
+        pd.DataFrame({'productoid': [6, 7], 'nombre_producto': ['Café', 'Agua']}),
+        pd.DataFrame({'fecha': pd.date_range('2024-01-01', periods=3)}),
+    )
+
+
+def test_resolutor_aparta_ventas_con_su_motivo(resolutor):
+    ventas = pd.DataFrame({
+        'ticketid': [1, 2, 3, 4, 5],
+        'fecha': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-02', '2025-06-01']),
+        'rutaid': [1, None, 9, 2, 9],
+        'productoid': [6, 7, 6, 99, 6],
+        'fecha_ruta': ['2024-01-01_MAD-BCN', '2024-01-02_ bcn-val ', '2024-01-03_XXX',
+                       '2024-01-02_BCN-VAL', '2025-06-01_XXX'],
+        'cantidad': [1, 2, 3, 4, 5],
+    })
+    resueltas, apartadas = resolutor.separar(ventas, 'ventas')
+
+    # Por id o por nombre (sin espacios ni mayúsculas) desde fecha_ruta
+    assert resueltas['ticketid'].tolist() == [1, 2]
+    assert resueltas['rutaid'].tolist() == [1, 2]
+    assert resueltas['productoid'].tolist() == [6, 7]
+    # Un único motivo por fila: el primero que falla (fecha, ruta, producto)
+    assert dict(zip(apartadas['ticketid'], apartadas['motivo'])) == {3: SIN_RUTA, 4: SIN_PRODUCTO, 5: SIN_FECHA}
+
+
+def test_resolutor_incidencias_por_nombre(resolutor):
+    incidencias = pd.DataFrame({
+        'incidenciaid': [10, 11],
+        'fecha': pd.to_datetime(['2024-01-02', '2024-01-02']),
+        'ruta': ['MAD-BCN', 'ZZZ'],
+    })
+    resueltas, apartadas = resolutor.separar(incidencias, 'incidencias')
+
+    assert resueltas['rutaid'].tolist() == [1]
+    assert resueltas['fecha_ruta'].tolist() == ['2024-01-02_MAD-BCN']
+    assert apartadas['incidenciaid'].tolist() == [11]
+    assert apartadas['motivo'].tolist() == [SIN_RUTA]
+
+
+def test_resolutor_sin_filas_apartadas(resolutor):
+    incidencias = pd.DataFrame({'incidenciaid': [10], 'fecha': pd.to_datetime(['2024-01-01']), 'ruta': ['bcn-val']})
+    resueltas, apartadas = resolutor.separar(incidencias, 'incidencias')
+    assert resueltas['rutaid'].tolist() == [2]
+    assert apartadas is None
@@ -0,0 +1,86 @@
+"""
+=====================================================
+TESTS: CONTRASTES AGRUPADOS
+=====================================================
+- tests_agrupados (Welch, Mann-Whitney U, ANOVA,
+  Kruskal-Wallis y Benjamini-Hochberg vectorizados)
+  contra las funciones de scipy nivel a nivel
+
+Ejecutar: python -m pytest -q tests
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+import tests_agrupados as agrupados  # Sin importar la función: pytest la tomaría por un test
+
+
+# =====================================================
+# CONTRASTES AGRUPADOS FRENTE A SCIPY
+# =====================================================
+
+@pytest.fixture(scope='module')
+def unidades():
+    """Dos dimensiones con niveles de tamaños distintos, empates y un nivel no calculable"""
+    rng = np.random.default_rng(7)
+    bloques = []
+    for dimension, niveles in [('Ruta', {'A': 60, 'B': 45, 'C': 30}), ('Producto', {'X': 50, 'Y': 40, 'Z': 3})]:
+        for nivel, n in niveles.items():
+            con = rng.random(n) < 0.4
+            if nivel == 'Z':
+                con = np.array([True, False, False])  # Una sola unidad CON: sin varianza
+            desplazamiento = 3 * con if nivel in ('A', 'X') else 0
+            valor = np.round(rng.normal(20, 4, n) + desplazamiento)  # Enteros: hay empates
+            bloques.append(pd.DataFrame({'dimension': dimension, 'nivel': nivel, 'valor': valor, 'con': con}))
+    return pd.concat(bloques, ignore_index=True)
+
+
+def _grupos(unidades, dimension, nivel):
+    sub = unidades[(unidades['dimension'] == dimension) & (unidades['nivel'] == nivel)]
+    return sub.loc[sub['con'], 'valor'].to_numpy(), sub.loc[~sub['con'], 'valor'].to_numpy()
+
+
+def test_pares_welch_y_mann_whitney_como_scipy(unidades):
+    _, pares = agrupados.tests_agrupados(unidades)
+    for fila in pares.itertuples():
+        con, sin = _grupos(unidades, fila.dimension, fila.nivel)
+        assert (fila.n_con, fila.n_sin) == (len(con), len(sin))
+        if min(len(con), len(sin)) < 2:
+            assert np.isnan(fila.p_welch) and np.isnan(fila.p_mwu)
+            continue
+        welch = stats.ttest_ind(con, sin, equal_var=False)
+        assert fila.t_welch == pytest.approx(welch.statistic, rel=1e-9)
+        assert fila.p_welch == pytest.approx(welch.pvalue, rel=1e-7)
+        mwu = stats.mannwhitneyu(con, sin, alternative='two-sided', method='asymptotic', use_continuity=True)
+        assert fila.u == pytest.approx(mwu.statistic)
+        assert fila.p_mwu == pytest.approx(mwu.pvalue, rel=1e-7)
+
+
+def test_omnibus_anova_y_kruskal_como_scipy(unidades):
+    omnibus, _ = agrupados.tests_agrupados(unidades)
+    for fila in omnibus.itertuples():
+        niveles = unidades.loc[unidades['dimension'] == fila.dimension, 'nivel'].unique()
+        grupos = [c for c in (_grupos(unidades, fila.dimension, n)[0] for n in niveles) if len(c)]
+        anova = stats.f_oneway(*grupos)
+        kruskal = stats.kruskal(*grupos)
+        assert fila.niveles == len(grupos)
+        assert fila.f_anova == pytest.approx(anova.statistic, rel=1e-9)
+        assert fila.p_anova == pytest.approx(anova.pvalue, rel=1e-7)
+        assert fila.h_kruskal == pytest.approx(kruskal.statistic, rel=1e-9)
+        assert fila.p_kruskal == pytest.approx(kruskal.pvalue, rel=1e-7)
+
+
+def test_fdr_bh_como_scipy_y_conserva_nan():
+    rng = np.random.default_rng(3)
+    pvalores = rng.random(40) ** 3
+    pvalores[[4, 17]] = np.nan
+    qvalores = agrupados.fdr_bh(pvalores)
+    validos = ~np.isnan(pvalores)
+    assert np.isnan(qvalores[~validos]).all()
+    np.testing.assert_allclose(qvalores[validos], stats.false_discovery_control(pvalores[validos], method='bh'))
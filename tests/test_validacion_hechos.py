@@ -0,0 +1,81 @@
+"""
+=====================================================
+TESTS: VALIDACIÓN DE HECHOS ANTES DE LA CARGA
+=====================================================
+- ValidadorHechos: motivo de cada fila que incumple
+  las reglas del DDL, también entre bloques
+
+Ejecutar: python -m pytest -q tests
+
+Autor: Sistema ETL Automatizado
+Fecha: 2026-10-18
+=====================================================
+"""
+
+import pandas as pd
+import pytest
+
+from validacion_hechos import ValidadorHechos
+
+
+def _columna(tipo, nula=True, precision=None, escala=None, longitud=None):
+    return {'nula': nula, 'tipo': tipo, 'precision': precision, 'escala': escala, 'longitud': longitud}
+
+
+@pytest.fixture
+def validador():
+    """Reglas con la forma que lee _leer_reglas del catálogo"""
+    reglas = {'fact_ventas': {
+        'columnas': {
+            'cantidad': _columna('integer', nula=False),
+            'porcentaje_objetivo': _columna('numeric', precision=5, escala=2),
+            'fecha_ruta': _columna('character varying', longitud=12),
+        },
+        'checks': [('fact_ventas_cantidad_check', 'cantidad', '>=', 0.0)],
+        'foraneas': [('rutaid', 'dim_rutas', 'rutaid')],
+        'unicas': [('grano', ['ticketid', 'fecha'])],
+    }}
+    return ValidadorHechos(reglas, {('dim_rutas', 'rutaid'): pd.Index([1, 2])})
+
+
+def _ventas(ticketids, **columnas):
+    n = len(ticketids)
+    base = {'ticketid': ticketids, 'fecha': pd.Timestamp('2024-01-01'), 'rutaid': [1] * n,
+            'cantidad': [1.0] * n, 'porcentaje_objetivo': [50.0] * n, 'fecha_ruta': ['2024-01-01_A'] * n}
+    base.update(columnas)
+    return pd.DataFrame(base)
+
+
+def test_validador_aparta_cada_restriccion(validador):
+    df = _ventas([1, 2, 3, 4, 5, 6, 7, 1],
+                 cantidad=[1, None, -1, 1, 1, 1, -1, 1],
+                 porcentaje_objetivo=[50, 50, 50, 1234.5, 50, 50, 50, 50],
+                 rutaid=[1, 1, 1, 1, 9, 1, 9, 2],
+                 fecha_ruta=['2024-01-01_A'] * 5 + ['2024-01-01_LARGA'] + ['2024-01-01_A'] * 2)
+    validas, apartadas = validador.validar(df, 'fact_ventas')
+
+    assert validas.index.tolist() == [0]
+    assert list(zip(apartadas['ticketid'], apartadas['motivo'])) == [
+        (2, 'nulo:cantidad'),
+        (3, 'check:fact_ventas_cantidad_check'),
+        (4, 'desborde:porcentaje_objetivo'),
+        (5, 'fk:rutaid'),
+        (6, 'desborde:fecha_ruta'),
+        (7, 'check:fact_ventas_cantidad_check'),  # Incumple check y fk: cuenta el primero
+        (1, 'duplicado:grano'),                   # Segunda aparición del grano
+    ]
+
+
+def test_validador_grano_entre_bloques(validador):
+    bloques = [
+        _ventas([1, 2, 3], cantidad=[1, 1, -1]),
+        _ventas([2, 3, 4]),  # 2 ya cargado; 3 se apartó antes y ahora es válido
+        _ventas([4, 5]),
+    ]
+    apartadas = []
+    cargadas = pd.concat(validador.validar_bloques(bloques, 'fact_ventas', apartadas))
+
+    assert cargadas['ticketid'].tolist() == [1, 2, 3, 4, 5]
+    motivos = pd.concat(apartadas)
+    assert motivos['ticketid'].tolist() == [3, 2, 4]
+    assert motivos['motivo'].tolist() == ['check:fact_ventas_cantidad_check', 'duplicado:grano', 'duplicado:grano']